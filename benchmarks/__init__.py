@@ -0,0 +1,8 @@
+"""
+Benchmarks for the Virtual Triage System.
+
+These are not tests and are not run by pytest. Run them as modules
+from the top-level directory, e.g. `python -m benchmarks.search`.
+Each benchmark writes its results as JSON so that runs can be compared
+across commits.
+"""
@@ -0,0 +1,62 @@
+"""
+Benchmarks the parallel bulk reprocessing job in vts/bulk.py.
+
+For a synthetic corpus, this runs the full job (rendering, reindexing,
+and related questions) with a growing number of worker processes and
+reports the throughput of each, which should scale with the cores.
+The scaling hasn't been measured on a multi-core machine yet, so check
+the CPU count that is recorded with the results.
+
+Run from the top-level directory with:
+
+    python -m benchmarks.bulk --entries 20000 --workers 1 2 4 8
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+
+from benchmarks.common import create_benchmark_db
+from benchmarks.common import synthetic_faq
+from benchmarks.common import write_results
+
+from vts.bulk import reprocess_faq
+
+def benchmark_workers(db, workers: int) -> dict:
+    "Runs the whole job from scratch with the given number of workers."
+    with tempfile.TemporaryDirectory() as instance_path:
+        report = reprocess_faq(db, instance_path, workers=workers, restart=True)
+    return {'workers': workers,
+            'seconds': report['seconds'],
+            'entries_per_second': report['processed'] / report['seconds']}
+
+def main():
+    "Parses the arguments and runs the benchmark."
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--output', default='', help='JSON file to write')
+    args = parser.parse_args()
+    # The job prints its own progress, so the SQL log is only noise.
+    logging.disable(logging.INFO)
+
+    cpus = os.cpu_count() or 1
+    if max(args.workers) > cpus:
+        print(f"This machine has {cpus} CPU(s), so runs with more workers can't show a speedup.")
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        db = create_benchmark_db(os.path.join(directory, 'bench.db'), synthetic_faq(args.entries))
+        for workers in args.workers:
+            result = benchmark_workers(db, workers)
+            print(f"{workers} workers: {result['seconds']:.1f}s, "
+                  f"{result['entries_per_second']:.0f} entries/s")
+            results.append(result)
+    for result in results:
+        result['speedup'] = results[0]['seconds'] / result['seconds']
+    print(f"Wrote {write_results('bulk', {'entries': args.entries, 'runs': results}, args.output)}")
+
+if __name__ == "__main__":
+    main()
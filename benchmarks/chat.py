@@ -0,0 +1,197 @@
+"""
+Load tests chat messages under the WSGI app and under the ASGI app.
+
+A stand-in agent answers every message after a fixed delay, like a
+slow LLM. Under WSGI, each message holds one of a few worker threads
+until the agent answers, so the threads limit how many chats are
+answered at once. Under ASGI, the messages are awaited on one event
+loop, with the same few threads left for the other routes, so all of
+them wait for the agent together. A few pages are requested during
+each run to show that they are still served.
+
+The website's own database in the instance directory is used, with a
+temporary config that points the agent at the stand-in and raises the
+chat limits above the load. Run from the top-level directory with:
+
+    python -m benchmarks.chat --chats 200 --threads 4 --latency 1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from benchmarks.common import latency_summary
+from benchmarks.common import write_results
+
+from vts import asgi
+from vts.website import app
+from vts.website import ensure_warm
+
+PAGES = ['/', '/faq/1', '/faq/category/1']
+
+HOST = '127.0.0.1'
+
+class AgentHandler(BaseHTTPRequestHandler):
+    "Answers chat completions like the agent, after the server's latency."
+
+    # Note: This is the name that the server calls.
+    #
+    # pylint:disable-next=invalid-name
+    def do_POST(self):
+        "Answers a chat completion."
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.server.latency)
+        reply = json.dumps({'id': 'bench', 'object': 'chat.completion', 'created': 0,
+                            'model': 'n/a',
+                            'choices': [{'index': 0, 'finish_reason': 'stop',
+                                         'message': {'role': 'assistant',
+                                                     'content': 'You asked: ' +
+                                                     body['messages'][-1]['content']}}]})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply.encode('utf8'))
+
+    # Note: This overrides the server's method, arguments and all.
+    #
+    # pylint:disable-next=redefined-builtin
+    def log_message(self, format, *args):
+        "Keeps the agent quiet."
+
+def start_agent(latency: float) -> ThreadingHTTPServer:
+    "Starts the stand-in agent on a free port."
+    server = ThreadingHTTPServer((HOST, 0), AgentHandler)
+    server.daemon_threads = True
+    # Note: The handlers read the latency from their server.
+    #
+    # pylint:disable-next=attribute-defined-outside-init
+    server.latency = latency # type: ignore
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_config(directory: str, agent_port: int, chats: int, threads: int) -> None:
+    """
+    Writes a config for the benchmark and has the app read it. The
+    chats of both runs come from one address.
+    """
+    os.makedirs(os.path.join(directory, 'vts'), exist_ok=True)
+    with open(os.path.join(directory, 'vts', 'config.toml'), mode='w', encoding='utf8') as file:
+        file.write(f'[agent]\nkey = "bench"\nurl = "http://{HOST}:{agent_port}/"\n\n'
+                   f'[chat]\nmax_concurrent = {chats}\nmax_waiting = 0\n'
+                   f'session_burst = {chats}\naddress_burst = {2 * chats}\n\n'
+                   f'[asgi]\nthreads = {threads}\n')
+    os.environ['XDG_CONFIG_HOME'] = directory
+    os.environ['XDG_DATA_HOME'] = directory
+
+def run_wsgi(chats: int, threads: int) -> tuple[float, list[float], list[float], int]:
+    "Sends the chats and the pages to the Flask app from a few worker threads."
+    # The latencies include the time spent waiting for a thread.
+    def post(i):
+        response = app.test_client().post('/message', json={'message': f'question {i}'})
+        return time.perf_counter() - start, response.status_code
+
+    def get(path):
+        response = app.test_client().get(path)
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        chat_runs = [executor.submit(post, i) for i in range(chats)]
+        page_runs = [executor.submit(get, path) for path in PAGES]
+        chat_results = [run.result() for run in chat_runs]
+        page_results = [run.result() for run in page_runs]
+    seconds = time.perf_counter() - start
+    errors = sum(status != 200 for _, status in chat_results + page_results)
+    return seconds, [s for s, _ in chat_results], [s for s, _ in page_results], errors
+
+async def call_asgi(method: str, path: str, body: bytes = b'') -> tuple[float, int]:
+    "Sends a request to the ASGI app. Returns how long it took and the status."
+    events = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    statuses = []
+
+    async def receive():
+        return events.pop(0) if events else {'type': 'http.disconnect'}
+
+    async def send(event):
+        if event['type'] == 'http.response.start':
+            statuses.append(event['status'])
+
+    start = time.perf_counter()
+    await asgi.app({'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+                    'headers': [(b'content-type', b'application/json')],
+                    'server': (HOST, 80), 'client': (HOST, 1234)},
+                   receive, send)
+    return time.perf_counter() - start, statuses[0]
+
+def run_asgi(chats: int) -> tuple[float, list[float], list[float], int]:
+    "Sends the chats and the pages to the ASGI app on one event loop."
+    async def send_all():
+        return await asyncio.gather(
+            *[call_asgi('POST', '/message', json.dumps({'message': f'question {i}'}).encode())
+              for i in range(chats)],
+            *[call_asgi('GET', path) for path in PAGES])
+
+    start = time.perf_counter()
+    results = asyncio.run(send_all())
+    seconds = time.perf_counter() - start
+    errors = sum(status != 200 for _, status in results)
+    return seconds, [s for s, _ in results[:chats]], [s for s, _ in results[chats:]], errors
+
+def summarize(name: str, chats: int, run: tuple[float, list[float], list[float], int]) -> dict:
+    "Summarizes and prints a run."
+    seconds, chat_seconds, page_seconds, errors = run
+    result = {'app': name,
+              'chats': chats,
+              'seconds': seconds,
+              'chats_per_second': chats / seconds,
+              'errors': errors,
+              'chat_latency': latency_summary(chat_seconds),
+              'page_latency': latency_summary(page_seconds)}
+    print(f"{name}: {chats} chats in {seconds:.1f}s ({result['chats_per_second']:.1f}/s), "
+          f"chat p50 {result['chat_latency']['p50_ms']:.0f}ms, "
+          f"page max {result['page_latency']['max_ms']:.0f}ms, {errors} errors")
+    return result
+
+def main():
+    "Parses the arguments and runs the benchmark."
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='seconds that the agent takes to answer')
+    parser.add_argument('--output', default='', help='JSON file to write')
+    args = parser.parse_args()
+    # The SQL log and the chat printouts would dominate the output.
+    logging.disable(logging.INFO)
+    agent = start_agent(args.latency)
+    with tempfile.TemporaryDirectory() as directory:
+        write_config(directory, agent.server_address[1], args.chats, args.threads)
+        ensure_warm()
+        print(f"Sending {args.chats} chats to an agent that takes {args.latency}s "
+              f"with {args.threads} threads...")
+        # The chatbot prints every message and reply.
+        with contextlib.redirect_stdout(io.StringIO()):
+            runs = [run_wsgi(args.chats, args.threads), run_asgi(args.chats)]
+    agent.shutdown()
+    results = [summarize(name, args.chats, run) for name, run in zip(['wsgi', 'asgi'], runs)]
+    print(f"Speedup: {results[1]['chats_per_second'] / results[0]['chats_per_second']:.1f}x")
+    results_path = write_results('chat', {'latency': args.latency,
+                                          'threads': args.threads,
+                                          'runs': results}, args.output)
+    print(f"Wrote {results_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Shared helpers for the benchmarks: synthetic FAQ corpora, timing
+statistics, and writing results as JSON.
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+
+from datetime import datetime
+
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.database import FAQCategory
+from vts.database import FAQEntry
+from vts.database import User
+from vts.render import rerender_stale_entries
+from vts.sample_faq import FAQ
+from vts.sample_faq import FAQ_CATEGORIES
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# The synthetic corpus is built from pieces that look like the real
+# FAQ in sample_faq.py, so the term distribution and the Markdown
+# features (lists, bold, links, code blocks) are realistic.
+QUESTION_STARTS = ["How do I", "Where can I", "When should I", "Who do I contact to",
+                   "Can I", "What happens if I", "Why can't I", "Is it possible to"]
+ACTIONS = ["register for", "request access to", "apply to", "drop", "get advising for",
+           "transfer credits into", "find the schedule for", "get permission to enroll in",
+           "request a letter for", "change my adviser for"]
+SUBJECTS = ["the Computer Science major", "the Computer Engineering minor", "a research lab",
+            "a closed class", "the combined BS/MS program", "graduate programs",
+            "an independent study", "an internship course", "the ITE building",
+            "a teaching assistantship", "a capstone project", "a course at a community college"]
+QUALIFIERS = ["this semester", "as a transfer student", "after the deadline",
+              "as a part-time student", "before graduating", "at Shady Grove", "", ""]
+SENTENCES = ["You should reach out via email or in person to the relevant CSEE faculty member.",
+             "Students may register only after their registration appointment.",
+             "All students must interact with their academic adviser each semester.",
+             "The course might require departmental consent or prerequisites.",
+             "Exceptions may be made for students graduating in the semester.",
+             "Registration dates are based on earned credits, not total credits.",
+             "Our phone number is 410-455-3500 and our email is dept@cs.umbc.edu.",
+             "Faculty and staff can fill out the access request form."]
+LINKS = ["[the registrar](https://registrar.umbc.edu/)",
+         "[this form](https://docs.google.com/forms/d/e/example/viewform)",
+         "[the CSEE website](https://www.csee.umbc.edu/)"]
+
+def synthetic_answer(rng: random.Random) -> str:
+    "A Markdown answer with a mix of the formatting the real FAQ uses."
+    parts = [' '.join(rng.sample(SENTENCES, rng.randint(1, 3)))]
+    style = rng.randint(0, 3)
+    if style == 0:
+        parts.append('\n'.join(f"{i + 1}. **{rng.choice(SUBJECTS).capitalize()}**: "
+                               f"{rng.choice(SENTENCES)}"
+                               for i in range(rng.randint(2, 5))))
+    elif style == 1:
+        parts.append('\n'.join(f"- {rng.choice(SENTENCES)}" for _ in range(rng.randint(2, 4))))
+    elif style == 2:
+        parts.append(f"See {rng.choice(LINKS)} for more information.")
+    else:
+        parts.append("```\n    ITE 325 1000 Hilltop Circle\n    Baltimore, MD 21250\n```")
+    return '\n\n'.join(parts) + '\n'
+
+def synthetic_faq(size: int, seed: int = 447) -> list[tuple[str, str, str]]:
+    """
+    Generates size FAQ tuples of (question, answer, category) in the
+    same format as sample_faq.FAQ, starting with the real entries.
+    """
+    rng = random.Random(seed)
+    faq = list(FAQ[:size])
+    while len(faq) < size:
+        question = f"{rng.choice(QUESTION_STARTS)} {rng.choice(ACTIONS)} " \
+            f"{rng.choice(SUBJECTS)} {rng.choice(QUALIFIERS)}".strip() + "?"
+        faq.append((question, synthetic_answer(rng), rng.choice(FAQ_CATEGORIES)))
+    return faq
+
+def create_benchmark_db(path: str, faq: list[tuple[str, str, str]]) -> AppDatabase:
+    "Creates a SQLite database file at path filled with the given FAQ tuples."
+    AppDatabase.path = path
+    db = AppDatabase(Engine.SQLITE_FILE)
+    # Logging every statement would dominate the timings.
+    db.engine.echo = False
+    db.initialize_metadata()
+    db.add_item(User(name="admin", campus_id="ADMINID", email="admin@example.com",
+                     is_admin=True, password=""))
+    db.add_items([FAQCategory(category_name=category, priority=5)
+                  for category in FAQ_CATEGORIES])
+    categories = db.faq_categories_by_name()
+    db.add_items([FAQEntry(question_text=question,
+                           answer_text=answer,
+                           category_id=categories[category],
+                           author_id=1,
+                           priority=5,
+                           timestamp=datetime.now())
+                  for question, answer, category in faq])
+    return db
+
+def create_website_benchmark_db(directory: str, size: int) -> AppDatabase:
+    """
+    Creates a database of size synthetic FAQ entries in directory for
+    benchmarks that request pages, with the rendered HTML stored like
+    the website stores it.
+    """
+    db = create_benchmark_db(os.path.join(directory, 'bench.db'), synthetic_faq(size))
+    rerender_stale_entries(db)
+    return db
+
+def percentile(values: list[float], percent: float) -> float:
+    "The nearest-rank percentile of values."
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+def latency_summary(seconds: list[float]) -> dict:
+    "Summarizes a list of latencies in milliseconds."
+    return {'count': len(seconds),
+            'mean_ms': 1000 * sum(seconds) / len(seconds) if seconds else 0.0,
+            'p50_ms': 1000 * percentile(seconds, 50),
+            'p99_ms': 1000 * percentile(seconds, 99),
+            'max_ms': 1000 * max(seconds) if seconds else 0.0}
+
+def directory_size(path: str) -> int:
+    "The total size of the files under path, in bytes."
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            total += os.path.getsize(os.path.join(root, filename))
+    return total
+
+def git_commit() -> str:
+    "The current git commit, or 'unknown' outside of a git checkout."
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def write_results(name: str, results: dict, output: str = '') -> str:
+    """
+    Writes the results with enough metadata to compare runs across
+    commits. The default path is benchmarks/results/NAME-COMMIT.json.
+    Returns the path that was written.
+    """
+    commit = git_commit()
+    document = {'benchmark': name,
+                'commit': commit,
+                'date': datetime.now().isoformat(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'results': results}
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{commit}.json")
+    with open(output, mode='w', encoding='utf8') as file:
+        json.dump(document, file, indent=2)
+        file.write('\n')
+    return output
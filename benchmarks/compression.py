@@ -0,0 +1,99 @@
+"""
+Benchmarks compressing responses.
+
+For each corpus size, this requests the biggest pages and the FAQ
+dumps with each encoding the server offers and without compression,
+and reports the bytes sent and the response time of uncached and
+cached requests. The admin FAQ listing, which embeds every answer, is
+measured along with the pages that visitors see.
+
+Run from the top-level directory with:
+
+    python -m benchmarks.compression --sizes 1000 10000
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+
+from benchmarks.common import create_website_benchmark_db
+from benchmarks.common import latency_summary
+from benchmarks.common import write_results
+
+from vts.compression import available_encodings
+
+from vts.website import PAGE_CACHE
+from vts.website import app
+from vts.website import ensure_warm
+
+PAGES = ['/', '/faq-search.html', '/faq/category/1', '/api.json', '/api.txt']
+
+# The admin listing is never cached.
+ADMIN_PAGES = ['/faq-search.html']
+
+def measure(client, path: str, encoding: str, cached: bool) -> dict:
+    "Requests one page, reading all of it, and times it."
+    if not cached:
+        PAGE_CACHE.clear()
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    start = time.perf_counter()
+    response = client.get(path, headers=headers)
+    size = len(response.data)
+    seconds = time.perf_counter() - start
+    assert response.headers.get('Content-Encoding') == (encoding or None) or size < 1024
+    return {'seconds': seconds, 'bytes': size}
+
+def measure_page(client, path: str, rounds: int) -> dict:
+    "Measures a page with every encoding, uncached and cached."
+    result = {}
+    for encoding in ['', *available_encodings()]:
+        name = encoding or 'identity'
+        for cached in (False, True):
+            if cached:
+                # Fill the cache, and the compressed body next to it.
+                measure(client, path, encoding, cached=False)
+                measure(client, path, encoding, cached=True)
+            runs = [measure(client, path, encoding, cached) for _ in range(rounds)]
+            result[f"{name}_{'cached' if cached else 'uncached'}"] = {
+                'bytes': runs[0]['bytes'],
+                'time': latency_summary([run['seconds'] for run in runs])}
+    return result
+
+def benchmark_size(size: int, rounds: int) -> dict:
+    "Measures every page on a fresh corpus of the given size and prints a summary."
+    print(f"Benchmarking {size} entries...")
+    pages: dict = {}
+    # Note: Warming up sets up the website's own database, so it has to
+    # happen before the benchmark database replaces it.
+    ensure_warm()
+    with tempfile.TemporaryDirectory() as directory:
+        create_website_benchmark_db(directory, size)
+        client = app.test_client()
+        pages.update((path, measure_page(client, path, rounds)) for path in PAGES)
+        with client.session_transaction() as admin_session:
+            admin_session['username'] = 'admin'
+            admin_session['user_id'] = 1
+        pages.update(('admin ' + path, measure_page(client, path, rounds))
+                     for path in ADMIN_PAGES)
+    for path, runs in pages.items():
+        print(f"  {path}: " + ", ".join(
+            f"{name} {run['bytes'] / 1024:.0f} KiB in {run['time']['p50_ms']:.1f}ms"
+            for name, run in runs.items()))
+    return {'entries': size, **pages}
+
+def main():
+    "Parses the arguments and runs the benchmark."
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--output', default='', help='JSON file to write')
+    args = parser.parse_args()
+    # The SQL log of every request would dominate the timings.
+    logging.disable(logging.INFO)
+    results = [benchmark_size(size, args.rounds) for size in args.sizes]
+    print(f"Wrote {write_results('compression', {'sizes': results}, args.output)}")
+
+if __name__ == "__main__":
+    main()
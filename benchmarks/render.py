@@ -0,0 +1,65 @@
+"""
+Benchmarks rendering FAQ entries as Markdown.
+
+This compares building a new MarkdownIt parser for every call, which
+is what website.markdown() and the chatbot used to do, with the shared
+parsers in vts/render.py. Each entry is rendered the way a listing
+renders it: the question, the answer, and the question again as a
+title.
+
+Run from the top-level directory with:
+
+    python -m benchmarks.render --entries 1000
+"""
+
+import argparse
+import time
+
+from benchmarks.common import latency_summary
+from benchmarks.common import synthetic_faq
+from benchmarks.common import write_results
+
+from vts.render import create_parser
+from vts.render import render_markdown
+
+def render_new_parser(question: str, answer: str) -> None:
+    "Renders an entry with a new parser per call."
+    for text in (question, answer, question):
+        create_parser(True).render(text)
+
+def render_shared_parser(question: str, answer: str) -> None:
+    "Renders an entry with the shared parser."
+    for text in (question, answer, question):
+        render_markdown(text)
+
+def time_entries(function, faq: list[tuple[str, str, str]]) -> list[float]:
+    "Times function on every entry, returning the seconds per entry."
+    seconds = []
+    for question, answer, _ in faq:
+        start = time.perf_counter()
+        function(question, answer)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+def main():
+    "Parses the arguments and runs the benchmark."
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--output', default='', help='JSON file to write')
+    args = parser.parse_args()
+
+    faq = synthetic_faq(args.entries)
+    # Warm up both paths so imports and first-call costs are excluded.
+    time_entries(render_new_parser, faq[:10])
+    time_entries(render_shared_parser, faq[:10])
+    results = {'entries': args.entries,
+               'new_parser_per_call': latency_summary(time_entries(render_new_parser, faq)),
+               'shared_parser': latency_summary(time_entries(render_shared_parser, faq))}
+    for name in ('new_parser_per_call', 'shared_parser'):
+        print(f"{name}: mean {results[name]['mean_ms']:.3f}ms "
+              f"p99 {results[name]['p99_ms']:.3f}ms per entry")
+    print(f"Wrote {write_results('render', results, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmarks vts/search.py on synthetic FAQ corpora of growing size.
+
+For each corpus size, this measures the time to build the index, the
+cost of adding, editing, and removing entries through the website's
+write path (the search index, the similarity index, and the related
+questions, under the index lock), the p50/p99 latency of
+search_faq_ids() for a fixed query mix, the index size on disk, and
+the peak memory of the build.
+
+Run from the top-level directory with:
+
+    python -m benchmarks.search --sizes 1000 10000 100000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from datetime import datetime
+from typing import Optional
+
+from benchmarks.common import create_benchmark_db
+from benchmarks.common import directory_size
+from benchmarks.common import latency_summary
+from benchmarks.common import synthetic_faq
+from benchmarks.common import write_results
+
+from vts.database import FAQEntry
+from vts.search import INDEX_DIR_NAME
+from vts.search import build_index
+from vts.search import reconcile_index
+from vts.search import search_faq_ids
+from vts.similarity import build_similarity_index
+from vts.website import update_search_indexes
+
+# A fixed mix of simple, multi-word, boolean, and no-match queries.
+QUERY_MIX = ["register", "research lab access", "computer science major",
+             "graduate programs", "closed class OR waitlist", "transfer credits",
+             "adviser", "phone number", "community college", "xylophone"]
+
+def time_call(function, *args) -> float:
+    "Calls function with args and returns how long it took in seconds."
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def benchmark_build(db, instance_path: str, trace: bool) -> dict:
+    "Measures building the index from scratch."
+    if trace:
+        tracemalloc.start()
+    seconds = time_call(build_index, db, instance_path)
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'build_seconds': seconds,
+            'build_peak_traced_bytes': peak,
+            'index_bytes': directory_size(os.path.join(instance_path, INDEX_DIR_NAME))}
+
+def benchmark_queries(instance_path: str, rounds: int) -> dict:
+    "Measures search_faq_ids() latency over the query mix."
+    latencies = []
+    per_query: dict[str, list[float]] = {query: [] for query in QUERY_MIX}
+    for _ in range(rounds):
+        for query in QUERY_MIX:
+            seconds = time_call(search_faq_ids, query, instance_path)
+            latencies.append(seconds)
+            per_query[query].append(seconds)
+    return {'search_faq_ids': latency_summary(latencies),
+            'per_query_p50_ms': {query: latency_summary(values)['p50_ms']
+                                 for query, values in per_query.items()}}
+
+def benchmark_updates(db, instance_path: str, updates: int) -> dict:
+    """
+    Measures the cost of adding, editing, and removing entries with
+    update_search_indexes(), which the website calls after each write.
+    """
+    similarity_seconds = time_call(build_similarity_index, db, instance_path)
+    added, edited, removed = [], [], []
+    new_ids = []
+    for i in range(updates):
+        faq_id = db.add_item(FAQEntry(question_text=f"How do I benchmark update {i}?",
+                                      answer_text="Run **python -m benchmarks.search**.\n",
+                                      category_id=1,
+                                      author_id=1,
+                                      priority=5,
+                                      timestamp=datetime.now()))
+        new_ids.append(faq_id)
+        added.append(time_call(update_search_indexes, db, [faq_id], (), instance_path))
+    for faq_id in new_ids:
+        def query(statement, faq_id=faq_id):
+            return statement.where(FAQEntry.id == faq_id)
+
+        def update(item):
+            item.answer_text = "Run **python -m benchmarks.search** again.\n"
+            item.timestamp = datetime.now()
+
+        db.update_item(query, update)
+        edited.append(time_call(update_search_indexes, db, [faq_id], (), instance_path))
+    for faq_id in new_ids:
+        db.remove_faq_entry(faq_id)
+        removed.append(time_call(update_search_indexes, db, [faq_id], (), instance_path))
+    return {'similarity_build_seconds': similarity_seconds,
+            'add_entry': latency_summary(added),
+            'edit_entry': latency_summary(edited),
+            'remove_entry': latency_summary(removed),
+            'reconcile_seconds': time_call(reconcile_index, db, instance_path)}
+
+def peak_rss_bytes() -> Optional[int]:
+    "The peak resident memory of this process, if the platform reports it."
+    try:
+        # Note: resource is Unix-only, so on Windows there is no peak.
+        #
+        # pylint:disable-next=import-outside-toplevel
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def benchmark_size(size: int, args) -> dict:
+    "Runs every measurement on a fresh corpus of the given size."
+    with tempfile.TemporaryDirectory() as instance_path:
+        start = time.perf_counter()
+        db = create_benchmark_db(os.path.join(instance_path, 'bench.db'), synthetic_faq(size))
+        result: dict = {'entries': size, 'fill_seconds': time.perf_counter() - start}
+        result.update(benchmark_build(db, instance_path, not args.no_trace))
+        result.update(benchmark_queries(instance_path, args.rounds))
+        result.update(benchmark_updates(db, instance_path, args.updates))
+        result['peak_rss_bytes'] = peak_rss_bytes()
+        return result
+
+def main():
+    "Parses the arguments and runs the benchmark."
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--rounds', type=int, default=20,
+                        help='times to run the whole query mix')
+    parser.add_argument('--updates', type=int, default=50,
+                        help='entries to add, update, and remove incrementally')
+    parser.add_argument('--no-trace', action='store_true',
+                        help='skip tracemalloc, which slows down the build')
+    parser.add_argument('--output', default='', help='JSON file to write')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        print(f"Benchmarking {size} entries...")
+        result = benchmark_size(size, args)
+        print(f"  build {result['build_seconds']:.2f}s, "
+              f"search p50 {result['search_faq_ids']['p50_ms']:.2f}ms "
+              f"p99 {result['search_faq_ids']['p99_ms']:.2f}ms, "
+              f"index {result['index_bytes'] / 2**20:.1f} MiB, "
+              f"edit p50 {result['edit_entry']['p50_ms']:.2f}ms")
+        results.append(result)
+    print(f"Wrote {write_results('search', {'sizes': results}, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmarks how long a new process takes to start serving.
+
+Every worker, test run, and CLI command imports the website, so the
+import is measured with `python -X importtime` in fresh processes and
+checked against a budget. The modules that are imported lazily (the
+chatbot, the search indexes, and the sample data) must not show up in
+it. The cold start is then measured step by step in fresh processes:
+the import, the warm-up, and the first and second request.
+
+Run from the top-level directory with:
+
+    python -m benchmarks.startup --budget-ms 800
+
+The exit status is 1 if the import goes over the budget or imports a
+lazy module.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import latency_summary
+from benchmarks.common import write_results
+
+# The modules that importing the website must leave for later
+LAZY_MODULES = ['openai', 'irc', 'whoosh', 'numpy', 'vts.chat', 'vts.search',
+                'vts.similarity', 'vts.bulk', 'vts.sample_faq', 'vts.test_data']
+
+# How many of the slowest modules imported by the website are reported
+TOP_MODULES = 10
+
+# Times each step of starting up in a fresh process and prints them as JSON.
+COLD_START_SCRIPT = """
+import json, logging, time
+start = time.perf_counter()
+from vts.website import app, ensure_warm
+imported = time.perf_counter()
+logging.disable(logging.INFO)
+ensure_warm()
+warmed = time.perf_counter()
+client = app.test_client()
+assert client.get('/').status_code == 200
+first = time.perf_counter()
+assert client.get('/').status_code == 200
+second = time.perf_counter()
+print(json.dumps({'import': imported - start, 'warm_up': warmed - imported,
+                  'first_request': first - warmed, 'second_request': second - first}))
+"""
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    "The modules in -X importtime output, with their own and cumulative microseconds."
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.rstrip(), int(own), int(cumulative)))
+    return modules
+
+def measure_import() -> dict:
+    "Imports the website in a fresh process and reports what it cost."
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import vts.website'],
+                             capture_output=True, text=True, check=True)
+    modules = parse_importtime(process.stderr)
+    names = {name.strip() for name, _, _ in modules}
+    total = next(cumulative for name, _, cumulative in modules if name.strip() == 'vts.website')
+    # The modules that the website imports itself are one level deeper.
+    children = sorted(((name.strip(), cumulative) for name, _, cumulative in modules
+                       if name.startswith('   ') and not name.startswith('    ')),
+                      key=lambda module: -module[1])
+    return {'seconds': total / 1e6,
+            'modules': len(modules),
+            'lazy_imported': [name for name in LAZY_MODULES if name in names],
+            'slowest': [{'module': name, 'ms': cumulative / 1000}
+                        for name, cumulative in children[:TOP_MODULES]]}
+
+def measure_cold_start() -> dict:
+    "Starts the website in a fresh process and times each step until it serves."
+    process = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT],
+                             capture_output=True, text=True, check=True)
+    return json.loads(process.stdout.splitlines()[-1])
+
+def main():
+    "Parses the arguments and runs the benchmark."
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=800,
+                        help='The most the median import may take')
+    parser.add_argument('--output', default='', help='JSON file to write')
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.rounds)]
+    median_ms = 1000 * statistics.median(run['seconds'] for run in imports)
+    print(f"Importing vts.website: {median_ms:.0f}ms median "
+          f"(budget {args.budget_ms:.0f}ms), {imports[0]['modules']} modules")
+    for module in imports[0]['slowest']:
+        print(f"  {module['module']}: {module['ms']:.0f}ms")
+    lazy_imported = imports[0]['lazy_imported']
+    if lazy_imported:
+        print(f"  Imported modules that should be lazy: {', '.join(lazy_imported)}")
+
+    runs = [measure_cold_start() for _ in range(args.rounds)]
+    cold_start = {step: latency_summary([run[step] for run in runs]) for step in runs[0]}
+    print("Cold start: " + ", ".join(f"{step} {summary['p50_ms']:.0f}ms"
+                                     for step, summary in cold_start.items()))
+
+    results = {'import': {'time': latency_summary([run['seconds'] for run in imports]),
+                          'budget_ms': args.budget_ms,
+                          'modules': imports[0]['modules'],
+                          'lazy_imported': lazy_imported,
+                          'slowest': imports[0]['slowest']},
+               'cold_start': cold_start}
+    print(f"Wrote {write_results('startup', results, args.output)}")
+    if median_ms > args.budget_ms or lazy_imported:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
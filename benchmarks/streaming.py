@@ -0,0 +1,91 @@
+"""
+Benchmarks streaming the FAQ listing pages and the FAQ dumps.
+
+For each corpus size, this measures the time to the first chunk, the
+total time, and the peak traced memory of uncached requests to the home
+page, the full FAQ listing, a category page, and the JSON, NDJSON, and
+text dumps of the FAQ. With streaming, the
+time to first byte and the peak memory should stay flat as the corpus
+grows while the total time grows with it.
+
+Run from the top-level directory with:
+
+    python -m benchmarks.streaming --sizes 1000 10000 100000
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import create_website_benchmark_db
+from benchmarks.common import latency_summary
+from benchmarks.common import write_results
+
+from vts.website import PAGE_CACHE
+from vts.website import app
+from vts.website import ensure_warm
+
+PAGES = ['/', '/faq-search.html', '/faq/category/1',
+         '/api.json', '/api.json?format=ndjson', '/api.txt']
+
+def measure_request(client, path: str) -> dict:
+    "Streams one uncached page, timing the first chunk and the whole page."
+    PAGE_CACHE.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(path, buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    first = time.perf_counter() - start
+    for chunk in chunks:
+        size += len(chunk)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    response.close()
+    return {'first': first, 'total': total, 'peak': peak, 'bytes': size}
+
+def benchmark_size(size: int, rounds: int) -> dict:
+    "Requests every page rounds times on a fresh corpus of the given size."
+    with tempfile.TemporaryDirectory() as directory:
+        create_website_benchmark_db(directory, size)
+        client = app.test_client()
+        result: dict = {'entries': size}
+        for path in PAGES:
+            runs = [measure_request(client, path) for _ in range(rounds)]
+            result[path] = {'first_chunk': latency_summary([run['first'] for run in runs]),
+                            'total': latency_summary([run['total'] for run in runs]),
+                            'peak_traced_bytes': max(run['peak'] for run in runs),
+                            'page_bytes': runs[0]['bytes']}
+        return result
+
+def main():
+    "Parses the arguments and runs the benchmark."
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--output', default='', help='JSON file to write')
+    args = parser.parse_args()
+    # Every request creates an engine that echoes its SQL, which would
+    # dominate the timings.
+    logging.disable(logging.INFO)
+    # Note: Warming up sets up the website's own database, so it has to
+    # happen before the benchmark database replaces it.
+    ensure_warm()
+
+    results = []
+    for size in args.sizes:
+        print(f"Benchmarking {size} entries...")
+        result = benchmark_size(size, args.rounds)
+        for path in PAGES:
+            print(f"  {path}: first chunk p50 {result[path]['first_chunk']['p50_ms']:.2f}ms, "
+                  f"total p50 {result[path]['total']['p50_ms']:.0f}ms, "
+                  f"peak {result[path]['peak_traced_bytes'] / 2**20:.1f} MiB")
+        results.append(result)
+    print(f"Wrote {write_results('streaming', {'sizes': results}, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Load tests the website with a growing number of worker processes.
+
+Like a pre-fork server (e.g. gunicorn), this opens the listening socket
+once and forks the workers, which all accept connections from it. The
+workers are not warmed up before they are forked, so each one warms up
+on its first request, which also exercises the run-once setup. Then,
+for each number of workers, client threads request a mix of pages for
+a fixed time and the throughput and the latency are reported.
+
+The website's own database in the instance directory is used. Run from
+the top-level directory with:
+
+    python -m benchmarks.workers --workers 1 2 4 --clients 8 --seconds 10
+
+The clients run on the same machine, so the scaling is limited by the
+number of CPUs that are left for the workers.
+"""
+
+import argparse
+import http.client
+import logging
+import os
+import signal
+import socket
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+from benchmarks.common import latency_summary
+from benchmarks.common import write_results
+
+from vts.website import app
+
+PAGES = ['/', '/faq/1', '/faq/category/1', '/faq-search.html?query=register', '/api.json']
+
+HOST = '127.0.0.1'
+
+def start_workers(listener: socket.socket, count: int) -> list[int]:
+    "Forks count workers that serve the app from the listening socket."
+    pids = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            # Note: The worker must never return into the benchmark.
+            try:
+                server = make_server(HOST, listener.getsockname()[1], app, fd=listener.fileno())
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    return pids
+
+def stop_workers(pids: list[int]) -> None:
+    "Stops the workers and waits for them to exit."
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+def request(port: int, path: str) -> int:
+    "Requests a page, reading all of it, and returns the status."
+    connection = http.client.HTTPConnection(HOST, port, timeout=60)
+    try:
+        connection.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+def run_client(port: int, deadline: float, offset: int) -> tuple[list[float], int]:
+    "Requests the pages in turn until the deadline. Returns the latencies and the errors."
+    seconds = []
+    errors = 0
+    i = offset
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            status = request(port, PAGES[i % len(PAGES)])
+        except OSError:
+            status = 0
+        seconds.append(time.perf_counter() - start)
+        errors += status != 200
+        i += 1
+    return seconds, errors
+
+def benchmark_workers(workers: int, clients: int, duration: float) -> dict:
+    "Serves the app with the given number of workers and loads it for duration seconds."
+    with socket.create_server((HOST, 0), backlog=128) as listener:
+        port = listener.getsockname()[1]
+        pids = start_workers(listener, workers)
+        try:
+            # Every worker warms up on its first request and the pages
+            # are cached, so the load only measures serving them.
+            start = time.perf_counter()
+            for i in range(len(PAGES) * workers * 4):
+                request(port, PAGES[i % len(PAGES)])
+            warm_up_seconds = time.perf_counter() - start
+            deadline = time.perf_counter() + duration
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                runs = list(executor.map(lambda i: run_client(port, deadline, i), range(clients)))
+        finally:
+            stop_workers(pids)
+    seconds = [latency for latencies, _ in runs for latency in latencies]
+    result = {'workers': workers,
+              'clients': clients,
+              'requests': len(seconds),
+              'errors': sum(errors for _, errors in runs),
+              'requests_per_second': len(seconds) / duration,
+              'warm_up_seconds': warm_up_seconds,
+              'latency': latency_summary(seconds)}
+    print(f"{workers} workers: {result['requests_per_second']:.0f} requests/s, "
+          f"p50 {result['latency']['p50_ms']:.1f}ms, p99 {result['latency']['p99_ms']:.1f}ms, "
+          f"{result['errors']} errors (warm-up {warm_up_seconds:.1f}s)")
+    return result
+
+def main():
+    "Parses the arguments and runs the benchmark."
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--output', default='', help='JSON file to write')
+    args = parser.parse_args()
+    # The SQL log and the request log would dominate the timings.
+    logging.disable(logging.INFO)
+    print(f"Load testing with {args.clients} clients on {os.cpu_count()} CPUs...")
+    results = [benchmark_workers(workers, args.clients, args.seconds) for workers in args.workers]
+    base = results[0]['requests_per_second']
+    for result in results:
+        result['speedup'] = result['requests_per_second'] / base if base else 0.0
+    print("Speedup: " + ", ".join(f"{result['workers']} workers {result['speedup']:.2f}x"
+                                  for result in results))
+    print(f"Wrote {write_results('workers', {'runs': results}, args.output)}")
+
+if __name__ == "__main__":
+    main()
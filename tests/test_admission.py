@@ -0,0 +1,75 @@
+"""
+Test the admission control of the chatbot.
+"""
+
+import asyncio
+import threading
+import time
+
+from vts.admission import ConcurrencyLimit
+from vts.admission import TokenBuckets
+
+def test_token_buckets():
+    "Does each client get its burst, then wait for its bucket to refill?"
+    buckets = TokenBuckets(rate=100.0, burst=3, max_clients=1)
+    assert [buckets.take('a') for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert 0 < buckets.take('a') <= 0.01
+    # Other clients have their own buckets.
+    assert buckets.take('b') == 0.0
+    time.sleep(0.02)
+    assert buckets.take('a') == 0.0
+    # Beyond max_clients, the buckets that have refilled are dropped.
+    time.sleep(0.05)
+    buckets.take('c')
+    assert list(buckets.buckets) == ['c']
+
+def test_concurrency_limit(tmp_path):
+    "Are messages beyond the limit kept waiting, or turned away if too many are waiting?"
+    limit = ConcurrencyLimit(str(tmp_path), limit=1, max_waiting=1, wait_seconds=5)
+    impatient = ConcurrencyLimit(str(tmp_path), limit=1, max_waiting=0, wait_seconds=5)
+    admitted = []
+    release = threading.Event()
+
+    def hold():
+        with limit.slot() as slot:
+            admitted.append(slot)
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    while not admitted:
+        time.sleep(0.01)
+    # The slot is shared with the other limit through the lock file.
+    with impatient.slot() as slot:
+        assert slot is False
+    waiter = threading.Thread(target=hold)
+    waiter.start()
+    while limit.waiting == 0:
+        time.sleep(0.01)
+    # The one waiting place is taken.
+    with limit.slot() as slot:
+        assert slot is False
+    release.set()
+    holder.join()
+    waiter.join()
+    assert admitted == [True, True]
+
+def test_async_concurrency_limit(tmp_path):
+    "Do messages on an event loop wait for a slot together without blocking each other?"
+    limit = ConcurrencyLimit(str(tmp_path), limit=1, max_waiting=1, wait_seconds=5)
+    admitted = []
+
+    async def hold():
+        async with limit.async_slot() as slot:
+            admitted.append(slot)
+            await asyncio.sleep(0.1)
+
+    async def main():
+        start = time.monotonic()
+        # The first takes the slot, the second waits for it, and the
+        # third is turned away at once.
+        await asyncio.gather(hold(), hold(), hold())
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) < 1
+    assert sorted(admitted) == [False, True, True]
@@ -0,0 +1,141 @@
+"""
+Test the ASGI app, which awaits chat messages on the event loop.
+"""
+
+import asyncio
+import threading
+import time
+
+from irc.bot import ServerSpec
+from irc.client import SimpleIRCClient
+from irc.server import IRCClient
+from irc.server import IRCServer
+from pytest import fixture
+
+from vts import chat
+from vts import chat_server
+from vts.admission import ConcurrencyLimit
+from vts.admission import TokenBuckets
+from vts.asgi import app
+from vts.asgi import wsgi_environ
+from vts.chat_server import END_MSG
+from vts.chat_server import create_guest_bot_async
+from vts.website import ensure_warm
+
+async def call(method: str, path: str, body: bytes = b'', headers: tuple = ()) -> dict:
+    "Sends a request to the ASGI app and returns the status, the headers, and the body."
+    events = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return events.pop(0) if events else {'type': 'http.disconnect'}
+
+    async def send(event):
+        sent.append(event)
+
+    path, _, query = path.partition('?')
+    await app({'type': 'http', 'method': method, 'path': path,
+               'query_string': query.encode('latin1'), 'headers': list(headers),
+               'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)},
+              receive, send)
+    return {'status': sent[0]['status'],
+            'headers': dict(sent[0]['headers']),
+            'body': b''.join(event.get('body', b'') for event in sent[1:])}
+
+@fixture()
+def warm_app():
+    "Warms the Flask app up."
+    ensure_warm()
+    yield app
+
+def test_wsgi_environ():
+    "Are the headers of an ASGI request passed on the WSGI way?"
+    environ = wsgi_environ({'method': 'POST', 'path': '/vts/message', 'root_path': '/vts',
+                            'query_string': b'a=1',
+                            'headers': [(b'content-type', b'application/json'),
+                                        (b'cookie', b'a=1'), (b'cookie', b'b=2')]},
+                           b'{}')
+    assert environ['SCRIPT_NAME'] == '/vts'
+    assert environ['PATH_INFO'] == '/message'
+    assert environ['CONTENT_TYPE'] == 'application/json'
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+    assert environ['wsgi.input'].read() == b'{}'
+
+# pylint:disable-next=redefined-outer-name,unused-argument
+def test_concurrent_chats(warm_app, tmp_path, monkeypatch):
+    "Are many chats answered at once on one event loop while pages are still served?"
+    async def get_reply_async(user_text):
+        await asyncio.sleep(0.2)
+        return f"You said **{user_text}**."
+
+    monkeypatch.setattr(chat, 'get_reply_async', get_reply_async)
+    monkeypatch.setattr(chat, '_LIMITS', {
+        'session': TokenBuckets(rate=1.0, burst=100),
+        'address': TokenBuckets(rate=1.0, burst=100),
+        'concurrency': ConcurrencyLimit(str(tmp_path), limit=50, max_waiting=0, wait_seconds=0)})
+
+    async def main():
+        headers = ((b'content-type', b'application/json'),)
+        start = time.monotonic()
+        responses = await asyncio.gather(
+            *[call('POST', '/message', f'{{"message": "hi {i}"}}'.encode(), headers)
+              for i in range(50)],
+            call('GET', '/faq/1'))
+        return responses, time.monotonic() - start
+
+    responses, seconds = asyncio.run(main())
+    # Answered one at a time, the chats would take 10 seconds.
+    assert seconds < 2
+    *chats, page = responses
+    assert all(response['status'] == 200 for response in chats)
+    assert b'<strong>hi 7</strong>' in chats[7]['body']
+    # The chat session is saved in the cookie as under WSGI.
+    assert b'session=' in chats[0]['headers'][b'set-cookie']
+    assert page['status'] == 200
+    assert b'<html' in page['body']
+
+# pylint:disable-next=redefined-outer-name,unused-argument
+def test_other_routes(warm_app):
+    "Are the other routes, including errors, served by Flask?"
+    assert asyncio.run(call('GET', '/404'))['status'] == 404
+    assert asyncio.run(call('GET', '/message'))['status'] == 405
+    assert asyncio.run(call('GET', '/ready'))['status'] == 200
+
+class EchoBot(SimpleIRCClient):
+    "A stand-in for the LLM bot that echoes every message."
+
+    # pylint:disable-next=unused-argument
+    def on_welcome(self, c, e):
+        "Joins the channel of the guest bot."
+        c.join('#s0')
+
+    # pylint:disable-next=unused-argument
+    def on_join(self, c, e):
+        "Notes when the channel has been joined."
+        if e.source.nick == 'bot':
+            self.joined.set()
+
+    def on_pubmsg(self, c, e):
+        "Echoes the message and ends the reply."
+        c.privmsg('#s0', f'echo: {e.arguments[0]}')
+        c.privmsg('#s0', END_MSG)
+
+    joined = threading.Event()
+
+def test_async_guest_bot(monkeypatch):
+    "Does the async guest bot get the reply through an IRC server, or None without one?"
+    server = IRCServer(('127.0.0.1', 0), IRCClient)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        bot = EchoBot()
+        bot.joined = threading.Event()
+        bot.connect('127.0.0.1', port, 'bot')
+        threading.Thread(target=bot.start, daemon=True).start()
+        assert bot.joined.wait(5)
+        monkeypatch.setattr(chat_server, 'guest_server', lambda: ServerSpec('127.0.0.1', port))
+        assert asyncio.run(create_guest_bot_async('hello')) == 'echo: hello'
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert asyncio.run(create_guest_bot_async('hello')) is None
@@ -0,0 +1,54 @@
+"""
+Test building the content-hashed, precompressed stylesheets and static files.
+"""
+
+import gzip
+import os
+
+from vts.assets import ASSETS_URL
+from vts.assets import CSS_TEMPLATES
+from vts.assets import assets_are_stale
+from vts.assets import assets_path
+from vts.assets import build_assets
+from vts.assets import load_manifest
+from vts.assets import static_files
+from vts.assets import templates_dir
+
+def render_css(name: str) -> str:
+    "Reads a CSS template, which has no template code in it."
+    with open(os.path.join(templates_dir(), name), encoding='utf8') as file:
+        return file.read()
+
+def read_asset(instance_path: str, url: str, suffix: str = '') -> bytes:
+    "Reads a built asset by its hashed URL."
+    name = url.removeprefix(ASSETS_URL)
+    with open(os.path.join(assets_path(instance_path), name + suffix), mode='rb') as file:
+        return file.read()
+
+def test_build_assets(tmp_path):
+    "Is every asset built under a hashed name with its references rewritten?"
+    assert assets_are_stale(str(tmp_path))
+    manifest = build_assets(str(tmp_path), render_css)
+    assert not assets_are_stale(str(tmp_path))
+    assert load_manifest(str(tmp_path)) == manifest
+    assert set(manifest) == {'/' + name for name in CSS_TEMPLATES} | \
+        {'/static/' + name for name in static_files()}
+    for url, built_url in manifest.items():
+        stem, extension = os.path.splitext(url)
+        assert built_url.startswith(ASSETS_URL + stem.lstrip('/') + '.')
+        assert built_url.endswith(extension)
+
+    # The stylesheets refer to the built copies of what they use.
+    base = read_asset(str(tmp_path), manifest['/base.css']).decode('utf8')
+    assert manifest['/static/UMBC_STYLES/maryland-flag-header-1280x180-gold.jpg'] in base
+    faq_search = read_asset(str(tmp_path), manifest['/faq-search.css']).decode('utf8')
+    assert f'@import url("{manifest["/base.css"]}")' in faq_search
+    chat_js = read_asset(str(tmp_path), manifest['/static/chat.js']).decode('utf8')
+    assert '"/static/' not in chat_js
+
+    # The compressed variants have the same content.
+    assert gzip.decompress(read_asset(str(tmp_path), manifest['/base.css'], '.gz')) == \
+        base.encode('utf8')
+
+    # The same content always gets the same name.
+    assert build_assets(str(tmp_path), render_css) == manifest
@@ -0,0 +1,77 @@
+"""
+Test checking admin logins.
+"""
+
+from flask_bcrypt import Bcrypt
+from pytest import fixture
+from pytest import raises
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from vts import auth
+from vts.auth import LoginBusy
+from vts.auth import LoginThrottled
+from vts.auth import check_login
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.database import User
+from vts.database import hash_rounds
+
+@fixture()
+def login_db(tmp_path, monkeypatch):
+    "Creates a database in a file, which the bcrypt pool's threads can share."
+    monkeypatch.setattr(AppDatabase, 'path', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(auth, '_STATE', {})
+    monkeypatch.setattr(auth, 'AUTH_SETTINGS', {**auth.AUTH_SETTINGS,
+                                                'bcrypt_rounds': 5,
+                                                'failure_burst': 2})
+    db = AppDatabase(Engine.SQLITE_FILE)
+    db.initialize_metadata()
+    db.add_item(User(name='admin', campus_id='', email='', is_admin=True,
+                     password=Bcrypt().generate_password_hash('password', 4)))
+    yield db
+
+def password_hash(db: AppDatabase) -> str | bytes:
+    "The stored password hash of the admin."
+    with Session(db.engine) as session:
+        return session.scalars(select(User.password).where(User.name == 'admin')).one()
+
+# pylint:disable-next=redefined-outer-name
+def test_rehash(login_db):
+    "Is the password hashed again with the configured work factor after a login?"
+    pwhash = Bcrypt()
+    assert hash_rounds(password_hash(login_db)) == 4
+    assert check_login(login_db, 'admin', 'password', pwhash, '127.0.0.1') == 1
+    assert hash_rounds(password_hash(login_db)) == 5
+    assert check_login(login_db, 'admin', 'password', pwhash, '127.0.0.1') == 1
+    assert hash_rounds(b'$2b$12$abcdefghijklmnopqrstuu') == 12
+    assert hash_rounds('') is None
+
+# pylint:disable-next=redefined-outer-name
+def test_throttling(login_db):
+    """
+    Are repeated failures from an address turned away without checking
+    the password, while the admin can still log in from elsewhere?
+    """
+    pwhash = Bcrypt()
+    for _ in range(2):
+        assert not check_login(login_db, 'admin', 'wrong', pwhash, '10.0.0.1')
+    with raises(LoginThrottled):
+        check_login(login_db, 'admin', 'password', pwhash, '10.0.0.1')
+    with raises(LoginThrottled):
+        check_login(login_db, 'someone', 'password', pwhash, '10.0.0.1')
+    assert check_login(login_db, 'admin', 'password', pwhash, '10.0.0.2') == 1
+
+# pylint:disable-next=redefined-outer-name
+def test_busy(login_db, monkeypatch):
+    "Is a login turned away at once when the pool's queue is full?"
+    monkeypatch.setattr(auth, 'AUTH_SETTINGS', {**auth.AUTH_SETTINGS,
+                                                'hash_workers': 1,
+                                                'max_pending': 0})
+    state = auth._state() # pylint:disable=protected-access
+    state['pending'].acquire()
+    with raises(LoginBusy):
+        check_login(login_db, 'admin', 'password', Bcrypt(), '127.0.0.1')
+    state['pending'].release()
+    assert check_login(login_db, 'admin', 'password', Bcrypt(), '127.0.0.1') == 1
@@ -0,0 +1,92 @@
+"""
+Test batches of admin changes to the FAQ.
+"""
+
+from pytest import raises
+
+from vts.batch import BatchError
+from vts.batch import parse_batch
+from vts.batch import parse_operation
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.test_data import fill_debug_database
+
+def render(question_text: str, answer_text: str) -> dict:
+    "Renders an entry without Markdown, which is enough to see that it was rendered."
+    return {'question_html': f"<p>{question_text}</p>",
+            'answer_html': f"<p>{answer_text}</p>",
+            'render_version': 1}
+
+def test_parse_batch():
+    "Are malformed batches refused and malformed operations reported one by one?"
+    for body in [None, [], {'operations': {}}, {'operations': [], 'atomic': 'yes'}]:
+        with raises(BatchError):
+            parse_batch(body)
+    operations, atomic = parse_batch({'operations': [
+        {'op': 'update', 'type': 'faq', 'id': 1, 'question': ' Why? '},
+        {'op': 'create', 'type': 'faq', 'question': 'Why?'},
+        {'op': 'update', 'type': 'faq', 'id': 1},
+        {'op': 'reorder', 'type': 'category', 'ids': [1, 1]},
+        {'op': 'delete', 'type': 'faq', 'id': True},
+        {'op': 'merge', 'type': 'faq'}]})
+    assert atomic is False
+    assert operations[0] == {'op': 'update', 'type': 'faq', 'id': 1,
+                             'fields': {'question_text': 'Why?'}}
+    assert operations[1] == {'error': 'Creating needs the answer, category_id.'}
+    assert all('error' in operation for operation in operations[2:])
+    assert parse_operation({'op': 'reorder', 'type': 'faq', 'ids': [2, 1]}) == \
+        {'op': 'reorder', 'type': 'faq', 'ids': [2, 1]}
+
+def batch(*operations: dict) -> list[dict]:
+    "Parses the operations of a batch."
+    return parse_batch({'operations': list(operations)})[0]
+
+def test_apply_batch():
+    "Is a batch applied in one content version, skipping the operations that fail?"
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    fill_debug_database(db)
+    version = int(db.content_version()[0].split(':')[0])
+    categories = db.faq_categories_by_name()
+    applied = db.apply_batch(batch(
+        {'op': 'create', 'type': 'category', 'name': 'Housing'},
+        {'op': 'create', 'type': 'category', 'name': 'housing'},
+        {'op': 'create', 'type': 'faq', 'question': 'Q', 'answer': 'A',
+         'category_id': categories['Grades']},
+        {'op': 'update', 'type': 'faq', 'id': 2, 'answer': 'New answer'},
+        {'op': 'delete', 'type': 'faq', 'id': 3},
+        {'op': 'delete', 'type': 'faq', 'id': 3},
+        {'op': 'reorder', 'type': 'faq', 'ids': [4, 1]},
+        {'op': 'update', 'type': 'category', 'id': categories['Credits'], 'name': 'Transfer'},
+        {'op': 'delete', 'type': 'category', 'id': categories['Grades']}), 2, render)
+    assert applied['applied']
+    assert [result['ok'] for result in applied['results']] == \
+        [True, False, True, True, True, False, True, True, False]
+    new_id = applied['results'][2]['id']
+    # Entry 4 was first already, so only entry 1 was reordered
+    assert applied['faq'] == {new_id: 'added', 2: 'edited', 3: 'removed', 1: 'reordered'}
+    assert applied['categories']
+    assert applied['reindex_ids'] == [entry['id'] for entry in
+                                      db.faq_entries_by_category(categories['Credits'])]
+    # Everything was written with one content version
+    assert db.content_version()[0].split(':')[0] == str(version + 1)
+    edited = db.faq_entry(2)[0]
+    assert edited['answer_html'] == '<p>New answer</p>'
+    assert edited['author_id'] == 2
+    assert db.faq_entry(3) == []
+    assert db.faq_entry(1)[0]['priority'] == 2
+    assert 'Transfer' in db.faq_categories_by_name()
+
+def test_atomic_batch():
+    "Is nothing applied from an atomic batch with an operation that fails?"
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    fill_debug_database(db)
+    version = db.content_version()
+    applied = db.apply_batch(batch({'op': 'delete', 'type': 'faq', 'id': 1},
+                                   {'op': 'delete', 'type': 'faq', 'id': 9999}),
+                             2, render, atomic=True)
+    assert not applied['applied']
+    assert [result['ok'] for result in applied['results']] == [True, False]
+    assert db.faq_entry(1)
+    assert db.content_version() == version
@@ -0,0 +1,122 @@
+"""
+Test the parallel bulk reprocessing job.
+"""
+
+from datetime import datetime
+
+from pytest import raises
+
+from vts import bulk
+from vts.bulk import STATE_FILE_NAME
+from vts.bulk import load_state
+from vts.bulk import reprocess_faq
+from vts.bulk import save_state
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.database import FAQEntry
+from vts.render import RENDER_VERSION
+from vts.search import add_to_staging_index
+from vts.search import create_staging_index
+from vts.search import related_faq_ids
+from vts.search import search_faq_ids
+from vts.similarity import load_similarity_index
+from vts.similarity import similar_faq_ids
+from vts.test_data import TEST_FAQ
+from vts.test_data import fill_debug_database
+
+ALL_ENTRIES = "class OR course OR credits OR grades"
+
+def create_test_db():
+    "Creates an in-memory database filled with the test data."
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    fill_debug_database(db)
+    return db
+
+def test_reprocess_faq(tmp_path):
+    "Are all entries rendered and indexed by the worker processes?"
+    db = create_test_db()
+    report = reprocess_faq(db, str(tmp_path), workers=2, batch_size=2, commit_size=2)
+    assert report['processed'] == len(TEST_FAQ)
+    assert report['related'] == len(TEST_FAQ)
+    assert all(entry['render_version'] == RENDER_VERSION for entry in db.faq_entries())
+    assert len(search_faq_ids(ALL_ENTRIES, str(tmp_path))) == len(TEST_FAQ)
+    assert related_faq_ids(1, str(tmp_path))
+    similarity = load_similarity_index(str(tmp_path))
+    assert similarity is not None
+    assert report['similarity'] == len(similarity.docs)
+    assert {f"faq:{entry['id']}" for entry in db.faq_entries()} <= \
+        {doc['key'] for doc in similarity.docs}
+    # A finished job leaves nothing to resume.
+    assert not (tmp_path / STATE_FILE_NAME).exists()
+
+def test_reprocess_faq_resumes(tmp_path):
+    "Does an interrupted job continue after its last commit?"
+    db = create_test_db()
+    entries = db.faq_entries_by_ids([1, 2])
+    create_staging_index(str(tmp_path))
+    add_to_staging_index(db, entries, str(tmp_path))
+    save_state(str(tmp_path), {'options': {'render_version': RENDER_VERSION,
+                                           'render': False,
+                                           'reindex': True},
+                               'stage': 'entries',
+                               'done_through': 2,
+                               'processed': 2})
+    report = reprocess_faq(db, str(tmp_path), workers=2, render=False)
+    assert report['resumed_from'] == 2
+    assert report['processed'] == len(TEST_FAQ) - 2
+    assert len(search_faq_ids(ALL_ENTRIES, str(tmp_path))) == len(TEST_FAQ)
+    assert not load_state(str(tmp_path))
+
+def test_reprocess_faq_keeps_edits(tmp_path):
+    "Are edits made after an entry was staged kept when the new index is swapped in?"
+    db = create_test_db()
+    create_staging_index(str(tmp_path))
+    add_to_staging_index(db, db.faq_entries_by_ids([1, 2]), str(tmp_path))
+    save_state(str(tmp_path), {'options': {'render_version': RENDER_VERSION,
+                                           'render': False,
+                                           'reindex': True},
+                               'stage': 'entries',
+                               'done_through': 2,
+                               'processed': 2})
+
+    # An admin edits and removes staged entries while the job runs.
+    def query(statement):
+        return statement.where(FAQEntry.id == 2)
+
+    def update(item):
+        item.answer_text = "Ask the department about a permit."
+        item.timestamp = datetime.now()
+
+    db.update_item(query, update)
+    db.remove_faq_entry(1)
+
+    report = reprocess_faq(db, str(tmp_path), workers=2, render=False)
+    assert report['reconciled'] == {'added': [], 'updated': [2], 'removed': [1],
+                                    'rebuilt': False}
+    assert search_faq_ids("permit", str(tmp_path)) == [2]
+    assert 1 not in search_faq_ids(ALL_ENTRIES, str(tmp_path))
+    assert 2 in similar_faq_ids("department permit", str(tmp_path), k=3)
+    assert 1 not in similar_faq_ids("can't sign up for classes", str(tmp_path))
+
+def test_reprocess_faq_resumes_after_index_commit(tmp_path, monkeypatch):
+    "Is a batch that was indexed but not saved as done indexed only once on resuming?"
+    db = create_test_db()
+    save = bulk.save_state
+
+    def crash_after_first_batch(instance_path, state):
+        if state['processed']:
+            raise KeyboardInterrupt
+        save(instance_path, state)
+
+    monkeypatch.setattr(bulk, 'save_state', crash_after_first_batch)
+    with raises(KeyboardInterrupt):
+        reprocess_faq(db, str(tmp_path), workers=2, render=False, commit_size=2)
+    monkeypatch.setattr(bulk, 'save_state', save)
+    assert load_state(str(tmp_path))['done_through'] == 0
+
+    report = reprocess_faq(db, str(tmp_path), workers=2, render=False, commit_size=2)
+    assert report['processed'] == len(TEST_FAQ)
+    faq_ids = search_faq_ids(ALL_ENTRIES, str(tmp_path))
+    assert sorted(faq_ids) == sorted(set(faq_ids))
+    assert len(faq_ids) == len(TEST_FAQ)
@@ -0,0 +1,82 @@
+"""
+Test the page cache.
+"""
+
+from vts.cache import PageCache
+from vts.cache import category_tag
+from vts.cache import faq_tag
+
+def test_cache_invalidates_by_tag():
+    "Are exactly the pages with an invalidated tag removed?"
+    cache = PageCache()
+    cache.put(('home',), 'home', ['faq-all'])
+    cache.put(('item', 1), 'item 1', [faq_tag(1), 'categories'])
+    cache.put(('item', 2), 'item 2', [faq_tag(2), 'categories'])
+    cache.put(('category', 3), 'category 3', [category_tag(3), faq_tag(1)])
+
+    assert cache.invalidate(faq_tag(1)) == 2
+    assert cache.get(('item', 1)) is None
+    assert cache.get(('category', 3)) is None
+    assert cache.get(('item', 2)) == 'item 2'
+    assert cache.get(('home',)) == 'home'
+
+    assert cache.invalidate('categories') == 1
+    assert cache.get(('item', 2)) is None
+    assert cache.invalidate('categories') == 0
+    assert cache.stats() == {'pages': 1, 'max_pages': 512, 'hits': 2, 'misses': 3}
+
+def test_cache_drops_least_recently_used():
+    "Does a full cache drop the page that was used longest ago?"
+    cache = PageCache(max_pages=2)
+    cache.put(('a',), 'a', ['x'])
+    cache.put(('b',), 'b', ['x'])
+    assert cache.get(('a',)) == 'a'
+    cache.put(('c',), 'c', ['y'])
+    assert cache.get(('b',)) is None
+    assert cache.get(('a',)) == 'a'
+    assert cache.get(('c',)) == 'c'
+    # The dropped page's tags are gone with it.
+    assert cache.invalidate('x') == 1
+
+def test_cache_replaces_page():
+    "Does caching a page again replace its HTML and its tags?"
+    cache = PageCache()
+    cache.put(('a',), 'old', ['x'])
+    cache.put(('a',), 'new', ['y'])
+    assert cache.invalidate('x') == 0
+    assert cache.get(('a',)) == 'new'
+
+def test_cache_checks_version():
+    "Is a page cached for one content version a miss for any other?"
+    cache = PageCache()
+    cache.put(('a',), 'a', ['x'], version='1')
+    assert cache.get(('a',), '1') == 'a'
+    assert cache.get(('a',), '2') is None
+    assert cache.get(('a',)) is None
+
+def test_cache_keeps_compressed_bodies():
+    "Are compressed bodies cached with their page and dropped with it?"
+    cache = PageCache()
+    cache.put(('a',), 'a', ['x'], version='1')
+    cache.put_compressed(('a',), 'gzip', b'compressed', version='1')
+    assert cache.get_compressed(('a',), 'gzip', '1') == b'compressed'
+    assert cache.get_compressed(('a',), 'br', '1') is None
+    assert cache.get_compressed(('a',), 'gzip', '2') is None
+    cache.invalidate('x')
+    assert cache.get_compressed(('a',), 'gzip', '1') is None
+    # A page that is gone doesn't get a compressed body.
+    cache.put_compressed(('a',), 'gzip', b'compressed', version='1')
+    assert cache.stats()['pages'] == 0
+
+def test_cache_reuses_content_version():
+    "Is the content version read again only once it expires or pages are invalidated?"
+    cache = PageCache(version_ttl=60.0)
+    versions = iter(['1', '2', '3'])
+    assert cache.content_version(lambda: next(versions)) == '1'
+    assert cache.content_version(lambda: next(versions)) == '1'
+    cache.invalidate('x')
+    assert cache.content_version(lambda: next(versions)) == '2'
+    cache.version_ttl = 0.0
+    cache.clear()
+    assert cache.content_version(lambda: next(versions)) == '3'
+    assert cache.content_version(lambda: 'expired') == 'expired'
@@ -0,0 +1,31 @@
+"""
+Test compressing responses.
+"""
+
+import gzip
+import zlib
+
+from vts.compression import choose_encoding
+from vts.compression import compress
+from vts.compression import compress_stream
+
+def test_choose_encoding():
+    "Is the encoding the client prefers picked, and none if it accepts none?"
+    assert choose_encoding(lambda encoding: 1.0 if encoding == 'gzip' else 0.0) == 'gzip'
+    assert choose_encoding(lambda encoding: 0.0) is None
+
+def test_compress_stream():
+    "Can every chunk of a compressed stream be decompressed as soon as it arrives?"
+    chunks = [f"<p>Chunk {i} of a streamed page.</p>\n".encode('utf8') * 20 for i in range(5)]
+    decompress = zlib.decompressobj(31)
+    received = b''
+    compressed = []
+    for data in compress_stream(chunks, 'gzip'):
+        compressed.append(data)
+        received += decompress.decompress(data)
+        # Nothing is held back until the end of the stream.
+        assert len(received) >= sum(len(chunk) for chunk in chunks[:len(compressed)]) or \
+            len(compressed) > len(chunks)
+    assert received == b''.join(chunks)
+    assert gzip.decompress(b''.join(compressed)) == b''.join(chunks)
+    assert gzip.decompress(compress(b''.join(chunks), 'gzip')) == b''.join(chunks)
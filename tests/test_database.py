@@ -137,7 +137,10 @@ def mock_faq_entries(faq_categories, faq_category_names, faq_category_index, use
                             'author_id': author_id,
                             'category' : faq_category,
                             'author' : users[author_id - 1]['name'],
-                            'priority' : 5 if faq_category != 'Grades' else 1})
+                            'priority' : 5 if faq_category != 'Grades' else 1,
+                            'question_html': None,
+                            'answer_html': None,
+                            'render_version': 0})
 
     # Move the FAQ entry with the Grades category to the front,
     # assuming it only shows up 0 or 1 times. It shows up only once
@@ -212,7 +215,10 @@ def test_asdict():
                      author_id = 1,
                      priority = 1,
                      timestamp = timestamp,
-                     is_removed = False)
+                     is_removed = False,
+                     question_html = '<p>Cat</p>\n',
+                     answer_html = '<p>Meow</p>\n',
+                     render_version = 1)
     # Note: Manually do the joins because the DB ORM isn't active.
     entry.category = category
     entry.author = user
@@ -224,7 +230,10 @@ def test_asdict():
                               'priority': 1,
                               'author': 'Bob',
                               'category': 'Cat',
-                              'timestamp': timestamp}
+                              'timestamp': timestamp,
+                              'question_html': '<p>Cat</p>\n',
+                              'answer_html': '<p>Meow</p>\n',
+                              'render_version': 1}
 
 def test_database_with_test_data_file():
     "Test the basics of the database via exposed AppDatabase methods."
@@ -368,3 +377,54 @@ def test_deleting_all_entries():
     for i, faq_id in enumerate(marked_entries):
         assert i + 1 == faq_id
     assert len(db.faq_entries()) == 0
+
+def test_content_version():
+    "Does every write to the FAQ or the categories change the content version?"
+    db = create_db_and_initialize()
+    fill_debug_database(db)
+    versions = [db.content_version()[0]]
+
+    db.remove_faq_entry(3)
+    versions.append(db.content_version()[0])
+    db.update_category(1, TEST_FAQ_CATEGORIES[0], 5)
+    versions.append(db.content_version()[0])
+    db.add_item(FAQEntry(question_text="Where do I find a tutor?",
+                         answer_text="Try the Academic Success Center.",
+                         category_id=1,
+                         author_id=2,
+                         timestamp=datetime.now()))
+    versions.append(db.content_version()[0])
+    # A change outside of the database, e.g. to the search index.
+    db.touch_content_version()
+    versions.append(db.content_version()[0])
+    assert len(set(versions)) == len(versions)
+
+    # Reading doesn't change it.
+    db.faq_entries()
+    assert db.content_version()[0] == versions[-1]
+
+def test_faq_changes():
+    "Are added, edited, removed, and deleted entries reported after a cursor?"
+    db = create_db_and_initialize()
+    fill_debug_database(db)
+    changes = db.faq_changes(0, 0, len(TEST_FAQ) + 1)
+    assert [change['id'] for change in changes] == list(range(1, len(TEST_FAQ) + 1))
+    version, faq_id = changes[-1]['change_version'], changes[-1]['id']
+    assert not db.faq_changes(version, faq_id, 10)
+
+    def edit_answer(item):
+        item.answer_text = "Ask the department about a permit."
+
+    db.update_item(lambda statement: statement.where(FAQEntry.id == 2), edit_answer)
+    db.remove_faq_entry(3)
+    changes = db.faq_changes(version, faq_id, 10)
+    assert [(change['id'], change['is_removed']) for change in changes] == [(2, False), (3, True)]
+    assert changes[0]['answer_text'] == "Ask the department about a permit."
+
+    # A deleted entry leaves a tombstone at the same place in the feed.
+    db.delete_marked_entries()
+    assert [(change['id'], change['change_version'], change['is_removed'])
+            for change in db.faq_changes(version, faq_id, 10)] == \
+        [(change['id'], change['change_version'], change['is_removed']) for change in changes]
+    # Paging through the changes one at a time misses nothing.
+    assert [change['id'] for change in db.faq_changes(changes[0]['change_version'], 2, 10)] == [3]
@@ -0,0 +1,130 @@
+"""
+Test the shared agent clients against a stand-in agent.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from openai import APITimeoutError
+from pytest import fixture
+from pytest import raises
+
+from vts import llm
+from vts.config import load_config
+from vts.llm import ask_agent_async
+from vts.llm import ask_agent_openai
+from vts.llm import get_agent_client
+
+class AgentHandler(BaseHTTPRequestHandler):
+    "Answers chat completions after the server's delay, failing the first few with 503."
+
+    # Note: This is the name that the server calls.
+    #
+    # pylint:disable-next=invalid-name
+    def do_POST(self):
+        "Answers a chat completion."
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests += 1 # type: ignore
+        if self.server.requests <= self.server.failures: # type: ignore
+            self.answer(503, b'')
+            return
+        time.sleep(self.server.delay) # type: ignore
+        message = {'role': 'assistant', 'content': f"You asked: {body['messages'][-1]['content']}"}
+        self.answer(200, json.dumps({'id': 'test', 'object': 'chat.completion', 'created': 0,
+                                     'model': 'n/a', 'choices': [{'index': 0,
+                                                                  'finish_reason': 'stop',
+                                                                  'message': message}]}).encode())
+
+    def answer(self, status: int, data: bytes) -> None:
+        "Sends an answer with a JSON body."
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Note: This overrides the server's method, arguments and all.
+    #
+    # pylint:disable-next=redefined-builtin
+    def log_message(self, format, *args):
+        "Keeps the agent quiet."
+
+@fixture()
+def agent(tmp_path, monkeypatch):
+    "Starts a stand-in agent and points a new config at it."
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AgentHandler)
+    server.daemon_threads = True
+    # Note: The handlers read these from their server.
+    #
+    # pylint:disable-next=attribute-defined-outside-init
+    server.requests, server.failures, server.delay = 0, 0, 0.0 # type: ignore
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path))
+    monkeypatch.setattr(llm, '_CLIENTS', {})
+    write_config(tmp_path, server.server_address[1], 'first')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def write_config(directory, port: int, key: str, settings: str = '') -> None:
+    "Writes a config for the stand-in agent."
+    os.makedirs(directory / 'vts', exist_ok=True)
+    path = directory / 'vts' / 'config.toml'
+    path.write_text(f'[agent]\nkey = "{key}"\nurl = "http://127.0.0.1:{port}/"\n{settings}',
+                    encoding='utf8')
+    # The config is only loaded again when it looks changed.
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9 * len(key)))
+
+# pylint:disable-next=redefined-outer-name
+def test_shared_client(agent, tmp_path):
+    "Is one client shared until the agent config changes?"
+    client = get_agent_client()
+    assert get_agent_client() is client
+    assert load_config() is load_config()
+    assert ask_agent_openai('hi') == 'You asked: hi'
+    assert client.max_retries == 2
+    assert client.timeout.connect == 5.0
+
+    write_config(tmp_path, agent.server_address[1], 'second',
+                 'connect_timeout = 1.0\nread_timeout = 10.0\nmax_retries = 0\n')
+    changed = get_agent_client()
+    assert changed is not client
+    assert changed.api_key == 'second'
+    assert changed.max_retries == 0
+    assert (changed.timeout.connect, changed.timeout.read) == (1.0, 10.0)
+
+# pylint:disable-next=redefined-outer-name
+def test_retries_and_timeouts(agent, tmp_path):
+    "Are failed calls retried, and are slow ones given up on after the read timeout?"
+    agent.failures = 1
+    assert ask_agent_openai('again') == 'You asked: again'
+    assert agent.requests == 2
+
+    write_config(tmp_path, agent.server_address[1], 'slow',
+                 'read_timeout = 0.2\nmax_retries = 0\n')
+    agent.delay = 1.0
+    start = time.monotonic()
+    with raises(APITimeoutError):
+        ask_agent_openai('slow')
+    assert time.monotonic() - start < 1.0
+
+# pylint:disable-next=redefined-outer-name,unused-argument
+def test_async_clients(agent):
+    "Does each event loop get its own client, which its calls share?"
+    async def ask_twice():
+        first = await ask_agent_async('one')
+        client = llm.get_async_agent_client()
+        second = await ask_agent_async('two')
+        assert llm.get_async_agent_client() is client
+        return first, second, client
+
+    first, second, client = asyncio.run(ask_twice())
+    assert (first, second) == ('You asked: one', 'You asked: two')
+    assert asyncio.run(ask_twice())[2] is not client
@@ -0,0 +1,50 @@
+"""
+Test the locks that are shared between worker processes.
+"""
+
+import subprocess
+import sys
+import threading
+
+from pytest import raises
+
+from vts.locks import LockTimeout
+from vts.locks import file_lock
+
+def test_lock_is_exclusive(tmp_path):
+    "Does a second holder wait for the first one and give up after its timeout?"
+    path = str(tmp_path / 'test.lock')
+    released = threading.Event()
+    with file_lock(path):
+        with raises(LockTimeout):
+            with file_lock(path, timeout=0.1):
+                pass
+
+        def acquire():
+            with file_lock(path, timeout=10):
+                released.set()
+
+        waiter = threading.Thread(target=acquire)
+        waiter.start()
+        assert not released.wait(timeout=0.2)
+    waiter.join()
+    assert released.is_set()
+
+def test_lock_is_shared_between_processes(tmp_path):
+    "Does another process see the lock of this one?"
+    path = str(tmp_path / 'test.lock')
+    script = ('import sys\n'
+              'from vts.locks import LockTimeout, file_lock\n'
+              'try:\n'
+              '    with file_lock(sys.argv[1], timeout=0):\n'
+              '        print("acquired")\n'
+              'except LockTimeout:\n'
+              '    print("busy")\n')
+
+    def try_lock() -> str:
+        return subprocess.run([sys.executable, '-c', script, path],
+                              capture_output=True, text=True, check=True).stdout.strip()
+
+    with file_lock(path):
+        assert try_lock() == 'busy'
+    assert try_lock() == 'acquired'
@@ -0,0 +1,89 @@
+"""
+Test the production metrics.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.metrics import collect
+from vts.metrics import increment
+from vts.metrics import metrics_path
+from vts.metrics import observe
+from vts.metrics import render
+from vts.metrics import save_snapshot
+from vts.metrics import snapshot
+from vts.metrics import timed
+from vts.metrics import track_sql
+
+def series(text: str) -> dict:
+    "The value of every series in metrics text."
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if not line.startswith('#')}
+
+def test_histogram():
+    "Are times counted in cumulative buckets along with their sum and count?"
+    for seconds in [0.0004, 0.003, 0.003, 100.0]:
+        observe('vts_operation_duration_seconds', seconds, ('test',))
+    text = render([snapshot()], {})
+    assert '# TYPE vts_operation_duration_seconds histogram' in text
+    values = series(text)
+    labels = 'operation="test"'
+    assert values[f'vts_operation_duration_seconds_bucket{{{labels},le="0.0005"}}'] == 1
+    assert values[f'vts_operation_duration_seconds_bucket{{{labels},le="0.0025"}}'] == 1
+    assert values[f'vts_operation_duration_seconds_bucket{{{labels},le="0.005"}}'] == 3
+    assert values[f'vts_operation_duration_seconds_bucket{{{labels},le="30.0"}}'] == 3
+    assert values[f'vts_operation_duration_seconds_bucket{{{labels},le="+Inf"}}'] == 4
+    assert values[f'vts_operation_duration_seconds_count{{{labels}}}'] == 4
+    assert abs(values[f'vts_operation_duration_seconds_sum{{{labels}}}'] - 100.0064) < 1e-9
+
+def test_timers():
+    "Are timed functions and SQL statements recorded even when they fail?"
+    @timed('failing')
+    def fail():
+        raise ValueError()
+
+    try:
+        fail()
+    except ValueError:
+        pass
+    track_sql()
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    db.faq_entries()
+    values = series(render([snapshot()], {}))
+    assert values['vts_operation_duration_seconds_count{operation="failing"}'] == 1
+    assert values['vts_operation_duration_seconds_count{operation="sql"}'] >= 1
+
+def test_worker_snapshots(tmp_path):
+    "Are the metrics of every running worker added up, and those of gone workers removed?"
+    instance_path = str(tmp_path)
+    increment('vts_cache_requests_total', ('test', 'hit'), 3)
+    save_snapshot(instance_path, force=True)
+    assert os.path.exists(os.path.join(metrics_path(instance_path), f"{os.getpid()}.json"))
+    # A worker that is still running, and one that is gone
+    gone = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                          capture_output=True, text=True, check=True)
+    gone_path = os.path.join(metrics_path(instance_path), f"{gone.stdout.strip()}.json")
+    saved = {'counter': [['vts_cache_requests_total', ['test', 'miss'], 1.0],
+                         ['vts_cache_requests_total', ['test', 'hit'], 1.0]],
+             'gauge': [], 'histogram': []}
+    with subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)']) as worker:
+        try:
+            for path in [os.path.join(metrics_path(instance_path), f"{worker.pid}.json"),
+                         gone_path]:
+                with open(path, mode='w', encoding='utf8') as file:
+                    json.dump(saved, file)
+            snapshots = collect(instance_path)
+        finally:
+            worker.kill()
+    assert len(snapshots) == 2
+    assert not os.path.exists(gone_path)
+    values = series(render(snapshots, {'vts_search_index_segments': 2}))
+    hits = values['vts_cache_requests_total{cache="test",result="hit"}']
+    assert values['vts_cache_requests_total{cache="test",result="miss"}'] == 1
+    assert values['vts_cache_hit_ratio{cache="test"}'] == hits / (hits + 1)
+    assert values['vts_search_index_segments'] == 2
@@ -0,0 +1,67 @@
+"""
+Test profiling requests.
+"""
+
+import threading
+
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.profiling import MAX_PROFILES
+from vts.profiling import RequestProfiler
+from vts.profiling import folded_stacks
+from vts.profiling import load_profile
+from vts.profiling import save_profile
+from vts.profiling import slowest_profiles
+from vts.render import render_markdown
+
+def busy_markdown() -> None:
+    "Renders Markdown for long enough to be sampled."
+    for _ in range(200):
+        render_markdown("# Title\n\n- **bold** item\n- [link](https://example.com)\n" * 5)
+
+def test_profiler_records_stacks_and_sql():
+    "Are the stacks, the SQL, and the time in Markdown of a thread recorded?"
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    profiler = RequestProfiler(threading.get_ident())
+    profiler.start()
+    db.faq_entries()
+    busy_markdown()
+    profiler.stop()
+
+    profile = profiler.profile('GET', '/?profile=1', 200)
+    assert profile['sql_count'] >= 1
+    assert 0 < profile['sql_seconds'] <= profile['seconds']
+    assert profile['samples'] > 0
+    assert 0 < profile['markdown_seconds'] <= profile['seconds']
+    assert any('tests/test_profiling.py:busy_markdown' in stack for stack in profile['stacks'])
+    # Folded stacks are one "outer;inner count" line per stack.
+    for line in folded_stacks(profile).splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert ';' in stack and int(count) > 0
+
+    # Statements on other threads are not counted.
+    def query_elsewhere():
+        other_db = AppDatabase(Engine.SQLITE_MEMORY)
+        other_db.initialize_metadata()
+        other_db.faq_entries()
+
+    count = profiler.sql_count
+    thread = threading.Thread(target=query_elsewhere)
+    thread.start()
+    thread.join()
+    assert profiler.sql_count == count
+
+def test_saved_profiles(tmp_path):
+    "Are profiles listed slowest first and only the newest ones kept?"
+    for i in range(MAX_PROFILES + 5):
+        save_profile(str(tmp_path), {'name': f'20260101T{i:06d}-0a', 'seconds': i % 7,
+                                     'stacks': {'a;b': 1}})
+    profiles = slowest_profiles(str(tmp_path), limit=MAX_PROFILES + 5)
+    assert len(profiles) == MAX_PROFILES
+    assert [profile['seconds'] for profile in profiles] == \
+        sorted((profile['seconds'] for profile in profiles), reverse=True)
+    assert 'stacks' not in profiles[0]
+    assert load_profile(str(tmp_path), '20260101T000000-0a') is None
+    assert load_profile(str(tmp_path), f'20260101T{MAX_PROFILES:06d}-0a')['stacks'] == {'a;b': 1}
+    assert load_profile(str(tmp_path), '../../etc/passwd') is None
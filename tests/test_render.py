@@ -0,0 +1,70 @@
+"""
+Test the shared Markdown renderer.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.render import RENDER_VERSION
+from vts.render import create_parser
+from vts.render import render_markdown
+from vts.render import rerender_stale_entries
+from vts.render import stored_html
+from vts.sample_faq import FAQ
+from vts.test_data import fill_debug_database
+
+def test_render_matches_new_parser():
+    "Does the shared renderer give the same HTML as a freshly built parser?"
+    for question, answer, _ in FAQ:
+        for breaks in (True, False):
+            parser = create_parser(breaks)
+            assert render_markdown(question, breaks) == parser.render(question)
+            assert render_markdown(answer, breaks) == parser.render(answer)
+
+def test_render_breaks():
+    "Are single newlines line breaks only for the FAQ variant?"
+    assert render_markdown("one\ntwo") == "<p>one<br />\ntwo</p>\n"
+    assert render_markdown("one\ntwo", breaks=False) == "<p>one\ntwo</p>\n"
+
+def test_render_from_threads():
+    "Is rendering from many threads at once the same as rendering serially?"
+    texts = [answer for _, answer, _ in FAQ] * 20
+    expected = [render_markdown(text) for text in texts]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(render_markdown, texts)) == expected
+
+def test_rerender_stale_entries():
+    "Are entries without current stored HTML rendered and stored once?"
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    fill_debug_database(db)
+    entries = db.faq_entries()
+    assert all(entry['answer_html'] is None for entry in entries)
+    assert rerender_stale_entries(db, batch_size=2) == len(entries)
+    for entry in db.faq_entries():
+        assert entry['render_version'] == RENDER_VERSION
+        assert entry['question_html'] == render_markdown(entry['question_text'])
+        assert entry['answer_html'] == render_markdown(entry['answer_text'])
+    assert rerender_stale_entries(db) == 0
+
+def test_stored_html_is_ignored_when_outdated():
+    "Is HTML from an older renderer rendered again instead of used?"
+    entry = {'question_text': 'New', 'question_html': '<p>Old</p>', 'render_version': 0}
+    assert stored_html(entry, 'question') == render_markdown('New')
+    entry['render_version'] = RENDER_VERSION
+    assert stored_html(entry, 'question') == '<p>Old</p>'
+
+def test_upgrade_schema_adds_html_columns():
+    "Does an existing database without the HTML columns get them?"
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    with db.engine.begin() as connection:
+        connection.execute(text('ALTER TABLE faq_entry DROP COLUMN answer_html'))
+        connection.execute(text('ALTER TABLE faq_entry DROP COLUMN render_version'))
+    assert db.upgrade_schema() == ['faq_entry.answer_html', 'faq_entry.render_version']
+    assert not db.upgrade_schema()
+    fill_debug_database(db)
+    assert rerender_stale_entries(db) == len(db.faq_entries())
@@ -0,0 +1,168 @@
+"""
+Test the Whoosh search index and keeping it in sync with the database.
+"""
+
+from datetime import datetime
+
+from whoosh.fields import ID
+from whoosh.fields import Schema
+from whoosh.index import create_in
+
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.database import FAQEntry
+from vts.search import INDEX_DIR_NAME
+from vts.search import RELATED_LIMIT
+from vts.search import build_index
+from vts.search import ensure_index
+from vts.search import reconcile_index
+from vts.search import related_faq_ids
+from vts.search import search_faq
+from vts.search import search_faq_ids
+from vts.test_data import TEST_FAQ
+from vts.test_data import fill_debug_database
+
+def create_test_db():
+    "Creates an in-memory database filled with the test data."
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    fill_debug_database(db)
+    return db
+
+NO_DRIFT = {'added': [], 'updated': [], 'removed': [], 'rebuilt': False}
+
+def test_reconcile_without_drift(tmp_path):
+    "Does a freshly built index have nothing to reconcile?"
+    db = create_test_db()
+    build_index(db, str(tmp_path))
+    assert reconcile_index(db, str(tmp_path)) == NO_DRIFT
+
+def test_reconcile_fixes_drift(tmp_path):
+    "Are entries that were changed behind the index's back reindexed?"
+    db = create_test_db()
+    build_index(db, str(tmp_path))
+
+    # A crash between the database commit and the index commit.
+    faq_id = db.add_item(FAQEntry(question_text="Where do I find a tutor?",
+                                  answer_text="Try the Academic Success Center.",
+                                  category_id=1,
+                                  author_id=2,
+                                  timestamp=datetime.now()))
+    # An edit made by another server sharing the database.
+    def query(statement):
+        return statement.where(FAQEntry.id == 2)
+
+    def update(item):
+        item.answer_text = "Ask the department about a permit."
+        item.timestamp = datetime.now()
+
+    db.update_item(query, update)
+    # A removal that never reached the index.
+    db.remove_faq_entry(3)
+
+    assert not search_faq_ids("tutor", str(tmp_path))
+    assert reconcile_index(db, str(tmp_path)) == {'added': [faq_id],
+                                                   'updated': [2],
+                                                   'removed': [3],
+                                                   'rebuilt': False}
+    assert search_faq_ids("tutor", str(tmp_path)) == [faq_id]
+    assert search_faq_ids("permit", str(tmp_path)) == [2]
+    assert 3 not in search_faq_ids("closed class", str(tmp_path))
+
+    # Everything is in sync again.
+    assert reconcile_index(db, str(tmp_path)) == NO_DRIFT
+
+def test_reconcile_finds_renamed_category(tmp_path):
+    "Are the entries of a category that was renamed behind the index's back reindexed?"
+    db = create_test_db()
+    build_index(db, str(tmp_path))
+    category = db.faq_categories()[0]
+    faq_ids = sorted(entry['id'] for entry in db.iter_faq_entries(category['id']))
+    db.update_category(category['id'], 'Zymurgy', category['priority'])
+    assert not search_faq_ids("zymurgy", str(tmp_path))
+    assert reconcile_index(db, str(tmp_path)) == {**NO_DRIFT, 'updated': faq_ids}
+    assert sorted(search_faq_ids("zymurgy", str(tmp_path))) == faq_ids
+
+def test_outdated_index_is_rebuilt(tmp_path):
+    "Is an index without stored versions rebuilt instead of reconciled?"
+    db = create_test_db()
+    index_path = tmp_path / INDEX_DIR_NAME
+    index_path.mkdir()
+    create_in(str(index_path), Schema(faq_id=ID(stored=True, unique=True)))
+    assert ensure_index(db, str(tmp_path))['rebuilt'] is True
+    assert reconcile_index(db, str(tmp_path)) == NO_DRIFT
+    assert len(search_faq_ids("class OR course OR credits OR grades", str(tmp_path))) == \
+        len(TEST_FAQ)
+
+def test_category_facets(tmp_path):
+    "Do search results come with per-category counts and filter by category?"
+    db = create_test_db()
+    build_index(db, str(tmp_path))
+    categories = db.faq_categories_by_name()
+    query = "class OR credits"
+
+    results = search_faq(query, str(tmp_path))
+    # Every match is counted in exactly one category.
+    assert sum(results['facets'].values()) == len(results['ids'])
+    by_category = {category_id: [entry['id']
+                                 for entry in db.faq_entries_by_ids(results['ids'])
+                                 if entry['category_id'] == category_id]
+                   for category_id in results['facets']}
+    assert results['facets'] == {category_id: len(ids) for category_id, ids in by_category.items()}
+
+    # Searching within a category only returns that category's matches,
+    # in the same order, with the same counts.
+    registration = categories['Registration']
+    within = search_faq(query, str(tmp_path), category_id=registration)
+    assert within['facets'] == results['facets']
+    assert within['ids'] == [faq_id for faq_id in results['ids']
+                             if faq_id in by_category[registration]]
+    assert search_faq_ids(query, str(tmp_path), category_id=registration) == within['ids']
+
+def test_extra_ids_in_facets(tmp_path):
+    "Are extra matches added after the keyword matches and counted in their category?"
+    db = create_test_db()
+    build_index(db, str(tmp_path))
+    query = "class OR credits"
+    results = search_faq(query, str(tmp_path))
+    extra = next(entry for entry in db.faq_entries() if entry['id'] not in results['ids'])
+    with_extra = search_faq(query, str(tmp_path), extra_ids=[results['ids'][0], extra['id']])
+    assert with_extra['ids'] == results['ids'] + [extra['id']]
+    facets = dict(results['facets'])
+    facets[extra['category_id']] = facets.get(extra['category_id'], 0) + 1
+    assert with_extra['facets'] == facets
+    # Outside of its category, it is still counted but not listed.
+    other = next(category_id for category_id in results['facets']
+                 if category_id != extra['category_id'])
+    within = search_faq(query, str(tmp_path), category_id=other, extra_ids=[extra['id']])
+    assert within['facets'] == facets
+    assert extra['id'] not in within['ids']
+
+def test_related_questions(tmp_path):
+    "Are related questions precomputed and refreshed only around changed entries?"
+    db = create_test_db()
+    build_index(db, str(tmp_path))
+    for entry in db.faq_entries():
+        related = related_faq_ids(entry['id'], str(tmp_path))
+        assert entry['id'] not in related
+        assert len(related) <= RELATED_LIMIT
+    # Both entries are about registering for classes.
+    assert 2 in related_faq_ids(1, str(tmp_path))
+
+    # A new entry gets its own list.
+    faq_id = db.add_item(FAQEntry(question_text="Where do I find a tutor?",
+                                  answer_text="Try the Academic Success Center for a tutor.",
+                                  category_id=1,
+                                  author_id=2,
+                                  timestamp=datetime.now()))
+    reconcile_index(db, str(tmp_path))
+    related = related_faq_ids(faq_id, str(tmp_path))
+    assert related and faq_id not in related
+
+    # A removed entry is dropped from its neighbors' lists.
+    neighbors = related_faq_ids(1, str(tmp_path))
+    db.remove_faq_entry(1)
+    reconcile_index(db, str(tmp_path))
+    assert not related_faq_ids(1, str(tmp_path))
+    for neighbor in neighbors:
+        assert 1 not in related_faq_ids(neighbor, str(tmp_path))
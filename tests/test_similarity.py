@@ -0,0 +1,99 @@
+"""
+Test the local vector-similarity index.
+"""
+
+import numpy as np
+
+from vts.database import AppDatabase
+from vts.database import Engine
+from vts.database import FAQEntry
+from vts.similarity import build_similarity_index
+from vts.similarity import chunk_markdown
+from vts.similarity import load_similarity_index
+from vts.similarity import refresh_similarity_index
+from vts.similarity import similar_faq_ids
+from vts.similarity import update_faq_similarity
+from vts.test_data import fill_debug_database
+
+def create_test_db():
+    "Creates an in-memory database filled with the test data."
+    db = AppDatabase(Engine.SQLITE_MEMORY)
+    db.initialize_metadata()
+    fill_debug_database(db)
+    return db
+
+def test_chunk_markdown():
+    "Is Markdown split at headings and at blank lines when too long?"
+    text = "Intro.\n\n# One\nFirst.\n\n## Two\n" + "word " * 30 + "\n\n" + "more " * 30
+    chunks = chunk_markdown(text, limit=100)
+    assert chunks[0] == ('', 'Intro.\n')
+    assert chunks[1][0] == 'One'
+    assert [heading for heading, chunk in chunks[2:]] == ['Two', 'Two']
+
+def test_paraphrase_query(tmp_path):
+    "Does a paraphrased question find the entry that keyword search would miss?"
+    db = create_test_db()
+    build_similarity_index(db, str(tmp_path), knowledge_dir=None)
+    # Entry 1 is "Why can't I register for my classes?"
+    assert 1 in similar_faq_ids("can't sign up for classes", str(tmp_path), k=3)
+    # Entry 5 is the community college question.
+    assert similar_faq_ids("community college credits", str(tmp_path), k=1) == [5]
+
+def test_memory_mapped(tmp_path):
+    "Are the stored document vectors memory-mapped when loaded?"
+    db = create_test_db()
+    build_similarity_index(db, str(tmp_path), knowledge_dir=None)
+    index = load_similarity_index(str(tmp_path))
+    assert index is not None
+    assert isinstance(index.vectors, np.memmap)
+    assert len(index.docs) == len(db.faq_entries())
+
+def test_incremental_updates(tmp_path):
+    "Are added and removed entries folded in without a rebuild?"
+    db = create_test_db()
+    build_similarity_index(db, str(tmp_path), knowledge_dir=None)
+    assert refresh_similarity_index(db, str(tmp_path), knowledge_dir=None) == \
+        {'added': 0, 'changed': 0, 'removed': 0, 'rebuilt': False}
+
+    db.remove_faq_entry(5)
+    update_faq_similarity(db, [5], str(tmp_path))
+    assert 5 not in similar_faq_ids("community college credits", str(tmp_path))
+
+    faq_id = db.add_item(FAQEntry(question_text="Which community college credits transfer?",
+                                  answer_text="Most credits from a community college transfer.",
+                                  category_id=3,
+                                  author_id=2))
+    update_faq_similarity(db, [faq_id], str(tmp_path))
+    assert similar_faq_ids("community college credits", str(tmp_path), k=1) == [faq_id]
+
+    # Everything is already folded in so there is nothing to refresh.
+    assert refresh_similarity_index(db, str(tmp_path), knowledge_dir=None) == \
+        {'added': 0, 'changed': 0, 'removed': 0, 'rebuilt': False}
+
+def test_updates_keep_mapped_vectors(tmp_path):
+    "Do edits leave the memory-mapped vectors alone until they are compacted?"
+    db = create_test_db()
+    build_similarity_index(db, str(tmp_path), knowledge_dir=None)
+    index = load_similarity_index(str(tmp_path))
+    assert index is not None
+    vectors_file = index.files['vectors']
+
+    update_faq_similarity(db, [1], str(tmp_path))
+    index = load_similarity_index(str(tmp_path))
+    assert index is not None
+    assert index.files['vectors'] == vectors_file
+    assert len(index.changes) == 1
+    assert 1 in similar_faq_ids("can't sign up for classes", str(tmp_path), k=3)
+
+    # Enough changes are rewritten into one file with a new name, and
+    # the old files are removed.
+    faq_ids = [entry['id'] for entry in db.faq_entries()]
+    update_faq_similarity(db, faq_ids, str(tmp_path))
+    index = load_similarity_index(str(tmp_path))
+    assert index is not None
+    assert index.files['vectors'] != vectors_file
+    assert len(index.changes) == 0
+    assert len(index.vectors) == len(faq_ids)
+    assert sorted(path.name for path in (tmp_path / 'similarity_index').glob('*.npy')) == \
+        sorted(['idf.npy', 'basis.npy', index.files['vectors']])
+    assert similar_faq_ids("community college credits", str(tmp_path), k=1) == [5]
@@ -29,6 +29,14 @@ while having the data that is expected (from the earlier test), then
 it probably does what is expected.
 """
 
+import gzip
+import json
+import subprocess
+import sys
+
+from datetime import datetime
+from datetime import timedelta
+
 from pytest import fixture
 
 from werkzeug.test import Client
@@ -37,17 +45,30 @@ from werkzeug.test import Client
 
 from test_database import mock_categories, mock_database_users, mock_faq_entries
 
+from vts import chat
+from vts.admission import ConcurrencyLimit
+from vts.admission import TokenBuckets
+from vts.database import AppDatabase
 from vts.database import Engine
+from vts.database import FAQEntry
 from vts.frontend import MENU_ITEMS
 from vts.frontend import TITLES
+from vts.search import build_index
+from vts.search import search_faq_ids
 from vts.test_data import TEST_FAQ
+from vts.website import ASSET_MANIFEST
+from vts.website import PAGE_CACHE
+from vts.website import READY
 from vts.website import TEST_ENGINE
 from vts.website import app
 from vts.website import create_home
 from vts.website import create_how_to_page
+from vts.website import ensure_warm
 from vts.website import faq_entries_to_markdown
+from vts.website import faq_nonadmin
 from vts.website import faq_titles_to_markdown
 from vts.website import flask_bcrypt
+from vts.website import get_db
 from vts.website import init_db
 from vts.website import markdown
 
@@ -119,6 +140,7 @@ ADMIN_PAGES = [("/admin-categories.html", True),
 @fixture()
 def flask_app():
     "Tests the Flask flask_app."
+    ensure_warm()
     yield app
 
 @fixture()
@@ -161,12 +183,9 @@ def test_home(sqlite_db):
     expected = {'title': TITLES['main-page'],
                 'menu_items': MENU_ITEMS,
                 'faq_items': faq_titles_to_markdown(faq_entries),
-                'faq_full_items': faq_entries_to_markdown(faq_entries),
                 'admin': None}
-    # Timestamps aren't going to match so we didn't even mock them.
-    # Let's pop them.
-    for entry in page_data['faq_full_items']:
-        entry.pop('timestamp', None)
+    # The titles are a generator that is read as the page streams.
+    page_data['faq_items'] = list(page_data['faq_items'])
     assert page_data == expected
 
 # pylint:disable-next=redefined-outer-name
@@ -175,6 +194,308 @@ def test_home_template(client):
     response = client.get('/')
     assert response.status_code == 200
 
+# pylint:disable-next=redefined-outer-name
+def test_page_cache(flask_app):
+    "Are anonymous pages served from the cache while admin pages bypass it?"
+    PAGE_CACHE.clear()
+    test_client = flask_app.test_client()
+    # The page is streamed and cached once it has been sent.
+    first = test_client.get('/').data
+    hits = PAGE_CACHE.stats()['hits']
+    assert test_client.get('/').data == first
+    assert PAGE_CACHE.stats()['hits'] == hits + 1
+
+    with test_client.session_transaction() as admin_session:
+        admin_session['username'] = 'admin'
+        admin_session['user_id'] = 1
+    test_client.get('/')
+    test_client.get('/faq/1')
+    assert PAGE_CACHE.stats()['hits'] == hits + 1
+    assert PAGE_CACHE.stats()['pages'] == 1
+
+# pylint:disable-next=redefined-outer-name
+def test_flashed_message_on_streamed_page(flask_app):
+    "Is a flashed message shown once on a streamed page and then gone?"
+    test_client = flask_app.test_client()
+    with test_client.session_transaction() as admin_session:
+        admin_session['username'] = 'admin'
+        admin_session['user_id'] = 1
+        admin_session['_flashes'] = [('message', 'FAQ entry #1 removal canceled.')]
+    assert b'removal canceled' in test_client.get('/faq-search.html').data
+    assert b'removal canceled' not in test_client.get('/faq-search.html').data
+    assert b'removal canceled' not in test_client.get('/how-to.html').data
+
+# pylint:disable-next=redefined-outer-name
+def test_listings_are_streamed(flask_app):
+    "Are the listing pages streamed instead of rendered up front?"
+    test_client = flask_app.test_client()
+    for path in ('/', '/faq-search.html', '/faq/category/1'):
+        PAGE_CACHE.clear()
+        response = test_client.get(path)
+        assert response.is_streamed
+        assert response.status_code == 200
+        assert response.data.rstrip().endswith(b'</html>')
+
+# pylint:disable-next=redefined-outer-name
+def test_faq_item_json(flask_app):
+    "Is an FAQ answer served on its own with an ETag that can be revalidated?"
+    test_client = flask_app.test_client()
+    response = test_client.get('/faq/1.json')
+    assert response.status_code == 200
+    assert set(response.json) == {'id', 'question_html', 'answer_html', 'url'}
+    assert response.json['url'] == '/faq/1'
+    assert response.headers['ETag']
+    assert 'public' in response.headers['Cache-Control']
+    revalidated = test_client.get('/faq/1.json',
+                                  headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert test_client.get('/faq/100000.json').status_code == 404
+
+# pylint:disable-next=redefined-outer-name
+def test_faq_item_json_sees_other_writes(flask_app, monkeypatch):
+    "Does the cached FAQ answer change after a write made by another process?"
+    # The cached content version expires at once, like after its TTL.
+    monkeypatch.setattr(PAGE_CACHE, 'version_ttl', 0.0)
+    PAGE_CACHE.clear()
+    test_client = flask_app.test_client()
+    old = test_client.get('/faq/1.json')
+    answer = old.json['answer_html']
+
+    def query(statement):
+        return statement.where(FAQEntry.id == 1)
+
+    def update(item):
+        item.answer_html = '<p>Changed somewhere else.</p>'
+        item.timestamp = datetime.now()
+
+    # Another process has its own database object and page cache.
+    other_db = AppDatabase(Engine.SQLITE_FILE)
+    other_db.update_item(query, update)
+    try:
+        response = test_client.get('/faq/1.json',
+                                   headers={'If-None-Match': old.headers['ETag']})
+        assert response.status_code == 200
+        assert response.json['answer_html'] == '<p>Changed somewhere else.</p>'
+        assert response.headers['ETag'] != old.headers['ETag']
+    finally:
+        def restore(item):
+            item.answer_html = answer
+
+        other_db.update_item(query, restore)
+
+# pylint:disable-next=redefined-outer-name
+def test_browsing_lists_only_questions(flask_app):
+    "Does browsing the FAQ leave the answers out of the page?"
+    test_client = flask_app.test_client()
+    PAGE_CACHE.clear()
+    page = test_client.get('/faq-search.html').data
+    assert b'faq-lazy-entry' in page
+    assert b'/faq/1' in page
+
+# pylint:disable-next=redefined-outer-name
+def test_conditional_get(flask_app, monkeypatch):
+    "Do clients that have the current version of a page get a 304 until the FAQ changes?"
+    # The write below stands in for another server's, which is only seen
+    # once the cached content version expires, so it expires at once.
+    monkeypatch.setattr(PAGE_CACHE, 'version_ttl', 0.0)
+    PAGE_CACHE.clear()
+    test_client = flask_app.test_client()
+    paths = ['/', '/faq/1', '/faq/category/1', '/api.json', '/api.txt']
+    validators = {}
+    for path in paths:
+        response = test_client.get(path)
+        assert response.status_code == 200
+        assert response.headers['ETag']
+        assert response.last_modified
+        validators[path] = response.headers['ETag'], response.headers['Last-Modified']
+        assert test_client.get(path, headers={'If-None-Match': validators[path][0]}) \
+                          .status_code == 304
+        assert test_client.get(path, headers={'If-Modified-Since': validators[path][1]}) \
+                          .status_code == 304
+
+    # Any write to the FAQ changes the version, even if nothing else changed.
+    db = get_db()
+    category = db.faq_categories()[0]
+    db.update_category(category['id'], category['category_name'], category['priority'])
+    for path in paths:
+        response = test_client.get(path, headers={'If-None-Match': validators[path][0]})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != validators[path][0]
+
+# pylint:disable-next=redefined-outer-name
+def test_conditional_get_after_deploy(flask_app, monkeypatch):
+    "Do clients that only send If-Modified-Since get a page again after a deploy?"
+    test_client = flask_app.test_client()
+    response = test_client.get('/faq/1')
+    last_modified = response.headers['Last-Modified']
+    assert test_client.get('/faq/1', headers={'If-Modified-Since': last_modified}) \
+                      .status_code == 304
+
+    # A deploy changes the site version and the time it was last changed.
+    monkeypatch.setitem(flask_app.config, 'SITE_VERSION', 'deployed')
+    monkeypatch.setitem(flask_app.config, 'SITE_MODIFIED',
+                        response.last_modified + timedelta(minutes=1))
+    response = test_client.get('/faq/1', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 200
+    assert response.headers['Last-Modified'] != last_modified
+
+# pylint:disable-next=redefined-outer-name
+def test_category_rename_reindexes(flask_app):
+    "Can the entries of a renamed category be found by its new name at once?"
+    test_client = flask_app.test_client()
+    with test_client.session_transaction() as admin_session:
+        admin_session['username'] = 'admin'
+        admin_session['user_id'] = 1
+    category = get_db().faq_categories()[0]
+    faq_ids = sorted(entry['id'] for entry in get_db().iter_faq_entries(category['id']))
+
+    def rename(name):
+        return test_client.post(f"/admin-categories/edit/{category['id']}",
+                                data={'category_name': name, 'priority': category['priority']})
+
+    try:
+        assert rename('Zymurgy').status_code == 302
+        assert sorted(search_faq_ids('zymurgy', flask_app.instance_path)) == faq_ids
+    finally:
+        assert rename(category['category_name']).status_code == 302
+    assert not search_faq_ids('zymurgy', flask_app.instance_path)
+
+# pylint:disable-next=redefined-outer-name
+def test_compressed_responses(flask_app):
+    "Are big responses compressed, including streamed and cached pages?"
+    test_client = flask_app.test_client()
+    gzip_only = {'Accept-Encoding': 'gzip'}
+    api = test_client.get('/api.txt').data
+    response = test_client.get('/api.txt', headers=gzip_only)
+    assert response.content_encoding == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers['ETag'].startswith('W/')
+    assert gzip.decompress(response.data) == api
+
+    # The page is compressed as it streams, and once more for the cache.
+    PAGE_CACHE.clear()
+    streamed = test_client.get('/', headers=gzip_only)
+    assert streamed.content_encoding == 'gzip'
+    page = gzip.decompress(streamed.data)
+    hits = PAGE_CACHE.stats()['hits']
+    cached = test_client.get('/', headers=gzip_only)
+    assert PAGE_CACHE.stats()['hits'] == hits + 1
+    assert cached.content_encoding == 'gzip'
+    assert gzip.decompress(cached.data) == page
+    assert gzip.decompress(cached.data) == test_client.get('/').data
+
+    # Small responses aren't worth it.
+    assert test_client.get('/faq/1.json', headers=gzip_only).content_encoding is None
+
+# pylint:disable-next=redefined-outer-name
+def test_streamed_apis(flask_app):
+    "Do the streamed FAQ dumps have every entry in each format?"
+    test_client = flask_app.test_client()
+    questions = {entry['question_text'] for entry in get_db().faq_entries()}
+    response = test_client.get('/api.json')
+    assert response.is_streamed
+    assert {item['question'] for item in response.json} == questions
+
+    ndjson = test_client.get('/api.json?format=ndjson')
+    assert ndjson.mimetype == 'application/x-ndjson'
+    items = [json.loads(line) for line in ndjson.data.decode('utf8').splitlines()]
+    assert items == response.json
+
+    text = test_client.get('/api.txt').data.decode('utf8')
+    assert text.startswith('---\n\n')
+    assert text.count('Question:\n') == len(questions)
+
+# pylint:disable-next=redefined-outer-name
+def test_change_feed(flask_app):
+    "Can a consumer page through the changes and then only get new ones?"
+    test_client = flask_app.test_client()
+    cursor, ids, more = '', [], True
+    while more:
+        response = test_client.get('/api/changes', query_string={'since': cursor, 'limit': 2})
+        ids += [change['id'] for change in response.json['changes'] if not change['removed']]
+        cursor, more = response.json['cursor'], response.json['more']
+    assert sorted(ids) == sorted(entry['id'] for entry in get_db().faq_entries())
+    assert not test_client.get(f'/api/changes?since={cursor}').json['changes']
+
+    # Only the edited entry is sent after an edit.
+    def query(statement):
+        return statement.where(FAQEntry.id == 1)
+
+    def update(item):
+        item.timestamp = datetime.now()
+
+    get_db().update_item(query, update)
+    response = test_client.get(f'/api/changes?since={cursor}')
+    assert [change['id'] for change in response.json['changes']] == [1]
+    assert response.json['cursor'] != cursor
+    assert test_client.get('/api/changes?since=tomorrow').status_code == 400
+
+# pylint:disable-next=redefined-outer-name
+def test_built_assets(flask_app):
+    "Do pages link to the built stylesheets, which are cached forever?"
+    test_client = flask_app.test_client()
+    PAGE_CACHE.clear()
+    base_css = ASSET_MANIFEST['/base.css']
+    assert base_css.encode('utf8') in test_client.get('/').data
+    response = test_client.get(base_css, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/css'
+    assert response.content_encoding == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert test_client.get(base_css).content_encoding is None
+    assert test_client.get('/assets/manifest.json').status_code == 404
+
+# pylint:disable-next=redefined-outer-name
+def test_profiled_requests(flask_app):
+    "Can admins, and only admins, profile a request and find it on the profiles page?"
+    test_client = flask_app.test_client()
+    assert 'X-Profile' not in test_client.get('/?profile=1').headers
+    assert test_client.get('/admin-profiles.html').status_code == 403
+
+    with test_client.session_transaction() as admin_session:
+        admin_session['username'] = 'admin'
+        admin_session['user_id'] = 1
+    response = test_client.get('/faq-search.html?profile=1')
+    name = response.headers['X-Profile']
+    # The profile is saved once the streamed page has been sent.
+    assert response.data
+    response.close()
+    assert name.encode('utf8') in test_client.get('/admin-profiles.html').data
+    profile = test_client.get(f'/admin-profiles/{name}.json').json
+    assert profile['path'] == '/faq-search.html?profile=1'
+    assert profile['sql_count'] > 0
+    folded = test_client.get(f'/admin-profiles/{name}.folded')
+    assert folded.mimetype == 'text/plain'
+    assert sum(int(line.rsplit(b' ', 1)[1]) for line in folded.data.splitlines()) == \
+        profile['samples']
+    assert test_client.get('/admin-profiles/missing.folded').status_code == 404
+
+def test_lazy_imports():
+    "Does importing the website leave the chatbot, the search, and the sample data for later?"
+    lazy = ['openai', 'irc', 'whoosh', 'numpy', 'vts.sample_faq', 'vts.test_data']
+    process = subprocess.run([sys.executable, '-c',
+                              'import sys, vts.website; print(" ".join(sys.modules))'],
+                             capture_output=True, text=True, check=True)
+    imported = process.stdout.split()
+    assert [module for module in lazy if module in imported] == []
+
+# pylint:disable-next=redefined-outer-name
+def test_ready(flask_app):
+    "Does /ready report a cold app as not ready and warm it up?"
+    test_client = flask_app.test_client()
+    assert test_client.get('/ready').json == {'ready': True}
+    READY.clear()
+    response = test_client.get('/ready')
+    assert response.status_code == 503
+    assert response.json == {'ready': False}
+    assert READY.wait(timeout=60)
+    assert test_client.get('/ready').status_code == 200
+    # Pages wait for the warm-up instead of failing.
+    READY.clear()
+    assert test_client.get('/').status_code == 200
+    assert READY.is_set()
+
 def test_how_to_page():
     "Does the data sent to the template for the how-to page match expectations?"
     page_data = create_how_to_page(None)
@@ -188,3 +509,80 @@ def test_how_to_template(client):
     "Does the how-to template return HTTP 200?"
     response = client.get('/how-to.html')
     assert response.status_code == 200
+
+# pylint:disable-next=redefined-outer-name
+def test_faq_search_within_category(sqlite_db, tmp_path):
+    "Does a search within a category use both the query and the category?"
+    build_index(sqlite_db, str(tmp_path))
+    category_id = sqlite_db.faq_categories_by_name()['Registration']
+    everything = faq_nonadmin(sqlite_db, 'class OR credits', str(tmp_path))
+    page_data = faq_nonadmin(sqlite_db, 'class OR credits', str(tmp_path), str(category_id))
+    assert page_data['selected_category'] == 'Registration'
+    assert page_data['category_counts'] == everything['category_counts']
+    assert page_data['faq_items']
+    assert len(page_data['faq_items']) == everything['category_counts'][category_id]
+    assert all(item['category_id'] == category_id for item in page_data['faq_items'])
+
+# pylint:disable-next=redefined-outer-name
+def test_metrics(flask_app):
+    "Does /metrics report the requests by route and the page cache?"
+    test_client = flask_app.test_client()
+    assert test_client.get('/faq/1').status_code == 200
+    response = test_client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'vts_http_requests_total{route="faq_item_page",method="GET",status="200"}' in text
+    assert 'vts_http_request_duration_seconds_count{route="faq_item_page",method="GET"}' in text
+    assert 'vts_cache_requests_total{cache="page",result="miss"}' in text
+    assert 'vts_search_index_segments' in text
+
+# pylint:disable-next=redefined-outer-name
+def test_busy_chatbot(flask_app, tmp_path, monkeypatch):
+    "Are messages beyond the limits answered at once with FAQ suggestions?"
+    test_client = flask_app.test_client()
+    full = ConcurrencyLimit(str(tmp_path), limit=0, max_waiting=0, wait_seconds=0)
+    monkeypatch.setattr(chat, '_LIMITS', {'session': TokenBuckets(rate=0.001, burst=0),
+                                          'address': TokenBuckets(rate=1.0, burst=1),
+                                          'concurrency': full})
+    response = test_client.post('/message', json={'message': 'room swipe access'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 1
+    assert '/faq/' in response.json['unformatted_reply']
+    assert 'dept@cs.umbc.edu' in response.json['unformatted_reply']
+
+    monkeypatch.setattr(chat, '_LIMITS', {'session': TokenBuckets(rate=1.0, burst=1),
+                                          'address': TokenBuckets(rate=1.0, burst=1),
+                                          'concurrency': full})
+    response = test_client.post('/message', json={'message': 'room swipe access'})
+    assert response.status_code == 503
+    assert 'too many questions' in response.json['unformatted_reply']
+
+# pylint:disable-next=redefined-outer-name
+def test_admin_batch_api(flask_app):
+    "Can admins, and only admins, add and remove FAQ entries with one batch each?"
+    test_client = flask_app.test_client()
+    create = {'operations': [{'op': 'create', 'type': 'faq', 'category_id': 1,
+                              'question': 'Where is the batch office?',
+                              'answer': 'Next to the *bulk* office.'},
+                             {'op': 'delete', 'type': 'faq', 'id': 999999}]}
+    assert test_client.post('/api/admin/batch', json=create).status_code == 403
+
+    with test_client.session_transaction() as admin_session:
+        admin_session['username'] = 'admin'
+        admin_session['user_id'] = 1
+    assert test_client.post('/api/admin/batch', data='{}').status_code == 415
+    assert test_client.post('/api/admin/batch', json=[]).status_code == 400
+    response = test_client.post('/api/admin/batch', json=create)
+    assert response.json['applied']
+    created, missing = response.json['results']
+    assert created['ok'] and not missing['ok']
+    faq_id = created['id']
+    item = test_client.get(f'/faq/{faq_id}.json').json
+    assert '<em>bulk</em>' in item['answer_html']
+    assert faq_id in search_faq_ids('batch office', flask_app.instance_path)
+
+    response = test_client.post('/api/admin/batch', json={
+        'operations': [{'op': 'delete', 'type': 'faq', 'id': faq_id}], 'atomic': True})
+    assert response.json['applied']
+    assert test_client.get(f'/faq/{faq_id}.json').status_code == 404
+    assert faq_id not in search_faq_ids('batch office', flask_app.instance_path)
@@ -0,0 +1,166 @@
+"""
+Admission control for the chatbot.
+
+Every chat message holds a worker for the whole round trip to the
+agent, so a burst of chat users could take every worker from the FAQ
+pages and overrun the agent. Each client therefore gets token buckets
+(one for its chat session and one for its address, since a client can
+drop its cookie), and only so many messages are sent to the agent at a
+time. A few more may wait briefly for a free slot; the rest are turned
+away at once.
+
+The slots are lock files in the instance directory, so the limit holds
+for all the worker processes of a pre-fork server together, while the
+token buckets and the waiting messages are counted per process.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+from contextlib import ExitStack
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator
+
+from vts.locks import LockTimeout
+from vts.locks import file_lock
+
+# The lock files of the chat slots, under the Flask instance path
+SLOTS_DIR_NAME = "chat_slots"
+
+# How often, in seconds, a waiting message checks for a free slot
+POLL_INTERVAL = 0.05
+
+# How many clients' buckets are kept before the full ones are dropped
+MAX_CLIENTS = 10000
+
+class TokenBuckets:
+    """
+    A token bucket for each client that refills at rate tokens per
+    second up to burst tokens. Every message takes a token.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # The tokens of each client and when they were last counted
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.lock = threading.Lock()
+
+    def take(self, client: str) -> float:
+        """
+        Takes a token from the client's bucket. Returns 0 if there was
+        one, or else how many seconds until there is.
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets[client] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self.buckets[client] = (tokens - 1, now)
+            if len(self.buckets) > self.max_clients:
+                self._drop_full(now)
+            return 0.0
+
+    def wait(self, client: str) -> float:
+        "How many seconds until the client's bucket has a token, without taking it."
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def _drop_full(self, now: float) -> None:
+        "Drops the buckets that have refilled, which are the same as new ones."
+        full = [client for client, (tokens, updated) in self.buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for client in full:
+            del self.buckets[client]
+
+class ConcurrencyLimit:
+    """
+    Lets at most limit messages through at once across every process
+    using the same instance directory, with up to max_waiting more per
+    process waiting up to wait_seconds for a slot.
+    """
+
+    def __init__(self, instance_path: str, limit: int, max_waiting: int, wait_seconds: float):
+        self.directory = os.path.join(instance_path, SLOTS_DIR_NAME)
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.wait_seconds = wait_seconds
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def slot(self) -> Iterator[bool]:
+        "Holds a slot while the message is answered. Yields whether one was free in time."
+        with ExitStack() as stack:
+            yield self._enter_slot(stack)
+
+    @asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[bool]:
+        "Like slot(), but waits for a free slot on the event loop instead of in a thread."
+        with ExitStack() as stack:
+            yield await self._enter_slot_async(stack)
+
+    def _enter_slot(self, stack: ExitStack) -> bool:
+        "Takes a free slot, waiting for one if few others are waiting."
+        if self._take_free_slot(stack):
+            return True
+        if not self._start_waiting():
+            return False
+        try:
+            deadline = time.monotonic() + self.wait_seconds
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                if self._take_free_slot(stack):
+                    return True
+            return False
+        finally:
+            self._stop_waiting()
+
+    async def _enter_slot_async(self, stack: ExitStack) -> bool:
+        "Takes a free slot, waiting for one without blocking the event loop."
+        if self._take_free_slot(stack):
+            return True
+        if not self._start_waiting():
+            return False
+        try:
+            deadline = time.monotonic() + self.wait_seconds
+            while time.monotonic() < deadline:
+                await asyncio.sleep(POLL_INTERVAL)
+                if self._take_free_slot(stack):
+                    return True
+            return False
+        finally:
+            self._stop_waiting()
+
+    def _start_waiting(self) -> bool:
+        "Counts one more waiting message, unless max_waiting are waiting already."
+        with self.lock:
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+            return True
+
+    def _stop_waiting(self) -> None:
+        "Counts one less waiting message."
+        with self.lock:
+            self.waiting -= 1
+
+    def _take_free_slot(self, stack: ExitStack) -> bool:
+        "Takes the first slot that is free, if any."
+        for i in range(self.limit):
+            try:
+                stack.enter_context(file_lock(os.path.join(self.directory, f"{i}.lock"),
+                                              timeout=0))
+                return True
+            except LockTimeout:
+                continue
+        return False
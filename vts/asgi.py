@@ -0,0 +1,229 @@
+"""
+An ASGI entry point that answers chat messages without holding a
+thread while they wait for the chat server or the agent.
+
+Under the WSGI app, every chat message holds a worker thread for the
+whole IRC round trip or agent call, which often takes seconds. Served
+by an ASGI server instead, e.g.
+
+    uvicorn --workers 2 vts.asgi:app
+
+chat messages are awaited on the event loop, so each worker process
+can keep many conversations waiting at once. Every other route is
+still served by the Flask app, unchanged, on a small pool of threads.
+The chat messages go through the same Flask request hooks (the
+session, the metrics, the warm-up) and the same chat limits as they
+do under WSGI.
+"""
+
+import asyncio
+import io
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Coroutine, Iterable, Optional
+
+from flask import Response, request
+from werkzeug.exceptions import HTTPException
+
+from vts.config import load_config_section
+from vts.website import app as flask_app
+from vts.website import ensure_warm
+from vts.website import suggest_faq_entries
+
+# How many threads serve the routes that aren't awaited, per worker
+# process. This can be overridden by threads in the [asgi] section of
+# the config.
+WSGI_THREADS = 8
+
+Scope = dict[str, Any]
+Receive = Callable[[], Coroutine[Any, Any, dict]]
+Send = Callable[[dict], Coroutine[Any, Any, None]]
+
+# The thread pool, which is created on first use so that it is made
+# after a pre-fork server has forked its workers
+_STATE: dict = {}
+
+async def message():
+    "Calls the async chatbot reply function, which returns a JSON result."
+    # Note: The first message pays for importing openai, once per worker.
+    #
+    # pylint:disable-next=import-outside-toplevel
+    from vts.chat import reply_to_message_async
+    return await reply_to_message_async(suggest_faq_entries)
+
+# The routes that are awaited on the event loop, by their endpoint in
+# the Flask app
+ASYNC_VIEWS = {'message': message}
+
+def _executor() -> ThreadPoolExecutor:
+    "The threads that serve the Flask app."
+    if 'executor' not in _STATE:
+        threads = load_config_section('asgi').get('threads', WSGI_THREADS)
+        _STATE['executor'] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+    return _STATE['executor']
+
+def wsgi_environ(scope: Scope, body: bytes) -> dict:
+    "The WSGI environ of an ASGI HTTP request, with its whole body."
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {'REQUEST_METHOD': scope['method'],
+               'SCRIPT_NAME': root_path.encode('utf8').decode('latin1'),
+               'PATH_INFO': path.encode('utf8').decode('latin1'),
+               'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+               'SERVER_NAME': server[0],
+               'SERVER_PORT': str(server[1]),
+               'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+               'REMOTE_ADDR': client[0],
+               'wsgi.version': (1, 0),
+               'wsgi.url_scheme': scope.get('scheme', 'http'),
+               'wsgi.input': io.BytesIO(body),
+               'wsgi.errors': sys.stderr,
+               'wsgi.multithread': True,
+               'wsgi.multiprocess': True,
+               'wsgi.run_once': False}
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        text = value.decode('latin1')
+        if key in environ:
+            # HTTP/2 can split the cookies over several headers.
+            text = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + text
+        environ[key] = text
+    # The whole body has been read, so its length is known even if it
+    # was sent in chunks.
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+async def read_body(receive: Receive) -> bytes:
+    "Reads the whole body of a request."
+    body = bytearray()
+    while True:
+        event = await receive()
+        if event['type'] != 'http.request':
+            return bytes(body)
+        body += event.get('body', b'')
+        if not event.get('more_body'):
+            return bytes(body)
+
+def response_start(status: str, headers: list[tuple[str, str]]) -> dict:
+    "The ASGI event that starts a response with a WSGI status and headers."
+    return {'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in headers]}
+
+def run_wsgi(environ: dict, send: Callable[[dict], None]) -> None:
+    "Serves a request with the Flask app in a thread, sending the response as it is made."
+    started: dict = {}
+
+    def send_body(data: bytes, more_body: bool) -> None:
+        if 'sent' not in started:
+            send(response_start(*started['response']))
+            started['sent'] = True
+        if data or not more_body:
+            send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and 'sent' in started:
+            raise exc_info[1].with_traceback(exc_info[2])
+        started['response'] = (status, headers)
+        return lambda data: send_body(data, True)
+
+    app_iter: Iterable[bytes] = flask_app(environ, start_response)
+    try:
+        for chunk in app_iter:
+            send_body(chunk, True)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+    send_body(b'', False)
+
+async def serve_wsgi(environ: dict, send: Send) -> None:
+    "Serves a request with the Flask app on the thread pool."
+    loop = asyncio.get_running_loop()
+
+    def send_from_thread(event: dict) -> None:
+        asyncio.run_coroutine_threadsafe(send(event), loop).result()
+
+    await loop.run_in_executor(_executor(), run_wsgi, environ, send_from_thread)
+
+async def dispatch(view: Callable[..., Awaitable[Any]]) -> Response:
+    "Runs the Flask request hooks around an awaited view, like Flask does around its views."
+    try:
+        response = flask_app.preprocess_request()
+        if response is None:
+            response = await view(**(request.view_args or {}))
+    # Note: Flask turns any error into an error page the same way.
+    #
+    # pylint:disable-next=broad-exception-caught
+    except Exception as e:
+        response = flask_app.handle_user_exception(e)
+    return flask_app.finalize_request(response)
+
+async def serve_async(view: Callable[..., Awaitable[Any]], environ: dict, send: Send) -> None:
+    """
+    Serves a request with an awaited view in a Flask request context.
+    The context lives in the request's task, so requests on the same
+    event loop each have their own.
+    """
+    context = flask_app.request_context(environ)
+    error: Optional[BaseException] = None
+    try:
+        try:
+            context.push()
+            response = await dispatch(view)
+        # Note: This is how Flask handles errors outside of the views.
+        #
+        # pylint:disable-next=broad-exception-caught
+        except Exception as e:
+            error = e
+            response = flask_app.handle_exception(e)
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        await send(response_start(status, headers))
+        try:
+            for chunk in app_iter:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        context.pop(error)
+
+def endpoint(environ: dict) -> Optional[str]:
+    "The Flask endpoint of a request, if it has one."
+    try:
+        return flask_app.url_map.bind_to_environ(environ).match()[0]
+    except HTTPException:
+        return None
+
+async def lifespan(receive: Receive, send: Send) -> None:
+    "Warms the app up when the server starts, before it takes requests."
+    while True:
+        event = await receive()
+        if event['type'] == 'lifespan.startup':
+            await asyncio.get_running_loop().run_in_executor(_executor(), ensure_warm)
+            await send({'type': 'lifespan.startup.complete'})
+        elif event['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    "The ASGI app, which awaits the routes in ASYNC_VIEWS and serves the rest with Flask."
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    environ = wsgi_environ(scope, await read_body(receive))
+    view = ASYNC_VIEWS.get(endpoint(environ) or '')
+    if view is None:
+        await serve_wsgi(environ, send)
+    else:
+        await serve_async(view, environ, send)
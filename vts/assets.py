@@ -0,0 +1,179 @@
+"""
+The build step for the stylesheets and the static files.
+
+The CSS templates are rendered once and every asset is written to the
+instance directory under a name with a hash of its content, e.g.
+`base.1a2b3c4d5e6f.css`, with gzip (and Brotli, when the optional
+`brotli` library is installed) variants next to it. A hashed name
+never changes its content, so browsers can cache it forever and pages
+refer to the hashed URLs through the manifest.
+
+References between assets (the `@import` of base.css, the images used
+by the CSS and the JavaScript) are rewritten to the hashed URLs before
+an asset is hashed, so changing an image also changes the name of
+every stylesheet that uses it.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+from typing import Callable
+
+from vts.compression import available_encodings
+from vts.compression import compress
+
+# The built assets and their manifest, under the Flask instance path
+ASSETS_DIR_NAME = "assets"
+MANIFEST_FILE_NAME = "manifest.json"
+
+# The URL prefix that the built assets are served under
+ASSETS_URL = "/assets/"
+
+# One year, the longest lifetime browsers honor
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+HASH_LENGTH = 12
+
+# The CSS templates in build order. Every other stylesheet imports
+# base.css, so it has to be built first.
+CSS_TEMPLATES = ["base.css", "main-page.css", "faq-search.css", "how-to.css",
+                 "admin-login.css", "admin-faq-search.css", "admin-add.css",
+                 "admin-edit.css", "admin-remove.css", "chat.css"]
+
+# The assets that refer to other assets by URL
+REWRITTEN_EXTENSIONS = ('.css', '.js')
+
+# Images other than SVG are already compressed.
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg')
+
+# Smaller files gain nothing from compression.
+MIN_COMPRESSED_SIZE = 256
+
+# The file name suffixes of the precompressed variants
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+_URL_PATTERN = re.compile(r'(?<=["\'(])/[\w./-]+')
+
+def static_dir() -> str:
+    "The directory of the static files that are shipped with the code."
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+def templates_dir() -> str:
+    "The directory of the templates, including the CSS templates."
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+def assets_path(instance_path: str) -> str:
+    "The directory that the assets are built into."
+    return os.path.join(instance_path, ASSETS_DIR_NAME)
+
+def static_files() -> list[str]:
+    "The paths of the static files, relative to the static directory."
+    files = []
+    for root, _, filenames in os.walk(static_dir()):
+        for filename in filenames:
+            files.append(os.path.relpath(os.path.join(root, filename), static_dir()))
+    return sorted(files)
+
+def rewrite_urls(text: str, manifest: dict[str, str]) -> str:
+    "Replaces the URLs of the assets that are already built with their hashed URLs."
+    return _URL_PATTERN.sub(lambda match: manifest.get(match.group(0), match.group(0)), text)
+
+def hashed_name(name: str, content: bytes) -> str:
+    "Adds the hash of the content to a file name, before its extension."
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{extension}"
+
+def _write_file(path: str, content: bytes) -> None:
+    "Writes a file atomically, so that a server never sends half of it."
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', mode='wb') as file:
+        file.write(content)
+    os.replace(path + '.tmp', path)
+
+def write_asset(instance_path: str, url: str, content: bytes, manifest: dict[str, str]) -> None:
+    "Writes an asset and its compressed variants under its hashed name."
+    name = hashed_name(url.lstrip('/'), content)
+    path = os.path.join(assets_path(instance_path), name)
+    _write_file(path, content)
+    if url.endswith(COMPRESSED_EXTENSIONS) and len(content) >= MIN_COMPRESSED_SIZE:
+        for encoding in available_encodings():
+            compressed = compress(content, encoding, best=True)
+            if len(compressed) < len(content):
+                _write_file(path + SUFFIXES[encoding], compressed)
+    manifest[url] = ASSETS_URL + name
+
+def build_assets(instance_path: str, render_css: Callable[[str], str]) -> dict[str, str]:
+    """
+    Builds every asset and writes the manifest, which maps each
+    original URL (e.g. /base.css or /static/chat.js) to its hashed
+    URL. The CSS templates are rendered with render_css. Returns the
+    manifest.
+    """
+    manifest: dict[str, str] = {}
+    # The files that other files refer to are built first.
+    files = sorted(static_files(), key=lambda name: name.endswith(REWRITTEN_EXTENSIONS))
+    for name in files:
+        with open(os.path.join(static_dir(), name), mode='rb') as file:
+            content = file.read()
+        url = '/static/' + name.replace(os.sep, '/')
+        if name.endswith(REWRITTEN_EXTENSIONS):
+            content = rewrite_urls(content.decode('utf8'), manifest).encode('utf8')
+        write_asset(instance_path, url, content, manifest)
+    for name in CSS_TEMPLATES:
+        css = rewrite_urls(render_css(name), manifest)
+        write_asset(instance_path, '/' + name, css.encode('utf8'), manifest)
+    path = os.path.join(assets_path(instance_path), MANIFEST_FILE_NAME)
+    with open(path + '.tmp', mode='w', encoding='utf8') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+def load_manifest(instance_path: str) -> dict[str, str]:
+    "Loads the manifest of the built assets, if they were built."
+    try:
+        with open(os.path.join(assets_path(instance_path), MANIFEST_FILE_NAME),
+                  encoding='utf8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def assets_are_stale(instance_path: str) -> bool:
+    "Is there no build yet, or has a CSS template or a static file changed since?"
+    try:
+        built = os.path.getmtime(os.path.join(assets_path(instance_path), MANIFEST_FILE_NAME))
+    except OSError:
+        return True
+    sources = [os.path.join(static_dir(), name) for name in static_files()] + \
+        [os.path.join(templates_dir(), name) for name in CSS_TEMPLATES]
+    return any(os.path.getmtime(source) > built for source in sources)
+
+def templates_version(manifest: dict[str, str]) -> str:
+    "A hash of the templates and the built assets that pages link to."
+    digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode('utf8'))
+    for name in sorted(os.listdir(templates_dir())):
+        with open(os.path.join(templates_dir(), name), mode='rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:HASH_LENGTH]
+
+def templates_modified(instance_path: str) -> float:
+    "When the templates or the built assets that pages link to last changed."
+    paths = [os.path.join(templates_dir(), name) for name in os.listdir(templates_dir())] + \
+        [os.path.join(assets_path(instance_path), MANIFEST_FILE_NAME)]
+    return max(os.path.getmtime(path) for path in paths if os.path.exists(path))
+
+def encoded_variant(instance_path: str, name: str, accepted: Callable[[str], bool]) -> tuple:
+    """
+    Picks the best precompressed variant of a built asset that the
+    client accepts. Returns the file name and its encoding, which is
+    None for the uncompressed file.
+    """
+    for encoding in available_encodings():
+        suffix = SUFFIXES[encoding]
+        if accepted(encoding) and \
+           os.path.isfile(os.path.join(assets_path(instance_path), name + suffix)):
+            return name + suffix, encoding
+    return name, None
@@ -0,0 +1,95 @@
+"""
+Checks admin logins without letting them take over the server.
+
+A bcrypt check deliberately takes a lot of CPU, so the checks run on a
+small pool of threads (bcrypt releases the GIL while it hashes) with a
+bounded queue, and a login that finds the queue full is turned away at
+once instead of holding a worker. Repeated failures from an address
+are throttled before any hashing is done, so a login flood can't be
+used to burn CPU either. Failures aren't counted by username, since
+then anyone who knows the name could keep its admin locked out.
+
+The bcrypt work factor can be set in the config. Hashes with another
+work factor are replaced after the next successful login.
+"""
+
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from vts.admission import TokenBuckets
+from vts.config import load_config_section
+from vts.database import AppDatabase
+
+# The login settings. Each can be overridden in the [auth] section of
+# the config. The failure rate is how many failed logins per second are
+# allowed for an address after the first few.
+AUTH_SETTINGS = {'bcrypt_rounds': 12,
+                 'hash_workers': 2,
+                 'max_pending': 8,
+                 'failure_rate': 1 / 60,
+                 'failure_burst': 5}
+
+class LoginBusy(Exception):
+    "Too many logins were already being checked."
+
+class LoginThrottled(Exception):
+    "There were too many failed logins. The argument is how many seconds to wait."
+
+# The pool, the bound on the logins that are waiting for it, and the
+# failure buckets, set up on first use
+_STATE: dict = {}
+_STATE_LOCK = threading.Lock()
+
+def auth_settings() -> dict:
+    "The login settings, from the config."
+    return {**AUTH_SETTINGS, **load_config_section('auth')}
+
+def _reset_after_fork() -> None:
+    "Leaves the pool of the parent process behind, since its threads aren't forked."
+    _STATE.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _state() -> dict:
+    "The pool and the failure buckets, which are created on first use."
+    with _STATE_LOCK:
+        if not _STATE:
+            settings = auth_settings()
+            _STATE['settings'] = settings
+            _STATE['pool'] = ThreadPoolExecutor(max_workers=settings['hash_workers'],
+                                                thread_name_prefix='bcrypt')
+            _STATE['pending'] = threading.BoundedSemaphore(settings['hash_workers'] +
+                                                           settings['max_pending'])
+            _STATE['addresses'] = TokenBuckets(settings['failure_rate'],
+                                               settings['failure_burst'])
+        return _STATE
+
+def check_login(db: AppDatabase,
+                username: str,
+                password: str,
+                pwhash,
+                address: str) -> Optional[int]:
+    """
+    Checks a login on the bcrypt pool and returns the user ID if it
+    is valid. Raises LoginThrottled if the address had too many failed
+    logins, and LoginBusy if too many logins are waiting for the pool.
+    """
+    state = _state()
+    retry_after = state['addresses'].wait(address)
+    if retry_after:
+        raise LoginThrottled(retry_after)
+    if not state['pending'].acquire(blocking=False):
+        raise LoginBusy()
+    try:
+        future = state['pool'].submit(db.check_user_login, username, password, pwhash,
+                                      state['settings']['bcrypt_rounds'])
+        user_id = future.result()
+    finally:
+        state['pending'].release()
+    if not user_id:
+        state['addresses'].take(address)
+    return user_id
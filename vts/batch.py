@@ -0,0 +1,123 @@
+"""
+Batches of admin changes to the FAQ, sent as JSON by scripts.
+
+A batch is an object with a list of operations:
+
+    {"operations": [
+        {"op": "create", "type": "faq", "question": "...", "answer": "...",
+         "category_id": 1, "priority": 5},
+        {"op": "update", "type": "faq", "id": 3, "answer": "..."},
+        {"op": "delete", "type": "faq", "id": 4},
+        {"op": "reorder", "type": "faq", "ids": [7, 3, 5]},
+        {"op": "create", "type": "category", "name": "...", "priority": 2},
+        {"op": "update", "type": "category", "id": 2, "name": "..."},
+        {"op": "delete", "type": "category", "id": 6},
+        {"op": "reorder", "type": "category", "ids": [2, 1]}],
+     "atomic": false}
+
+Updates only change the fields that they have, and reordering gives the
+listed items the priorities 1, 2, 3, and so on. This module only
+checks the shape of the operations; whether the items they refer to
+exist is checked by AppDatabase.apply_batch(), which applies the whole
+batch in one transaction. Every operation gets a result. Operations
+that fail are skipped, unless the batch is atomic, in which case
+nothing is applied if any of them fails.
+"""
+
+from typing import Any
+
+# The most operations in one batch
+MAX_OPERATIONS = 10000
+
+# The fields that each type of item has, with the database columns
+# that they are stored in and whether a new item needs them
+FIELDS = {'faq': {'question': ('question_text', str, True),
+                  'answer': ('answer_text', str, True),
+                  'category_id': ('category_id', int, True),
+                  'priority': ('priority', int, False)},
+          'category': {'name': ('category_name', str, True),
+                       'priority': ('priority', int, False)}}
+
+OPERATIONS = ('create', 'update', 'delete', 'reorder')
+
+class BatchError(ValueError):
+    "The batch as a whole is malformed, so none of it can be applied."
+
+def _is_int(value: Any) -> bool:
+    "Whether a JSON value is an integer (and not a boolean)."
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _fields(operation: dict, item_type: str) -> dict:
+    """
+    The fields of a create or update operation, by their database
+    columns. New items need every required field and updates need at
+    least one field.
+    """
+    fields = {}
+    for name, (column, field_type, _) in FIELDS[item_type].items():
+        if name not in operation:
+            continue
+        value = operation[name]
+        if field_type is str:
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"The {name} must be a non-empty string.")
+            value = value.strip()
+        elif not _is_int(value):
+            raise ValueError(f"The {name} must be an integer.")
+        fields[column] = value
+    if operation['op'] == 'create':
+        missing = [name for name, (column, _, required) in FIELDS[item_type].items()
+                   if required and column not in fields]
+        if missing:
+            raise ValueError(f"Creating needs the {', '.join(missing)}.")
+    elif not fields:
+        raise ValueError(f"Updating needs at least one of {', '.join(FIELDS[item_type])}.")
+    return fields
+
+def parse_operation(operation: Any) -> dict:
+    """
+    Checks the shape of one operation and returns it with its fields
+    renamed to their database columns, or with an 'error' instead.
+    """
+    try:
+        if not isinstance(operation, dict):
+            raise ValueError("The operation must be an object.")
+        op, item_type = operation.get('op'), operation.get('type')
+        if op not in OPERATIONS:
+            raise ValueError(f"The op must be one of {', '.join(OPERATIONS)}.")
+        if item_type not in FIELDS:
+            raise ValueError(f"The type must be one of {', '.join(FIELDS)}.")
+        parsed: dict = {'op': op, 'type': item_type}
+        if op == 'reorder':
+            ids = operation.get('ids')
+            if not isinstance(ids, list) or not ids or not all(_is_int(i) for i in ids):
+                raise ValueError("Reordering needs a non-empty list of ids.")
+            if len(set(ids)) != len(ids):
+                raise ValueError("Reordering can't list an id twice.")
+            parsed['ids'] = ids
+            return parsed
+        if op != 'create':
+            if not _is_int(operation.get('id')):
+                raise ValueError(f"The {op} operation needs an integer id.")
+            parsed['id'] = operation['id']
+        if op == 'delete':
+            return parsed
+        parsed['fields'] = _fields(operation, item_type)
+        return parsed
+    except ValueError as error:
+        return {'error': str(error)}
+
+def parse_batch(body: Any) -> tuple[list[dict], bool]:
+    """
+    Checks the shape of a batch and returns its parsed operations and
+    whether it is atomic. Raises BatchError if the batch isn't an
+    object with a list of up to MAX_OPERATIONS operations.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get('operations'), list):
+        raise BatchError("The batch must be an object with a list of operations.")
+    if len(body['operations']) > MAX_OPERATIONS:
+        raise BatchError(f"A batch can have at most {MAX_OPERATIONS} operations.")
+    atomic = body.get('atomic', False)
+    if not isinstance(atomic, bool):
+        raise BatchError("The atomic flag must be true or false.")
+    return [parse_operation(operation) for operation in body['operations']], atomic
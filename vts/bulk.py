@@ -0,0 +1,218 @@
+"""
+Offline bulk reprocessing of every FAQ entry.
+
+After the Markdown configuration or the search analyzer changes, or
+after importing a large FAQ, every entry has to be rendered and indexed
+again. Doing that serially in a request would take too long, so this
+job shards the entry IDs across a process pool and commits the results
+in batches. The staging index keeps the live index serving searches
+until the rebuild is done. Edits that were made to the live index in
+the meantime are reconciled into the new one when it is swapped in,
+and the similarity index is refit along with it.
+
+The progress is saved after every commit, so an interrupted job picks
+up where it left off when it is run again with the same options.
+"""
+
+import json
+import os
+import time
+
+from collections import deque
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from vts.database import AppDatabase
+from vts.render import RENDER_VERSION
+from vts.render import render_faq_html
+from vts.search import add_to_staging_index
+from vts.search import create_staging_index
+from vts.search import has_staging_index
+from vts.search import index_lock
+from vts.search import reconcile_index
+from vts.search import related_for_entries
+from vts.search import replace_index_with_staging
+from vts.search import save_related
+from vts.similarity import all_documents
+from vts.similarity import fit
+from vts.similarity import refresh_similarity_index
+from vts.similarity import save_similarity_index
+
+# The progress file, under the Flask instance path
+STATE_FILE_NAME = "reprocess_state.json"
+
+# How many entries each worker task handles
+BATCH_SIZE = 200
+
+# How many entries are written to the database and the index per commit
+COMMIT_SIZE = 2000
+
+def render_batch(entries: list[dict]) -> list[dict]:
+    "Renders a batch of entries in a worker process."
+    return [{'id': entry['id'],
+             'question_text': entry['question_text'],
+             'answer_text': entry['answer_text'],
+             **render_faq_html(entry['question_text'], entry['answer_text'])}
+            for entry in entries]
+
+def related_batch(entries: list[dict], instance_path: str) -> dict:
+    "Finds the related questions of a batch of entries in a worker process."
+    return related_for_entries(entries, instance_path)
+
+def ordered_map(executor: Executor,
+                function: Callable,
+                tasks: Iterable[tuple],
+                window: int) -> Iterator[tuple]:
+    """
+    Like executor.map(), but only window tasks are in flight at once so
+    that the tasks are read lazily. Yields each task with its result,
+    in order.
+    """
+    pending: deque = deque()
+    for task in tasks:
+        pending.append((task, executor.submit(function, *task)))
+        if len(pending) >= window:
+            task, future = pending.popleft()
+            yield task, future.result()
+    while pending:
+        task, future = pending.popleft()
+        yield task, future.result()
+
+def load_state(instance_path: str) -> dict:
+    "Loads the progress of an interrupted job, if there is one."
+    try:
+        with open(os.path.join(instance_path, STATE_FILE_NAME), encoding='utf8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(instance_path: str, state: dict) -> None:
+    "Saves the progress of the job, replacing the file atomically."
+    path = os.path.join(instance_path, STATE_FILE_NAME)
+    with open(path + '.tmp', mode='w', encoding='utf8') as file:
+        json.dump(state, file)
+    os.replace(path + '.tmp', path)
+
+def clear_state(instance_path: str) -> None:
+    "Removes the progress file of a finished job."
+    try:
+        os.remove(os.path.join(instance_path, STATE_FILE_NAME))
+    except OSError:
+        pass
+
+def batches(db: AppDatabase, faq_ids: list[int], batch_size: int) -> Iterator[tuple]:
+    "Reads the entries a batch at a time, as tasks for ordered_map()."
+    for i in range(0, len(faq_ids), batch_size):
+        yield (db.faq_entries_by_ids(faq_ids[i:i + batch_size]),)
+
+def print_progress(stage: str, done: int, total: int, start: float) -> None:
+    "Prints how far along a stage is and how fast it is going."
+    seconds = time.perf_counter() - start
+    rate = done / seconds if seconds > 0 else 0.0
+    print(f"{stage}: {done}/{total} FAQ entries ({rate:.0f} entries/s)")
+
+# Note: The stages share a lot of state and bookkeeping, so splitting
+# this up further would make it harder to follow.
+#
+# pylint:disable-next=too-many-arguments,too-many-locals,too-many-statements
+def reprocess_faq(db: AppDatabase,
+                  instance_path: str,
+                  *,
+                  workers: int = 0,
+                  render: bool = True,
+                  reindex: bool = True,
+                  restart: bool = False,
+                  batch_size: int = BATCH_SIZE,
+                  commit_size: int = COMMIT_SIZE) -> dict:
+    """
+    Renders the HTML of every FAQ entry and rebuilds the search and
+    similarity indexes with a pool of workers processes (the CPU count
+    by default).
+
+    Entries are processed in ID order and committed every commit_size
+    entries, after which the progress is saved. Unless restart is set,
+    a job with the same options resumes after the last commit. Entries
+    that are added while the job runs are picked up by the usual
+    reconciling of the index and re-rendering of stale HTML.
+
+    Returns how many entries were processed, what was reconciled after
+    the swap, and how long it took.
+    """
+    workers = workers or os.cpu_count() or 1
+    options = {'render_version': RENDER_VERSION, 'render': render, 'reindex': reindex}
+    state = load_state(instance_path)
+    if restart or state.get('options') != options or \
+       (reindex and state.get('stage') == 'entries' and not has_staging_index(instance_path)):
+        state = {'options': options, 'stage': 'entries', 'done_through': 0, 'processed': 0}
+        if reindex:
+            create_staging_index(instance_path)
+        save_state(instance_path, state)
+    report = {'resumed_from': state['done_through'], 'processed': 0, 'related': 0,
+              'reconciled': {}, 'similarity': 0}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if state['stage'] == 'entries':
+            faq_ids = sorted(faq_id for faq_id in db.faq_entry_versions()
+                             if faq_id > state['done_through'])
+            total = state['processed'] + len(faq_ids)
+            pending_entries: list[dict] = []
+            pending_html: list[dict] = []
+
+            def commit():
+                if render:
+                    db.update_rendered_html(pending_html)
+                if reindex:
+                    add_to_staging_index(db, pending_entries, instance_path, procs=workers)
+                state['done_through'] = pending_entries[-1]['id']
+                state['processed'] += len(pending_entries)
+                report['processed'] += len(pending_entries)
+                save_state(instance_path, state)
+                print_progress("Reprocessed", state['processed'], total, start)
+                pending_entries.clear()
+                pending_html.clear()
+
+            if render:
+                results = ordered_map(executor, render_batch,
+                                      batches(db, faq_ids, batch_size), window=2 * workers)
+            else:
+                results = ((task, []) for task in batches(db, faq_ids, batch_size))
+            for (entries,), rendered in results:
+                pending_entries.extend(entries)
+                pending_html.extend(rendered)
+                if len(pending_entries) >= commit_size:
+                    commit()
+            if pending_entries:
+                commit()
+            if reindex:
+                # The vectors are fitted before taking the lock so that
+                # admin edits aren't held up, and the ones made in the
+                # meantime are folded in afterwards.
+                similarity = fit(all_documents(db))
+                with index_lock(instance_path):
+                    replace_index_with_staging(instance_path)
+                    report['reconciled'] = reconcile_index(db, instance_path)
+                    save_similarity_index(instance_path, similarity)
+                    refresh_similarity_index(db, instance_path)
+                report['similarity'] = len(similarity.docs)
+            state['stage'] = 'related' if reindex else 'done'
+            save_state(instance_path, state)
+
+        if state['stage'] == 'related':
+            faq_ids = sorted(db.faq_entry_versions())
+            related: dict = {}
+            tasks = ((entries, instance_path)
+                     for (entries,) in batches(db, faq_ids, batch_size))
+            for _, batch_related in ordered_map(executor, related_batch, tasks,
+                                                window=2 * workers):
+                related.update(batch_related)
+                print_progress("Related questions", len(related), len(faq_ids), start)
+            with index_lock(instance_path):
+                save_related(instance_path, related)
+            report['related'] = len(related)
+
+    clear_state(instance_path)
+    report['seconds'] = time.perf_counter() - start
+    report['workers'] = workers
+    return report
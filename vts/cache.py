@@ -0,0 +1,158 @@
+"""
+An in-memory cache of rendered pages.
+
+Each cached page is tagged with what it was rendered from, such as
+`faq:3` for a page that shows FAQ entry 3 or `categories` for a page
+with the category menu. A write then invalidates exactly the pages
+with its tags instead of flushing everything. The cache is per
+process and bounded, dropping the least recently used page first.
+
+A page can also be cached with the version of the content that it was
+rendered from, in which case it is only used for that version. That
+catches writes made by other processes, which can't invalidate tags.
+The compressed bodies of a page are cached with it and removed with it.
+The content version itself is cached for a moment, so a burst of hits
+doesn't read it from the database for every page, and is read again
+after any invalidation, so this process's own writes show at once.
+"""
+
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+# The tag of every page that lists all FAQ entries or searches them,
+# so any added, edited, or removed entry could change it.
+ALL_FAQ_TAG = 'faq-all'
+
+# The tag of every page that shows the category menu.
+CATEGORIES_TAG = 'categories'
+
+def faq_tag(faq_id: int) -> str:
+    "The tag of the pages that show the given FAQ entry."
+    return f'faq:{faq_id}'
+
+def category_tag(category_id: int) -> str:
+    "The tag of the pages that list the entries of the given category."
+    return f'category:{category_id}'
+
+# Note: The pages, their tags, the content version, and the statistics
+# all need to be kept together under one lock.
+#
+# pylint:disable-next=too-many-instance-attributes
+class PageCache():
+    """
+    A thread-safe least recently used cache of rendered pages with
+    tag-based invalidation.
+    """
+    def __init__(self, max_pages: int = 512, version_ttl: float = 1.0):
+        self.max_pages = max_pages
+        self.version_ttl = version_ttl
+        # When the cached content version expires, and the version
+        self.version: Optional[tuple[float, Any]] = None
+        # Counts the invalidations, so that a version that was read
+        # before one isn't cached after it
+        self.generation = 0
+        self.pages: OrderedDict[tuple, tuple[str, frozenset[str], str, dict[str, bytes]]] = \
+            OrderedDict()
+        self.tags: dict[str, set[tuple]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def content_version(self, load: Callable[[], Any]) -> Any:
+        """
+        The content version, which load() reads. It is reused for
+        version_ttl seconds, or until pages are invalidated.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.version is not None and now < self.version[0]:
+                return self.version[1]
+            generation = self.generation
+        version = load()
+        with self.lock:
+            if generation == self.generation:
+                self.version = (now + self.version_ttl, version)
+        return version
+
+    def get(self, key: tuple, version: str = '') -> Optional[str]:
+        "Gets a cached page, or None if it is not cached for this version."
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None or page[2] != version:
+                self.misses += 1
+                return None
+            self.pages.move_to_end(key)
+            self.hits += 1
+            return page[0]
+
+    def put(self, key: tuple, html: str, tags: Iterable[str], version: str = '') -> None:
+        "Caches a page with the tags of everything that it was rendered from."
+        tags = frozenset(tags)
+        with self.lock:
+            self._remove(key)
+            self.pages[key] = (html, tags, version, {})
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.pages) > self.max_pages:
+                self._remove(next(iter(self.pages)))
+
+    def get_compressed(self, key: tuple, encoding: str, version: str = '') -> Optional[bytes]:
+        "Gets the body of a cached page compressed with the encoding, if it was cached."
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None or page[2] != version:
+                return None
+            return page[3].get(encoding)
+
+    def put_compressed(self, key: tuple, encoding: str, body: bytes, version: str = '') -> None:
+        "Caches the compressed body of a page that is still cached for this version."
+        with self.lock:
+            page = self.pages.get(key)
+            if page is not None and page[2] == version:
+                page[3][encoding] = body
+
+    def invalidate(self, *tags: str) -> int:
+        "Removes every page with any of the given tags. Returns how many were removed."
+        with self.lock:
+            self._forget_version()
+            keys: set[tuple] = set()
+            for tag in tags:
+                keys.update(self.tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        "Removes every page."
+        with self.lock:
+            self._forget_version()
+            self.pages.clear()
+            self.tags.clear()
+
+    def stats(self) -> dict:
+        "Reports the size and hit counts of the cache."
+        with self.lock:
+            return {'pages': len(self.pages),
+                    'max_pages': self.max_pages,
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+    def _forget_version(self) -> None:
+        "Makes the next page read the content version again. The lock must be held."
+        self.version = None
+        self.generation += 1
+
+    def _remove(self, key: tuple) -> None:
+        "Removes one page and its tags. The lock must be held."
+        page = self.pages.pop(key, None)
+        if page is None:
+            return
+        for tag in page[1]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
@@ -5,15 +5,45 @@ This is a separate file to keep the website.py part of the chatbot
 code as trivial as possible.
 """
 
-from flask import request, jsonify
+import asyncio
+import secrets
+import threading
 
-from markdown_it import MarkdownIt
+from typing import Callable
 
-from vts.chat_server import create_guest_bot
+from flask import Response, current_app, request, jsonify, session
 
-from vts.config import ConfigPathError, load_config
+from vts.admission import ConcurrencyLimit, TokenBuckets
 
-from vts.llm import AgentConfigError, chat_with_agent
+from vts.chat_server import create_guest_bot, create_guest_bot_async
+
+from vts.config import ConfigPathError, load_config, load_config_section
+
+from vts.llm import AgentConfigError, ask_agent_async, chat_with_agent
+
+from vts.metrics import increment
+
+from vts.render import render_markdown
+
+CONTACT_INFO = "You can email the CSEE department at **dept@cs.umbc.edu** " \
+    "or call **410-455-3500**.\n"
+
+# The admission limits of the chatbot. Each can be overridden in the
+# [chat] section of the config. The rates are messages per second.
+CHAT_LIMITS = {'max_concurrent': 4,
+               'max_waiting': 8,
+               'wait_seconds': 5.0,
+               'session_rate': 0.2,
+               'session_burst': 5,
+               'address_rate': 1.0,
+               'address_burst': 20}
+
+# How many FAQ entries are suggested when the chatbot is too busy
+BUSY_SUGGESTIONS = 3
+
+# The token buckets and the concurrency limit, set up on first use
+_LIMITS: dict = {}
+_LIMITS_LOCK = threading.Lock()
 
 def get_reply(user_text: str) -> str:
     "Get the agent reply for the given user text."
@@ -29,14 +59,111 @@ def get_reply(user_text: str) -> str:
             print(reply)
         # provide contact information
         else:
-            reply = "I'm sorry, but the connection to the agent is unavailable. " \
-                "You can email the CSEE department at **dept@cs.umbc.edu** " \
-                "or call **410-455-3500**.\n"
+            reply = "I'm sorry, but the connection to the agent is unavailable. " + CONTACT_INFO
+    return reply
+
+async def get_reply_async(user_text: str) -> str:
+    "Get the agent reply for the given user text, awaiting the chat server or the agent."
+    reply = await create_guest_bot_async(user_text)
+    # try directly in memoryless mode because the indirect step failed
+    if not reply:
+        config = load_config()
+        if 'agent' in config:
+            print(user_text)
+            reply = await ask_agent_async(user_text)
+            print(reply)
+        else:
+            reply = "I'm sorry, but the connection to the agent is unavailable. " + CONTACT_INFO
     return reply
 
-def reply_to_message():
-    "This function gets text and makes a reply using get_echo_output"
+def chat_limits() -> dict:
+    "The token buckets and the concurrency limit of the chatbot."
+    with _LIMITS_LOCK:
+        if not _LIMITS:
+            limits = {**CHAT_LIMITS, **load_config_section('chat')}
+            _LIMITS['session'] = TokenBuckets(limits['session_rate'], limits['session_burst'])
+            _LIMITS['address'] = TokenBuckets(limits['address_rate'], limits['address_burst'])
+            _LIMITS['concurrency'] = ConcurrencyLimit(current_app.instance_path,
+                                                      limits['max_concurrent'],
+                                                      limits['max_waiting'],
+                                                      limits['wait_seconds'])
+        return _LIMITS
+
+def wait_for_tokens() -> float:
+    """
+    Takes a token for the message from the buckets of its chat session
+    and its address. Returns 0 if it may be answered, or else how many
+    seconds the client should wait.
+    """
+    limits = chat_limits()
+    if 'chat_id' not in session:
+        session['chat_id'] = secrets.token_hex(8)
+    return limits['session'].take(session['chat_id']) or \
+        limits['address'].take(request.remote_addr or '')
+
+def busy_reply(suggestions: list[dict]) -> str:
+    "The reply when the chatbot is too busy, with FAQ entries that might answer the message."
+    reply = "I'm sorry, but I'm answering too many questions right now. " \
+        "Please try again in a minute.\n\n"
+    if suggestions:
+        reply += "These FAQ entries might answer your question:\n\n"
+        reply += ''.join(f"- [{entry['question']}]({entry['url']})\n" for entry in suggestions)
+        reply += "\n"
+    return reply + CONTACT_INFO
+
+def reply_json(reply: str) -> Response:
+    "The reply as JSON, rendered and as the Markdown text."
+    return jsonify({"reply": render_markdown(reply, breaks=False),
+                    "unformatted_reply": reply})
+
+def busy_response(suggestions: list[dict], status: int, retry_after: float) -> Response:
+    "Turns a message away at once with the busy reply."
+    response = reply_json(busy_reply(suggestions))
+    response.status_code = status
+    response.retry_after = max(1, round(retry_after))
+    return response
+
+def reply_to_message(suggest_faq: Callable[[str, int], list[dict]]):
+    """
+    This function gets text and makes a reply using get_echo_output,
+    unless the client sends too many messages or the chatbot is too
+    busy. Then suggest_faq() gives the FAQ entries (with a question
+    and a url) that the busy reply suggests instead.
+    """
+    user_text = request.json.get("message", "")
+    retry_after = wait_for_tokens()
+    if retry_after:
+        increment('vts_chat_messages_total', ('rate_limited',))
+        return busy_response(suggest_faq(user_text, BUSY_SUGGESTIONS), 429, retry_after)
+    with chat_limits()['concurrency'].slot() as admitted:
+        if not admitted:
+            increment('vts_chat_messages_total', ('over_capacity',))
+            return busy_response(suggest_faq(user_text, BUSY_SUGGESTIONS), 503, 1)
+        increment('vts_chat_messages_total', ('admitted',))
+        return reply_with_agent(user_text)
+
+async def reply_to_message_async(suggest_faq: Callable[[str, int], list[dict]]):
+    """
+    Like reply_to_message(), but the message waits for its slot and
+    for the reply on the event loop, so it doesn't hold a thread. The
+    FAQ suggestions, which search the index, are made in a thread.
+    """
     user_text = request.json.get("message", "")
+    retry_after = wait_for_tokens()
+    if retry_after:
+        increment('vts_chat_messages_total', ('rate_limited',))
+        suggestions = await asyncio.to_thread(suggest_faq, user_text, BUSY_SUGGESTIONS)
+        return busy_response(suggestions, 429, retry_after)
+    async with chat_limits()['concurrency'].async_slot() as admitted:
+        if not admitted:
+            increment('vts_chat_messages_total', ('over_capacity',))
+            suggestions = await asyncio.to_thread(suggest_faq, user_text, BUSY_SUGGESTIONS)
+            return busy_response(suggestions, 503, 1)
+        increment('vts_chat_messages_total', ('admitted',))
+        return await reply_with_agent_async(user_text)
+
+def config_error_reply(error: Exception) -> str:
+    "The reply when the chatbot isn't configured correctly."
     # Note: These error strings probably should be logged or printed
     # instead of being exposed in the chat reply to the end user like
     # this. However, if only developers, testers, and graders are
@@ -44,13 +171,22 @@ def reply_to_message():
     # immediately. Change the error handling to log the error message
     # and send the generic contact information error if you deploy the
     # application.
+    if isinstance(error, ConfigPathError):
+        return f"Error in configuration path: The file {error.args[0]} does not exist."
+    return f"Error in configuration file: The required agent field '{error.args[0]}' is missing."
+
+def reply_with_agent(user_text: str) -> Response:
+    "Gets the reply to the message as JSON."
     try:
         reply = get_reply(user_text)
-    except ConfigPathError as e:
-        reply = f"Error in configuration path: The file {e.args[0]} does not exist."
-    except AgentConfigError as e:
-        reply = f"Error in configuration file: The required agent field '{e.args[0]}' is missing."
-    md = MarkdownIt('commonmark', {'breaks':False, 'html':True}).enable('table')
-    json_reply = jsonify({"reply": md.render(reply),
-                          "unformatted_reply": reply})
-    return json_reply
+    except (ConfigPathError, AgentConfigError) as e:
+        reply = config_error_reply(e)
+    return reply_json(reply)
+
+async def reply_with_agent_async(user_text: str) -> Response:
+    "Awaits the reply to the message as JSON."
+    try:
+        reply = await get_reply_async(user_text)
+    except (ConfigPathError, AgentConfigError) as e:
+        reply = config_error_reply(e)
+    return reply_json(reply)
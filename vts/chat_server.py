@@ -9,6 +9,7 @@ unexpectedly.
 
 """
 
+import asyncio
 import re
 
 from typing import Optional
@@ -17,11 +18,14 @@ from time import sleep
 
 from irc.bot import SingleServerIRCBot
 from irc.bot import ServerSpec
+from irc.client_aio import AioSimpleIRCClient
 
 from vts.config import load_config
 
 from vts.llm import chat_with_agent
 
+from vts.metrics import timed
+
 MAX_SESSIONS = 12
 LINE_LIMIT = 450
 
@@ -30,6 +34,9 @@ LINE_LIMIT = 450
 # line.
 END_MSG = 'gsM dnE'
 
+# How long, in seconds, the async guest bot waits for the whole reply
+GUEST_TIMEOUT = 120.0
+
 def split_whitespace(line: str, too_long: int) -> tuple[str, Optional[str], bool]:
     """
     Attempts to split at the first whitespace of the midpoint of a
@@ -153,6 +160,52 @@ class GuestBot(SingleServerIRCBot):
         # Make sure to truncate the message
         c.privmsg(f'#s{self.session}', message[:400])
 
+class AioGuestBot(AioSimpleIRCClient):
+    """
+    The guest bot on an asyncio event loop, which sends one message and
+    sets the reply as the result of a future.
+    """
+    def __init__(self, message: str):
+        super().__init__()
+        self.outgoing_message = message
+        self.incoming_messages: list[str] = []
+        self.session = 0
+        self.reply: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    # pylint:disable-next=unused-argument
+    def on_welcome(self, c, e):
+        "Autojoin a channel and send the message; ignore e"
+        c.join(f'#s{self.session}')
+        print(self.outgoing_message)
+        # Make sure to truncate the message
+        c.privmsg(f'#s{self.session}', self.outgoing_message[:400])
+
+    def on_pubmsg(self, c, e):
+        "Collect the lines of the reply until the end message."
+        if e.source.nick != 'bot' or self.reply.done():
+            return
+        message = e.arguments[0]
+        if message == END_MSG:
+            self.reply.set_result('\n'.join(self.incoming_messages))
+            print(self.reply.result())
+            c.disconnect()
+        else:
+            self.incoming_messages.append(message)
+
+    # pylint:disable-next=unused-argument
+    def on_disconnect(self, c, e):
+        "Stop waiting if the server hangs up first; ignore c and e"
+        if not self.reply.done():
+            self.reply.set_exception(ConnectionError("The chat server disconnected."))
+
+def guest_server() -> ServerSpec:
+    "The chat server that the guest bot connects to."
+    config = load_config()
+    if "chat_server" in config:
+        config = config["chat_server"]
+        return ServerSpec(config["domain"], 6667, config["key"])
+    return ServerSpec("127.0.0.1", 6667)
+
 def create_bot():
     "Creates the bot."
     config = load_config()
@@ -167,14 +220,10 @@ def create_bot():
     bot = LlmBot([server], 'bot', 'bot')
     bot.start()
 
+@timed('irc')
 def create_guest_bot(message: str) -> Optional[str]:
     "Creates the guest bot."
-    config = load_config()
-    if "chat_server" in config:
-        config = config["chat_server"]
-        server = ServerSpec(config["domain"], 6667, config["key"])
-    else:
-        server = ServerSpec("127.0.0.1", 6667)
+    server = guest_server()
     # Note that any error at all in the try/except block means return
     # None, which will tell the caller to use the fallback instead.
     try:
@@ -192,6 +241,28 @@ def create_guest_bot(message: str) -> Optional[str]:
     except:
         return None
 
+@timed('irc')
+async def create_guest_bot_async(message: str) -> Optional[str]:
+    """
+    Sends the message through the guest bot like create_guest_bot(),
+    but awaits the reply on the event loop instead of holding a thread.
+    """
+    server = guest_server()
+    try:
+        bot = AioGuestBot(message)
+        await bot.connection.connect(server.host, server.port, 'guest', server.password)
+        try:
+            return await asyncio.wait_for(bot.reply, GUEST_TIMEOUT)
+        finally:
+            bot.connection.disconnect()
+    # Note: As in create_guest_bot(), any error means falling back on
+    # the agent, but a cancelled request must still be cancelled, so
+    # this can't be a bare except.
+    #
+    # pylint:disable-next=broad-exception-caught
+    except Exception:
+        return None
+
 # The bot connects to a server such as the one from `python3 -m irc.server`
 #
 # That means the bot, the server, and Flask are all running as processes.
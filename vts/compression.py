@@ -0,0 +1,82 @@
+"""
+Compressing responses with gzip or Brotli, whichever the client
+prefers. Brotli is only offered when the optional `brotli` library is
+installed.
+"""
+
+import gzip
+import zlib
+
+from typing import Callable, Iterable, Iterator, Optional
+
+try:
+    import brotli
+except ImportError:
+    # Note: Only gzip is offered without it.
+    #
+    # pylint:disable-next=invalid-name
+    brotli = None
+
+# Responses smaller than this are sent as they are because compressing
+# them saves less than it costs.
+MIN_COMPRESSED_SIZE = 1024
+
+# The responses that are worth compressing. Images other than SVG are
+# already compressed.
+COMPRESSED_MIMETYPES = frozenset(['text/html', 'text/css', 'text/plain',
+                                  'text/javascript', 'application/javascript',
+                                  'application/json', 'application/x-ndjson',
+                                  'image/svg+xml'])
+
+# The levels used for responses that are compressed as they are sent,
+# which favor speed, and for files that are compressed once when they
+# are built, which favor size.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+BEST_GZIP_LEVEL = 9
+BEST_BROTLI_QUALITY = 11
+
+def available_encodings() -> list[str]:
+    "The encodings that responses can be compressed with, in order of preference."
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def choose_encoding(quality: Callable[[str], float]) -> Optional[str]:
+    """
+    Picks the encoding that the client prefers, given the quality of
+    each encoding in its Accept-Encoding header. Returns None if it
+    accepts none of them.
+    """
+    best = None
+    best_quality = 0.0
+    for encoding in available_encodings():
+        if quality(encoding) > best_quality:
+            best, best_quality = encoding, quality(encoding)
+    return best
+
+def compress(content: bytes, encoding: str, best: bool = False) -> bytes:
+    "Compresses the content with the encoding, as small as possible if best is set."
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(content, quality=BEST_BROTLI_QUALITY if best else BROTLI_QUALITY)
+    # The fixed mtime gives the same output for the same content.
+    return gzip.compress(content, compresslevel=BEST_GZIP_LEVEL if best else GZIP_LEVEL, mtime=0)
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Compresses a streamed response. Every chunk is flushed as soon as
+    it is compressed, so the client gets the page as it is rendered.
+    """
+    if encoding == 'br' and brotli is not None:
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    # wbits of 31 writes the gzip header and trailer.
+    deflate = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = deflate.compress(chunk) + deflate.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield deflate.flush()
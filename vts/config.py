@@ -18,11 +18,24 @@ def get_config_path():
     cfg_dir = os.path.join(xdg_config_home(), "vts/")
     return os.path.join(cfg_dir, "config.toml")
 
+# The last config that was loaded, with the path, the modification
+# time, and the size of the file that it was loaded from
+_LOADED: dict = {}
+
 def load_config() -> dict:
-    "Loads the config.toml file from the vts directory."
+    """
+    Loads the config.toml file from the vts directory. The file is only
+    parsed again after it changes, so the dict is shared and must not be
+    modified.
+    """
     cfg_path = get_config_path()
 
     try:
+        stat = os.stat(cfg_path)
+        version = (cfg_path, stat.st_mtime_ns, stat.st_size)
+        loaded = _LOADED.get('config')
+        if loaded is not None and loaded[0] == version:
+            return loaded[1]
         with open(cfg_path, "rb") as file:
             cfg = tomllib.load(file)
     # Ignore Pylint's suggestion, we only need the path here.
@@ -31,6 +44,7 @@ def load_config() -> dict:
     except FileNotFoundError:
         raise ConfigPathError(get_config_path())
 
+    _LOADED['config'] = (version, cfg)
     return cfg
 
 def load_postgres_config() -> Optional[dict]:
@@ -47,3 +61,12 @@ def load_postgres_config() -> Optional[dict]:
         if "username" in db_cfg and "password" in db_cfg:
             return db_cfg
     return None
+
+def load_config_section(name: str) -> dict:
+    "Loads one optional table of the config, which is empty if it doesn't exist."
+    try:
+        cfg = load_config()
+    except ConfigPathError:
+        return {}
+    section = cfg.get(name, {})
+    return section if isinstance(section, dict) else {}
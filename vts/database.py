@@ -5,7 +5,7 @@ database tables.
 
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import Iterator, Optional
 
 # Imports for the SQL tables
 from sqlalchemy import Boolean
@@ -13,6 +13,7 @@ from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy import String
+from sqlalchemy import Text
 from sqlalchemy import URL
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
@@ -21,8 +22,14 @@ from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 # Imports for the SQL database itself
 from sqlalchemy import create_engine
+from sqlalchemy import bindparam
 from sqlalchemy import delete
+from sqlalchemy import and_
+from sqlalchemy import insert
+from sqlalchemy import inspect
+from sqlalchemy import or_
 from sqlalchemy import select
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 # ORM Database Tables/Classes
@@ -53,7 +60,8 @@ class User(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     campus_id: Mapped[str] = mapped_column(String(10))
     email: Mapped[str] = mapped_column(String(50))
-    name: Mapped[str] = mapped_column(String(50))
+    # Note: Every login looks the user up by name.
+    name: Mapped[str] = mapped_column(String(50), index=True)
     password: Mapped[str] = mapped_column(String(60))
     is_admin: Mapped[bool] = mapped_column(Boolean)
 
@@ -122,9 +130,21 @@ class FAQEntry(Base):
     # It wants to use the invalid func.now instead of func.now()
     #
     # pylint:disable-next=not-callable
-    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True),
+                                                server_default=func.now(),
+                                                index=True)
     # Mark entry as removed before batch deletion.
     is_removed: Mapped[bool] = mapped_column(Boolean, default=False)
+    # The question and answer rendered as HTML when they were written,
+    # and the version of the renderer that rendered them. Entries that
+    # have not been rendered by the current renderer are rendered
+    # again, so these are a cache and never the source of truth.
+    question_html: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    answer_html: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    render_version: Mapped[int] = mapped_column(Integer, default=0)
+    # The content version of the last write to the entry, which orders
+    # the change feed.
+    change_version: Mapped[int] = mapped_column(Integer, default=0, index=True)
 
     def __repr__(self) -> str:
         return f"FAQEntry(id={self.id!r}, " \
@@ -146,6 +166,58 @@ class FAQEntry(Base):
                 'category' : self.category.category_name,
                 'author' : self.author.name,
                 'priority' : self.priority,
+                'timestamp': self.timestamp,
+                'question_html': self.question_html,
+                'answer_html': self.answer_html,
+                'render_version': self.render_version}
+
+class ContentVersion(Base):
+    """
+    The version of the content, a single row that every write to the
+    FAQ entries or the categories increases. Together with the newest
+    FAQ entry timestamp, this tells clients whether a page changed
+    without rendering it.
+    """
+    __tablename__ = "content_version"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return f"ContentVersion(id={self.id!r}, " \
+            f"version={self.version!r}, " \
+            f"timestamp={self.timestamp!r})"
+
+    def asdict(self) -> dict:
+        "Turn the object into a key/value dictionary for APIs that expect this."
+        return {'id': self.id,
+                'version': self.version,
+                'timestamp': self.timestamp}
+
+class FAQTombstone(Base):
+    """
+    A record of an FAQ entry that was deleted from the database, so
+    that the change feed still reports it as removed.
+    """
+    __tablename__ = "faq_tombstone"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    faq_id: Mapped[int] = mapped_column(Integer)
+    change_version: Mapped[int] = mapped_column(Integer, index=True)
+    timestamp: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"FAQTombstone(id={self.id!r}, " \
+            f"faq_id={self.faq_id!r}, " \
+            f"change_version={self.change_version!r}, " \
+            f"timestamp={self.timestamp!r})"
+
+    def asdict(self) -> dict:
+        "Turn the object into a key/value dictionary for APIs that expect this."
+        return {'id': self.id,
+                'faq_id': self.faq_id,
+                'change_version': self.change_version,
                 'timestamp': self.timestamp}
 
 # Application Representation of the Database
@@ -169,13 +241,42 @@ def create_postgres_url(username: str,
                       host=host,
                       database='umbc-triage')
 
+def hash_rounds(password_hash: str | bytes) -> Optional[int]:
+    "The work factor of a bcrypt hash, which looks like $2b$12$..., if it is one."
+    if isinstance(password_hash, bytes):
+        password_hash = password_hash.decode('ascii', errors='replace')
+    parts = password_hash.split('$')
+    return int(parts[2]) if len(parts) > 3 and parts[2].isdigit() else None
+
 def results_as_dicts(results) -> list[dict]:
     "Turn database results into a simple format for the frontend."
     return [result.asdict() for result in results]
 
-def delete_marked_items(engine, table):
-    "Deletes the items of the table that are marked for deletion."
+def bump_content_version(session: Session) -> int:
+    """
+    Increases the content version in the same transaction as a write
+    and returns the new version. The row stays locked until the write
+    commits, so versions are in commit order.
+    """
+    table = Base.metadata.tables[ContentVersion.__tablename__]
+    statement = table.update().values(version=table.c.version + 1, timestamp=datetime.now())
+    return session.execute(statement.returning(table.c.version)).scalar_one()
+
+def mark_changed(items: list, version: int) -> None:
+    "Records the content version of a write on the FAQ entries that it wrote."
+    for item in items:
+        if isinstance(item, FAQEntry):
+            item.change_version = version
+
+def delete_marked_items(engine, table, before_delete=None):
+    """
+    Deletes the items of the table that are marked for deletion. The
+    optional before_delete function is called with the session first,
+    in the same transaction.
+    """
     with Session(engine) as session:
+        if before_delete is not None:
+            before_delete(session)
         # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
         # pylint:disable-next=singleton-comparison
         statement = delete(table).where(table.is_removed == True)
@@ -184,6 +285,170 @@ def delete_marked_items(engine, table):
         session.commit()
         return result_ids
 
+class BatchItemError(ValueError):
+    "An operation of a batch refers to an item that doesn't exist or would break a rule."
+
+# How many items are loaded per query before a batch is applied
+BATCH_LOAD_SIZE = 500
+
+def _batch_faq_entry(batch: dict, faq_id: int) -> FAQEntry:
+    "An FAQ entry that an operation of a batch refers to."
+    entry = batch['session'].get(FAQEntry, faq_id)
+    if entry is None or entry.is_removed:
+        raise BatchItemError(f"FAQ entry #{faq_id} does not exist.")
+    return entry
+
+def _batch_category(batch: dict, category_id: int) -> FAQCategory:
+    "A category that an operation of a batch refers to."
+    category = batch['session'].get(FAQCategory, category_id)
+    if category is None or category.is_removed:
+        raise BatchItemError(f"Category #{category_id} does not exist.")
+    return category
+
+def _check_category_name(batch: dict, name: str, category_id: Optional[int] = None) -> None:
+    "Makes sure that no other category has the name (case-insensitive)."
+    statement = select(FAQCategory.id)
+    statement = statement.where(func.lower(FAQCategory.category_name) == name.lower())
+    # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+    # pylint:disable-next=singleton-comparison
+    statement = statement.where(FAQCategory.is_removed == False)
+    if any(found != category_id for found in batch['session'].scalars(statement)):
+        raise BatchItemError(f'A category named "{name}" already exists.')
+
+def _note_faq_change(batch: dict, entry: FAQEntry, change: str) -> None:
+    """
+    Notes how an FAQ entry changed and the category it is in. An entry
+    that was added or edited earlier in the batch is only reordered
+    if it is reordered afterwards.
+    """
+    if change != 'reordered' or entry.id not in batch['faq']:
+        batch['faq'][entry.id] = change
+    batch['category_ids'].add(entry.category_id)
+
+def _create_faq(batch: dict, operation: dict) -> dict:
+    "Creates an FAQ entry."
+    fields = operation['fields']
+    _batch_category(batch, fields['category_id'])
+    entry = FAQEntry(author_id=batch['author_id'],
+                     timestamp=batch['now'],
+                     **fields,
+                     **batch['render'](fields['question_text'], fields['answer_text']))
+    batch['session'].add(entry)
+    batch['session'].flush()
+    _note_faq_change(batch, entry, 'added')
+    return {'id': entry.id}
+
+def _update_faq(batch: dict, operation: dict) -> dict:
+    "Updates the given fields of an FAQ entry, rendering it again if its text changed."
+    entry = _batch_faq_entry(batch, operation['id'])
+    fields = operation['fields']
+    if 'category_id' in fields:
+        _batch_category(batch, fields['category_id'])
+        batch['category_ids'].add(entry.category_id)
+    for column, value in fields.items():
+        setattr(entry, column, value)
+    if 'question_text' in fields or 'answer_text' in fields:
+        for column, value in batch['render'](entry.question_text, entry.answer_text).items():
+            setattr(entry, column, value)
+    entry.author_id = batch['author_id']
+    entry.timestamp = batch['now']
+    _note_faq_change(batch, entry, 'edited')
+    return {'id': entry.id}
+
+def _delete_faq(batch: dict, operation: dict) -> dict:
+    "Marks an FAQ entry as removed."
+    entry = _batch_faq_entry(batch, operation['id'])
+    entry.is_removed = True
+    entry.timestamp = batch['now']
+    _note_faq_change(batch, entry, 'removed')
+    return {'id': entry.id}
+
+def _reorder_faq(batch: dict, operation: dict) -> dict:
+    "Gives the listed FAQ entries the priorities 1, 2, 3, and so on."
+    entries = [_batch_faq_entry(batch, faq_id) for faq_id in operation['ids']]
+    for priority, entry in enumerate(entries, start=1):
+        if entry.priority != priority:
+            entry.priority = priority
+            _note_faq_change(batch, entry, 'reordered')
+    return {'ids': operation['ids']}
+
+def _create_category(batch: dict, operation: dict) -> dict:
+    "Creates a category."
+    _check_category_name(batch, operation['fields']['category_name'])
+    category = FAQCategory(**operation['fields'])
+    batch['session'].add(category)
+    batch['session'].flush()
+    batch['categories'] = True
+    return {'id': category.id}
+
+def _update_category(batch: dict, operation: dict) -> dict:
+    "Renames a category or changes its priority."
+    category = _batch_category(batch, operation['id'])
+    name = operation['fields'].get('category_name', category.category_name)
+    if name.lower() != category.category_name.lower():
+        _check_category_name(batch, name, category.id)
+    if name != category.category_name:
+        batch['renamed'].add(category.id)
+    for column, value in operation['fields'].items():
+        setattr(category, column, value)
+    batch['categories'] = True
+    return {'id': category.id}
+
+def _delete_category(batch: dict, operation: dict) -> dict:
+    "Marks a category as removed if no FAQ entry is in it."
+    category = _batch_category(batch, operation['id'])
+    statement = select(func.count()).select_from(FAQEntry)
+    statement = statement.where(FAQEntry.category_id == category.id)
+    # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+    # pylint:disable-next=singleton-comparison
+    statement = statement.where(FAQEntry.is_removed == False)
+    if batch['session'].scalar(statement):
+        raise BatchItemError(f'Category "{category.category_name}" is in use by FAQ entries.')
+    category.is_removed = True
+    batch['categories'] = True
+    return {'id': category.id}
+
+def _reorder_categories(batch: dict, operation: dict) -> dict:
+    "Gives the listed categories the priorities 1, 2, 3, and so on."
+    categories = [_batch_category(batch, category_id) for category_id in operation['ids']]
+    for priority, category in enumerate(categories, start=1):
+        category.priority = priority
+    batch['categories'] = True
+    return {'ids': operation['ids']}
+
+# The function that applies each kind of operation in a batch
+BATCH_OPERATIONS = {('create', 'faq'): _create_faq,
+                    ('update', 'faq'): _update_faq,
+                    ('delete', 'faq'): _delete_faq,
+                    ('reorder', 'faq'): _reorder_faq,
+                    ('create', 'category'): _create_category,
+                    ('update', 'category'): _update_category,
+                    ('delete', 'category'): _delete_category,
+                    ('reorder', 'category'): _reorder_categories}
+
+def _load_batch_entries(session: Session, operations: list[dict]) -> list[FAQEntry]:
+    """
+    Loads the FAQ entries that the operations refer to with a few
+    queries instead of one per operation. The session finds them by ID
+    as long as the returned list keeps them alive.
+    """
+    faq_ids = set()
+    for operation in operations:
+        if operation.get('type') == 'faq':
+            faq_ids.update(operation.get('ids', [operation.get('id')]))
+    faq_ids.discard(None)
+    ids = sorted(faq_ids)
+    entries: list[FAQEntry] = []
+    for start in range(0, len(ids), BATCH_LOAD_SIZE):
+        statement = select(FAQEntry).where(FAQEntry.id.in_(ids[start:start + BATCH_LOAD_SIZE]))
+        entries.extend(session.scalars(statement))
+    return entries
+
+# Note: Every query the application needs is a method here so that the
+# rest of the application doesn't talk to SQLAlchemy directly. That
+# means a lot of public methods.
+#
+# pylint:disable-next=too-many-public-methods
 class AppDatabase():
     """
     The application database.
@@ -211,6 +476,44 @@ class AppDatabase():
     def initialize_metadata(self):
         "Create all of the ORM table metadata for a brand new database."
         Base.metadata.create_all(self.engine)
+        self.add_content_version()
+
+    def add_content_version(self):
+        "Adds the row of the content version if it is missing."
+        with Session(self.engine) as session:
+            if session.get(ContentVersion, 1) is None:
+                session.add(ContentVersion(id=1, version=0, timestamp=datetime.now()))
+                session.commit()
+
+    def upgrade_schema(self) -> list[str]:
+        """
+        Adds the tables, columns, and indexes that were added to the
+        ORM tables after an existing database was created. Returns the
+        added tables and columns.
+        """
+        added = []
+        inspector = inspect(self.engine)
+        with self.engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    table.create(connection)
+                    added.append(table.name)
+                    continue
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    column_type = column.type.compile(dialect=self.engine.dialect)
+                    default = ''
+                    if column.default is not None and column.default.is_scalar:
+                        default = f' DEFAULT {getattr(column.default, "arg")!r}'
+                    connection.execute(text(f'ALTER TABLE "{table.name}" '
+                                            f'ADD COLUMN "{column.name}" {column_type}{default}'))
+                    added.append(f'{table.name}.{column.name}')
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
+        self.add_content_version()
+        return added
 
     def generate_password_hash(self, password, pwhash):
         "Use the pwhash object to generate a password hash of password."
@@ -222,8 +525,17 @@ class AppDatabase():
             statement = select(User)
             return results_as_dicts(session.scalars(statement))
 
-    def check_user_login(self, username: str, password: str, pwhash) -> Optional[int]:
-        "Verifies that the password matches for the given username, checked by pwhash."
+    def check_user_login(self,
+                         username: str,
+                         password: str,
+                         pwhash,
+                         rounds: Optional[int] = None) -> Optional[int]:
+        """
+        Verifies that the password matches for the given username,
+        checked by pwhash. If rounds is given, a matching password
+        that was hashed with another work factor is hashed again with
+        rounds.
+        """
         with Session(self.engine) as session:
             statement = select(User).where(User.name == username)
             result = session.scalars(statement)
@@ -234,6 +546,9 @@ class AppDatabase():
                 return False
             password_status = pwhash.check_password_hash(user.password, password)
             if password_status:
+                if rounds is not None and hash_rounds(user.password) != rounds:
+                    user.password = pwhash.generate_password_hash(password, rounds)
+                    session.commit()
                 return user.id
             return None
 
@@ -241,6 +556,7 @@ class AppDatabase():
         "Uses a session to add and commit exactly one item to the database."
         with Session(self.engine) as session:
             session.add(item)
+            mark_changed([item], bump_content_version(session))
             session.commit()
             return item.id
 
@@ -248,6 +564,7 @@ class AppDatabase():
         "Uses a session to add and commit a list of items to the database."
         with Session(self.engine) as session:
             session.add_all(items)
+            mark_changed(items, bump_content_version(session))
             session.commit()
 
     def update_item(self, query, update):
@@ -267,8 +584,71 @@ class AppDatabase():
             statement = query(statement)
             result = session.scalars(statement).one()
             update(result)
+            mark_changed([result], bump_content_version(session))
             session.commit()
 
+    def apply_batch(self,
+                    operations: list[dict],
+                    author_id: int,
+                    render,
+                    atomic: bool = False) -> dict:
+        """
+        Applies a batch of parsed operations (see vts/batch.py) to the
+        FAQ entries and categories in one transaction with one content
+        version. The render function renders the question and answer
+        text of an entry for storing with it.
+
+        Returns the 'results' of the operations in order, whether the
+        batch was 'applied' (an atomic batch with a failed operation
+        and a batch where nothing succeeded are not), and what changed:
+        the 'faq' entry IDs with how each changed ('added', 'edited',
+        'removed', or 'reordered'), the 'category_ids' of the entries,
+        whether the 'categories' changed, and the 'reindex_ids' of the
+        entries in renamed categories.
+        """
+        with Session(self.engine) as session:
+            batch: dict = {'session': session,
+                           'author_id': author_id,
+                           'render': render,
+                           'now': datetime.now(),
+                           'faq': {},
+                           'category_ids': set(),
+                           'categories': False,
+                           'renamed': set()}
+            batch['loaded'] = _load_batch_entries(session, operations)
+            results = []
+            for operation in operations:
+                if 'error' in operation:
+                    results.append({'ok': False, 'error': operation['error']})
+                    continue
+                try:
+                    apply = BATCH_OPERATIONS[(operation['op'], operation['type'])]
+                    results.append({'ok': True, **apply(batch, operation)})
+                except BatchItemError as error:
+                    results.append({'ok': False, 'error': str(error)})
+            succeeded = [result['ok'] for result in results]
+            if not any(succeeded) or (atomic and not all(succeeded)):
+                session.rollback()
+                return {'results': results, 'applied': False, 'faq': {}, 'category_ids': [],
+                        'categories': False, 'reindex_ids': []}
+            mark_changed([session.get(FAQEntry, faq_id) for faq_id in batch['faq']],
+                         bump_content_version(session))
+            reindex_ids = []
+            if batch['renamed']:
+                statement = select(FAQEntry.id)
+                statement = statement.where(FAQEntry.category_id.in_(batch['renamed']))
+                # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+                # pylint:disable-next=singleton-comparison
+                statement = statement.where(FAQEntry.is_removed == False)
+                reindex_ids = list(session.scalars(statement))
+            session.commit()
+        return {'results': results,
+                'applied': True,
+                'faq': batch['faq'],
+                'category_ids': sorted(batch['category_ids']),
+                'categories': batch['categories'],
+                'reindex_ids': reindex_ids}
+
     def faq_entry(self, faq_id: int) -> list[dict]:
         "Retrieves exactly one FAQ entry, specified by its ID."
         with Session(self.engine) as session:
@@ -279,6 +659,130 @@ class AppDatabase():
             statement = statement.order_by(FAQEntry.priority)
             return results_as_dicts(session.scalars(statement))
 
+    def faq_entries_by_ids(self, faq_ids) -> list[dict]:
+        "Retrieves the FAQ entries with the given IDs in one query (excludes removed entries)."
+        with Session(self.engine) as session:
+            statement = select(FAQEntry).where(FAQEntry.id.in_(list(faq_ids)))
+            # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+            # pylint:disable-next=singleton-comparison
+            statement = statement.where(FAQEntry.is_removed == False)
+            statement = statement.order_by(FAQEntry.priority)
+            return results_as_dicts(session.scalars(statement))
+
+    def faq_entry_versions(self) -> dict:
+        """
+        Returns a dict of FAQ entry IDs, associating them with their
+        timestamps and category IDs. This only reads three columns so
+        it is cheap enough to compare against the search index.
+        """
+        with Session(self.engine) as session:
+            statement = select(FAQEntry.id, FAQEntry.timestamp, FAQEntry.category_id)
+            # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+            # pylint:disable-next=singleton-comparison
+            statement = statement.where(FAQEntry.is_removed == False)
+            return {row.id: {'timestamp': row.timestamp, 'category_id': row.category_id}
+                    for row in session.execute(statement)}
+
+    def content_version(self) -> tuple[str, datetime]:
+        """
+        Returns a version of the FAQ entries and the categories that
+        changes with every write, and when the last write happened.
+        The newest entry timestamp is part of the version so that
+        entries written without the content version, e.g. by hand,
+        are noticed too. This is one indexed lookup.
+        """
+        with Session(self.engine) as session:
+            newest = select(func.max(FAQEntry.timestamp)).scalar_subquery()
+            statement = select(newest, ContentVersion.version, ContentVersion.timestamp)
+            row = session.execute(statement.where(ContentVersion.id == 1)).one()
+            return f'{row[1]}:{row[0]}', row[2]
+
+    def touch_content_version(self) -> int:
+        """
+        Increases the content version without another write, for changes
+        to what pages show that happen outside of the database, such as
+        a repaired search index. Every server notices it on its next
+        request. Returns the new version.
+        """
+        with Session(self.engine) as session:
+            version = bump_content_version(session)
+            session.commit()
+            return version
+
+    def faq_changes(self, version: int, faq_id: int, limit: int) -> list[dict]:
+        """
+        Retrieves up to limit FAQ entries that were added, edited, or
+        removed after the given change version, and after the given
+        entry within that version. Deleted entries come from their
+        tombstones. Each dict has the id, change_version, timestamp, and
+        is_removed, and the text and category of entries that are not
+        removed, in the order of the changes.
+        """
+        def after(version_column, id_column):
+            return or_(version_column > version,
+                       and_(version_column == version, id_column > faq_id))
+
+        with Session(self.engine) as session:
+            statement = select(FAQEntry.id, FAQEntry.change_version, FAQEntry.timestamp,
+                               FAQEntry.is_removed, FAQEntry.question_text,
+                               FAQEntry.answer_text, FAQEntry.category_id)
+            statement = statement.where(after(FAQEntry.change_version, FAQEntry.id))
+            statement = statement.order_by(FAQEntry.change_version, FAQEntry.id).limit(limit)
+            changes = [row._asdict() for row in session.execute(statement)]
+            tombstones = select(FAQTombstone.faq_id, FAQTombstone.change_version,
+                                FAQTombstone.timestamp)
+            tombstones = tombstones.where(after(FAQTombstone.change_version, FAQTombstone.faq_id))
+            tombstones = tombstones.order_by(FAQTombstone.change_version, FAQTombstone.faq_id)
+            changes += [{'id': row.faq_id,
+                         'change_version': row.change_version,
+                         'timestamp': row.timestamp,
+                         'is_removed': True}
+                        for row in session.execute(tombstones.limit(limit))]
+        changes.sort(key=lambda change: (change['change_version'], change['id']))
+        return changes[:limit]
+
+    def stale_rendered_entries(self, render_version: int, limit: int) -> list[dict]:
+        """
+        Retrieves up to limit entries whose stored HTML was not rendered
+        by the given renderer version. Only the columns that are needed
+        to render them are read.
+        """
+        with Session(self.engine) as session:
+            statement = select(FAQEntry.id, FAQEntry.question_text, FAQEntry.answer_text)
+            statement = statement.where(or_(FAQEntry.render_version.is_(None),
+                                            FAQEntry.render_version != render_version))
+            # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+            # pylint:disable-next=singleton-comparison
+            statement = statement.where(FAQEntry.is_removed == False)
+            statement = statement.order_by(FAQEntry.id).limit(limit)
+            return [row._asdict() for row in session.execute(statement)]
+
+    def update_rendered_html(self, rendered: list[dict]):
+        """
+        Stores rendered HTML for several entries in one transaction.
+        Each dict has the id, question_text, answer_text, question_html,
+        answer_html, and render_version of an entry. An entry whose text
+        changed since it was read is skipped so that newer HTML is never
+        overwritten. The timestamp is left alone because the content
+        itself did not change.
+        """
+        if not rendered:
+            return
+        table = Base.metadata.tables[FAQEntry.__tablename__]
+        statement = table.update().where(table.c.id == bindparam('b_id'),
+                                         table.c.question_text == bindparam('b_question_text'),
+                                         table.c.answer_text == bindparam('b_answer_text'))
+        rows = [{'b_id': entry['id'],
+                 'b_question_text': entry['question_text'],
+                 'b_answer_text': entry['answer_text'],
+                 'question_html': entry['question_html'],
+                 'answer_html': entry['answer_html'],
+                 'render_version': entry['render_version']}
+                for entry in rendered]
+        with Session(self.engine) as session:
+            session.execute(statement, rows)
+            session.commit()
+
     def faq_entries(self) -> list[dict]:
         "Retrieves all of the FAQ entries."
         with Session(self.engine) as session:
@@ -288,6 +792,43 @@ class AppDatabase():
             statement = statement.order_by(FAQEntry.priority)
             return results_as_dicts(session.scalars(statement))
 
+    def iter_faq_entries(self,
+                         category_id: Optional[int] = None,
+                         batch_size: int = 100) -> Iterator[dict]:
+        """
+        Yields the FAQ entries, optionally only those with the given
+        category, fetching batch_size rows at a time so that the whole
+        table is never in memory at once. The session stays open until
+        the iteration finishes or the generator is closed.
+        """
+        with Session(self.engine) as session:
+            # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+            # pylint:disable-next=singleton-comparison
+            statement = select(FAQEntry).where(FAQEntry.is_removed == False)
+            if category_id is not None:
+                statement = statement.where(FAQEntry.category_id == category_id)
+            statement = statement.order_by(FAQEntry.priority, FAQEntry.id)
+            statement = statement.execution_options(yield_per=batch_size)
+            for entry in session.scalars(statement):
+                yield entry.asdict()
+
+    def iter_faq_texts(self, batch_size: int = 500) -> Iterator[dict]:
+        """
+        Yields the ID, question text, and answer text of every FAQ
+        entry for the FAQ dumps. Only those columns are read, without
+        the relationships, batch_size rows at a time from a server-side
+        cursor where the database has one.
+        """
+        with Session(self.engine) as session:
+            statement = select(FAQEntry.id, FAQEntry.question_text, FAQEntry.answer_text)
+            # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+            # pylint:disable-next=singleton-comparison
+            statement = statement.where(FAQEntry.is_removed == False)
+            statement = statement.order_by(FAQEntry.priority, FAQEntry.id)
+            statement = statement.execution_options(yield_per=batch_size)
+            for row in session.execute(statement):
+                yield row._asdict()
+
     def remove_faq_entry(self, faq_id: int) -> bool:
         "Marks an FAQ entry with the given ID as removed."
         def query(statement):
@@ -295,6 +836,7 @@ class AppDatabase():
 
         def update(item):
             item.is_removed = True
+            item.timestamp = datetime.now()
 
         self.update_item(query, update)
 
@@ -318,6 +860,7 @@ class AppDatabase():
             statement = select(FAQCategory).where(FAQCategory.id == category_id)
             result = session.scalars(statement).one()
             result.is_removed = True
+            bump_content_version(session)
             session.commit()
 
         return True
@@ -380,12 +923,24 @@ class AppDatabase():
             result = session.scalars(statement).one()
             result.category_name = new_name
             result.priority = new_priority
+            bump_content_version(session)
             session.commit()
         return True
 
     def delete_marked_entries(self):
-        "Deletes the entries that have been marked for deletion."
-        return delete_marked_items(self.engine, FAQEntry)
+        """
+        Deletes the entries that have been marked for deletion, leaving
+        tombstones for the change feed.
+        """
+        def add_tombstones(session):
+            # Note: Pylint's style suggestion here doesn't work with SQLAlchemy's .where()
+            # pylint:disable-next=singleton-comparison
+            marked = FAQEntry.is_removed == True
+            removed = select(FAQEntry.id, FAQEntry.change_version, FAQEntry.timestamp).where(marked)
+            session.execute(insert(FAQTombstone).from_select(['faq_id', 'change_version',
+                                                              'timestamp'], removed))
+
+        return delete_marked_items(self.engine, FAQEntry, add_tombstones)
 
     def delete_marked_categories(self):
         "Deletes the categories that have been marked for deletion."
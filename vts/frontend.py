@@ -29,6 +29,7 @@ TITLES = {"main-page": "Interactive Help - UMBC Computer Science & Electrical En
           "admin-category-add": "Add New Category - Admin",
           "admin-category-edit": lambda category_id : f"Edit Category #{category_id} - Admin",
           "admin-category-remove": lambda category_id : f"Remove Category #{category_id} - Admin",
+          "admin-profiles": "Request Profiles - Admin",
           "faq-search": "Browse FAQ - Interactive Help",
           "faq-item": lambda faq_id : f"FAQ Item #{faq_id} - Interactive Help",
           "category-page": category_page_title,
@@ -12,16 +12,40 @@ SOME FUNCTOINS AND CUSTOM TYPES IN THIS FILE THAT YOU MIGHT WANT TO USE:
 - MessageType                the format for passing the chat history in multi-message chats
 """
 
+import asyncio
+import os
+import threading
+import weakref
+
 from typing import List, Dict, Tuple, Optional
 
+from openai import AsyncOpenAI
 from openai import OpenAI
+from openai import Timeout
 
 from vts.bot_logging import write_log_entry
 
 from vts.config import load_config
 
+from vts.metrics import timed
+
 FAIL_MESSAGE = "Access to agent failed. Maybe take a look at the FAQ section?"
 
+# The timeouts (in seconds) and the retries of the agent calls. Each can
+# be overridden in the [agent] section of the config. Connection
+# errors, timeouts, and 408, 409, 429, and 5xx answers are retried
+# max_retries times with a growing delay.
+AGENT_SETTINGS = {'connect_timeout': 5.0,
+                  'read_timeout': 60.0,
+                  'max_retries': 2}
+
+# The client for the current agent config, shared by every thread, and
+# the async clients by their event loop, since they can only be used
+# from the loop that they were made on
+_CLIENTS: dict = {}
+_ASYNC_CLIENTS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_CLIENTS_LOCK = threading.Lock()
+
 class AgentConfigError(Exception):
     "Error if the agent config is incorrect."
 
@@ -47,15 +71,33 @@ def load_agent_secret_config() -> Tuple[str, str]:
     access_key = cfg["key"]
     return endpoint, access_key
 
+def agent_client_options() -> dict:
+    """
+    the options of the agent client (the endpoint, the key, the
+    timeouts, and the retries) from the config
+    """
+    base_url, access_key = load_agent_secret_config()
+    settings = {**AGENT_SETTINGS, **load_config()["agent"]}
+    return {"base_url": base_url,
+            "api_key": access_key,
+            "timeout": Timeout(settings["read_timeout"], connect=settings["connect_timeout"]),
+            "max_retries": settings["max_retries"]}
+
+def _reset_after_fork() -> None:
+    "leaves the clients of the parent process behind, since their connections can't be shared"
+    _CLIENTS.clear()
+    _ASYNC_CLIENTS.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 def ask_agent_openai(input_prompt: str) -> str:
     """
     this is the main function that does the communication between here and agent
     takes user text as input_prompt and returns the model output as a string
     precondition: the configuration path exists and contains info in correct format
     """
-    base_url, key = load_agent_secret_config()
-
-    client = OpenAI(base_url=base_url, api_key=key)
+    client = get_agent_client()
 
     agent_response = client.chat.completions.create(
         model="n/a",
@@ -92,9 +134,53 @@ def get_agent_response(client, input_prompt: str):
     return FAIL_MESSAGE
 
 def get_agent_client() -> OpenAI:
-    "this function returns an OpenAI client ready to talk to the DigitalOcean agent."
-    base_url, key = load_agent_secret_config()
-    return OpenAI(base_url=base_url, api_key=key)
+    """
+    this function returns an OpenAI client ready to talk to the DigitalOcean agent
+    the client (with its pool of kept-alive connections) is shared by
+    every message and only made again when the agent config changes
+    """
+    options = agent_client_options()
+    with _CLIENTS_LOCK:
+        cached = _CLIENTS.get('client')
+        if cached is None or cached[0] != options:
+            cached = _CLIENTS['client'] = (options, OpenAI(**options))
+        return cached[1]
+
+def get_async_agent_client() -> AsyncOpenAI:
+    """
+    this function returns an asyncio OpenAI client ready to talk to the DigitalOcean agent
+    like get_agent_client(), but there is one client per event loop
+    """
+    loop = asyncio.get_running_loop()
+    options = agent_client_options()
+    with _CLIENTS_LOCK:
+        cached = _ASYNC_CLIENTS.get(loop)
+        if cached is None or cached[0] != options:
+            cached = _ASYNC_CLIENTS[loop] = (options, AsyncOpenAI(**options))
+        return cached[1]
+
+@timed('agent')
+async def ask_agent_async(input_prompt: str) -> str:
+    """
+    gets an agent response without using chat history, like
+    chat_with_agent(input_prompt, [], stateless=True), but awaits the
+    agent instead of blocking the thread while it answers
+    """
+    client = get_async_agent_client()
+    user_message = {"role": "user", "content": input_prompt}
+    agent_response = await client.chat.completions.create(
+        model="n/a",
+        messages=[user_message] # type: ignore
+    )
+
+    # Return recieved output (if it exists)
+    if agent_response.choices:
+        response = agent_response.choices[0].message.content
+        response_dict = {"role": "assistant", "content": response}
+        write_log_entry("memoryless_chat.txt", user_message, response_dict)
+        return response or FAIL_MESSAGE
+
+    return FAIL_MESSAGE
 
 # "Note that the the message type defined below should follow this structure:
 # {"role": "user"|"assistant"|"system", "content": "..."}
@@ -107,6 +193,7 @@ def get_agent_client() -> OpenAI:
 
 MessageType = Dict[str, str]   # {"role": "user"|"assistant"|"system", "content": "..."}
 
+@timed('agent')
 def chat_with_agent(new_message: Optional[str],
                     messages: List[MessageType],
                     session: int=0,
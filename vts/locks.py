@@ -0,0 +1,59 @@
+"""
+Locks that are shared by every process using the same instance
+directory, so that work which only one worker may do at a time (like
+creating the database or writing the search indexes) is not done by
+several workers at once when the app runs under a pre-fork server.
+
+The locks are advisory file locks. They are held by an open file, so
+they also keep threads of the same process apart, and the operating
+system releases them if the process dies.
+"""
+
+import os
+import time
+
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # Note: Without fcntl (on Windows) the app can only run as a single
+    # process and the locks do nothing.
+    #
+    # pylint:disable-next=invalid-name
+    fcntl = None # type: ignore
+
+# How long, in seconds, to wait for a lock by default
+LOCK_TIMEOUT = 60.0
+
+# How often, in seconds, a waiting process checks whether the lock is free
+POLL_INTERVAL = 0.05
+
+class LockTimeout(TimeoutError):
+    "Another process held the lock for longer than we were willing to wait."
+
+@contextmanager
+def file_lock(path: str, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """
+    Holds an exclusive lock on the file at path, which is created if
+    needed. Waits up to timeout seconds for another holder to release
+    it before raising LockTimeout; a timeout of 0 only tries once.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='a', encoding='utf8') as file:
+        if fcntl is not None:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError as error:
+                    if time.monotonic() >= deadline:
+                        raise LockTimeout(path) from error
+                    time.sleep(POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,312 @@
+"""
+Metrics for monitoring the app in production, served at /metrics in
+the Prometheus text format.
+
+Requests are timed per route, and the parts of a request that tend to
+be slow (searching, rendering Markdown, SQL statements, and the
+chatbot's IRC round trip and agent calls) are timed wherever they are
+called. Recording a value only takes a lock and a few additions, so
+the metrics are always on.
+
+Under a pre-fork server, every worker process keeps its own metrics
+and saves them in the instance directory every few seconds while it
+serves requests. A scrape is answered by whichever worker gets it,
+which adds its current metrics to those saved by the other workers
+that are still running.
+"""
+
+import bisect
+import inspect
+import json
+import os
+import threading
+import time
+
+from functools import wraps
+from typing import Any, Callable, Iterable, TypeVar, cast
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# The saved metrics of each worker process, under the Flask instance path
+METRICS_DIR_NAME = "metrics"
+
+# How often, in seconds, a worker saves its metrics for the others
+SNAPSHOT_INTERVAL = 5.0
+
+# The upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The type, the help text, and the label names of every metric
+METRICS = {
+    'vts_http_requests_total':
+    ('counter', "Requests served.", ('route', 'method', 'status')),
+    'vts_http_request_duration_seconds':
+    ('histogram', "Time spent serving requests.", ('route', 'method')),
+    'vts_http_requests_in_flight':
+    ('gauge', "Requests being served.", ()),
+    'vts_operation_duration_seconds':
+    ('histogram', "Time spent in parts of requests that can be slow.", ('operation',)),
+    'vts_chat_messages_total':
+    ('counter', "Chat messages, by whether they were answered or turned away.", ('result',)),
+    'vts_cache_requests_total':
+    ('counter', "Cache lookups, by whether they found what they looked for.", ('cache', 'result')),
+    'vts_cache_hit_ratio':
+    ('gauge', "Share of cache lookups that found what they looked for.", ('cache',)),
+    'vts_page_cache_pages':
+    ('gauge', "Pages in the page caches of the worker processes.", ()),
+    'vts_search_index_segments':
+    ('gauge', "Segments in the search index, which slow searches down as they add up.", ()),
+    'vts_search_index_documents':
+    ('gauge', "FAQ entries in the search index.", ()),
+}
+
+_LOCK = threading.Lock()
+
+# The values of this process, by metric name and label values. The
+# histograms count the values in each bucket (not cumulatively), then
+# those above every bucket, followed by the sum of the values.
+_VALUES: dict[str, dict[tuple, Any]] = {'counter': {}, 'gauge': {}, 'histogram': {}}
+
+# Functions that set values from elsewhere (e.g. cache statistics)
+# before the metrics are read
+_COLLECTORS: list[Callable[[], None]] = []
+
+# When this process last saved its metrics, and the lock that keeps
+# its threads from saving them at the same time
+_SAVED_AT = [0.0]
+_SAVE_LOCK = threading.Lock()
+
+Function = TypeVar('Function', bound=Callable[..., Any])
+
+def observe(name: str, seconds: float, labels: tuple = ()) -> None:
+    "Records a time in a histogram."
+    index = bisect.bisect_left(BUCKETS, seconds)
+    key = (name, labels)
+    with _LOCK:
+        values = _VALUES['histogram'].get(key)
+        if values is None:
+            values = _VALUES['histogram'][key] = [0.0] * (len(BUCKETS) + 2)
+        values[index] += 1
+        values[-1] += seconds
+
+def increment(name: str, labels: tuple = (), amount: float = 1.0) -> None:
+    "Adds to a counter or a gauge."
+    values = _VALUES[METRICS[name][0]]
+    key = (name, labels)
+    with _LOCK:
+        values[key] = values.get(key, 0.0) + amount
+
+def set_value(name: str, value: float, labels: tuple = ()) -> None:
+    "Sets a counter or a gauge that is kept elsewhere, such as by a cache."
+    with _LOCK:
+        _VALUES[METRICS[name][0]][(name, labels)] = value
+
+def add_collector(collector: Callable[[], None]) -> None:
+    "Has a function set values every time before the metrics are read."
+    _COLLECTORS.append(collector)
+
+def timed(operation: str) -> Callable[[Function], Function]:
+    """
+    Decorates a function to record how long its calls take as an
+    operation. The calls of a coroutine function are timed until they
+    are done, not just until they are started.
+    """
+    def decorate(function: Function) -> Function:
+        if inspect.iscoroutinefunction(function):
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    observe('vts_operation_duration_seconds',
+                            time.perf_counter() - start,
+                            (operation,))
+            return cast(Function, async_wrapper)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe('vts_operation_duration_seconds',
+                        time.perf_counter() - start,
+                        (operation,))
+        return cast(Function, wrapper)
+    return decorate
+
+def _before_cursor_execute(conn, *_):
+    "Notes when a statement starts."
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, *_):
+    "Records the time of a statement."
+    starts = conn.info.get('metrics_query_start')
+    if starts:
+        observe('vts_operation_duration_seconds', time.perf_counter() - starts.pop(), ('sql',))
+
+def track_sql() -> None:
+    "Starts timing every SQL statement, unless that was already started."
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+def _reset_after_fork() -> None:
+    "Starts a forked worker process with no metrics of its own."
+    # Note: Another thread of the parent may have held the lock while it
+    # forked, so the child needs a new one.
+    #
+    # pylint:disable-next=global-statement
+    global _LOCK
+    _LOCK = threading.Lock()
+    for values in _VALUES.values():
+        values.clear()
+    _SAVED_AT[0] = 0.0
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def snapshot() -> dict:
+    "The metrics of this process, as they are saved."
+    for collector in _COLLECTORS:
+        collector()
+    with _LOCK:
+        return {kind: [[name, list(labels), list(value) if kind == 'histogram' else value]
+                       for (name, labels), value in values.items()]
+                for kind, values in _VALUES.items()}
+
+def metrics_path(instance_path: str) -> str:
+    "The directory that the worker processes save their metrics in."
+    return os.path.join(instance_path, METRICS_DIR_NAME)
+
+def save_snapshot(instance_path: str, force: bool = False) -> None:
+    "Saves the metrics of this process if they weren't saved in the last SNAPSHOT_INTERVAL."
+    now = time.monotonic()
+    if not force and now - _SAVED_AT[0] < SNAPSHOT_INTERVAL:
+        return
+    # Note: Another thread that is saving them already will do, so the
+    # lock is only waited for when forced.
+    #
+    # pylint:disable-next=consider-using-with
+    if not _SAVE_LOCK.acquire(blocking=force):
+        return
+    try:
+        _SAVED_AT[0] = now
+        directory = metrics_path(instance_path)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(path + '.tmp', mode='w', encoding='utf8') as file:
+            json.dump(snapshot(), file)
+        os.replace(path + '.tmp', path)
+    finally:
+        _SAVE_LOCK.release()
+
+def _is_running(pid: int) -> bool:
+    "Whether a process is still running."
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def collect(instance_path: str) -> list[dict]:
+    """
+    The metrics of this process and the last saved metrics of the other
+    worker processes. Those of workers that are gone are removed.
+    """
+    snapshots = [snapshot()]
+    directory = metrics_path(instance_path)
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return snapshots
+    for name in names:
+        pid, _, extension = name.partition('.')
+        if extension != 'json' or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        path = os.path.join(directory, name)
+        if not _is_running(int(pid)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, encoding='utf8') as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def merge(snapshots: Iterable[dict]) -> dict:
+    "Adds up the metrics of several processes."
+    merged: dict[str, dict[tuple, Any]] = {'counter': {}, 'gauge': {}, 'histogram': {}}
+    for saved in snapshots:
+        for kind, values in merged.items():
+            for name, labels, value in saved.get(kind, []):
+                key = (name, tuple(labels))
+                if kind == 'histogram':
+                    total = values.setdefault(key, [0.0] * len(value))
+                    for i, count in enumerate(value):
+                        total[i] += count
+                else:
+                    values[key] = values.get(key, 0.0) + value
+    return merged
+
+def _hit_ratios(merged: dict) -> None:
+    "Works out the hit ratio of every cache from its lookups."
+    lookups: dict[str, dict[str, float]] = {}
+    for (name, labels), value in merged['counter'].items():
+        if name == 'vts_cache_requests_total':
+            lookups.setdefault(labels[0], {})[labels[1]] = value
+    for cache, results in lookups.items():
+        total = sum(results.values())
+        if total:
+            merged['gauge'][('vts_cache_hit_ratio', (cache,))] = results.get('hit', 0.0) / total
+
+def _escape(value: str) -> str:
+    "Escapes a label value."
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _series(name: str, label_names: tuple, labels: tuple, extra: str = '') -> str:
+    "Names one series of a metric, e.g. name{route=\"home\",method=\"GET\"}."
+    pairs = [f'{label}="{_escape(value)}"' for label, value in zip(label_names, labels)]
+    if extra:
+        pairs.append(extra)
+    return name + ('{' + ','.join(pairs) + '}' if pairs else '')
+
+def render(snapshots: Iterable[dict], gauges: dict[str, float]) -> str:
+    """
+    The metrics of several processes added up in the Prometheus text
+    format, along with gauges that are shared by every process, like
+    those of the search index.
+    """
+    merged = merge(snapshots)
+    _hit_ratios(merged)
+    for name, value in gauges.items():
+        merged['gauge'][(name, ())] = value
+    lines = []
+    for name, (kind, description, label_names) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in merged[kind].items()
+                        if metric == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f"{_series(name, label_names, labels)} {float(value)!r}")
+                continue
+            cumulative = 0.0
+            for bound, count in zip(BUCKETS + (float('inf'),), value[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f"{_series(name + '_bucket', label_names, labels, le)} {cumulative!r}")
+            lines.append(f"{_series(name + '_sum', label_names, labels)} {float(value[-1])!r}")
+            lines.append(f"{_series(name + '_count', label_names, labels)} {cumulative!r}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,234 @@
+"""
+On-demand profiling of single requests for admins.
+
+A profiled request has the call stack of the thread that serves it
+sampled every millisecond or so until the response has been sent, so
+streamed pages are profiled to the end. The time spent in SQL is
+measured exactly with SQLAlchemy events, while the time spent in
+templates and in Markdown is estimated from the share of samples that
+are in them. These overlap, e.g. a streamed template that queries the
+database counts toward both.
+
+Each profile is saved as JSON in the instance directory, with its
+stacks in the folded format that flame graph tools (flamegraph.pl,
+speedscope, inferno) read. Only the newest profiles are kept.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# The profiles, under the Flask instance path
+PROFILES_DIR_NAME = "profiles"
+
+# How many profiles are kept before the oldest are removed
+MAX_PROFILES = 200
+
+# How often, in seconds, the stack is sampled. The sampler needs the
+# GIL to take a sample, so the interpreter is made to switch threads
+# this often, too, while a request is profiled.
+SAMPLE_INTERVAL = 0.001
+
+# How many of the slowest SQL statements each profile keeps
+SLOWEST_QUERIES = 10
+
+# Where samples are attributed, by the paths of the code that they are
+# in (as in the folded stacks). Compiled templates have the path of the
+# template.
+CATEGORY_PATHS = {'template': ('/jinja2/', '/vts/templates/'),
+                  'markdown': ('/markdown_it/', '/mdurl/')}
+
+# The code outside of site-packages is shown relative to this directory
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROFILE_NAME = re.compile(r'^[0-9T]+-[0-9a-f]+$')
+
+# The profilers that are running, by the ID of the thread they profile
+_ACTIVE: dict[int, 'RequestProfiler'] = {}
+_ACTIVE_LOCK = threading.Lock()
+
+# The thread switch interval from before profiling started
+_SWITCH_INTERVAL: list[float] = []
+
+def _frame_name(frame) -> str:
+    "Names a frame for a flame graph, e.g. flask/app.py:wsgi_app."
+    path = frame.f_code.co_filename
+    if 'site-packages' + os.sep in path:
+        path = path.rsplit('site-packages' + os.sep, 1)[1]
+    elif path.startswith(_ROOT_DIR + os.sep):
+        path = os.path.relpath(path, _ROOT_DIR)
+    return f"{path.replace(os.sep, '/')}:{frame.f_code.co_name}"
+
+def folded_stack(frame) -> str:
+    "The stack of a frame in folded format, outermost frame first."
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def _before_cursor_execute(conn, *_):
+    "Notes when a statement starts on a profiled thread."
+    if threading.get_ident() in _ACTIVE:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+# Note: SQLAlchemy passes every argument of the event.
+#
+# pylint:disable-next=too-many-arguments,too-many-positional-arguments,unused-argument
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    "Records the time of a statement on a profiled thread."
+    profiler = _ACTIVE.get(threading.get_ident())
+    starts = conn.info.get('profile_query_start')
+    if profiler is not None and starts:
+        profiler.add_query(statement, time.perf_counter() - starts.pop())
+
+def _listen_to_sql() -> None:
+    "Starts timing SQL statements, the first time that a request is profiled."
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+# Note: The profiler holds what it records along with the thread that
+# does the sampling.
+#
+# pylint:disable-next=too-many-instance-attributes
+class RequestProfiler:
+    "Samples the stack of one thread and times its SQL from start() to stop()."
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.name = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.queries: list[tuple[float, str]] = []
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.seconds = 0.0
+        self._started = 0.0
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self) -> None:
+        "Starts sampling and timing SQL."
+        with _ACTIVE_LOCK:
+            _listen_to_sql()
+            if not _ACTIVE:
+                _SWITCH_INTERVAL.append(sys.getswitchinterval())
+                sys.setswitchinterval(self.interval)
+            _ACTIVE[self.thread_id] = self
+        self._started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self) -> None:
+        "Stops sampling and timing SQL."
+        self.seconds = time.perf_counter() - self._started
+        with _ACTIVE_LOCK:
+            _ACTIVE.pop(self.thread_id, None)
+            if not _ACTIVE and _SWITCH_INTERVAL:
+                sys.setswitchinterval(_SWITCH_INTERVAL.pop())
+        self._stopped.set()
+        self._sampler.join()
+
+    def add_query(self, statement: str, seconds: float) -> None:
+        "Records an SQL statement, keeping the slowest ones."
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        self.queries.append((seconds, statement))
+        if len(self.queries) > 2 * SLOWEST_QUERIES:
+            self.queries = sorted(self.queries, reverse=True)[:SLOWEST_QUERIES]
+
+    def _sample(self) -> None:
+        "Records the stack of the profiled thread until stopped."
+        while not self._stopped.wait(self.interval):
+            # Note: This is the only way to see the stack of another thread.
+            #
+            # pylint:disable-next=protected-access
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[folded_stack(frame)] += 1
+
+    def category_seconds(self, category: str) -> float:
+        "Estimates the time spent in a category of code from the share of samples in it."
+        total = sum(self.stacks.values())
+        if not total:
+            return 0.0
+        paths = CATEGORY_PATHS[category]
+        samples = sum(count for stack, count in self.stacks.items()
+                      if any(path in '/' + stack.replace(';', ';/') for path in paths))
+        return self.seconds * samples / total
+
+    def profile(self, method: str, path: str, status: int) -> dict:
+        "The profile of the request, as it is saved."
+        return {'name': self.name,
+                'method': method,
+                'path': path,
+                'status': status,
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'seconds': self.seconds,
+                'samples': sum(self.stacks.values()),
+                'sql_count': self.sql_count,
+                'sql_seconds': self.sql_seconds,
+                'template_seconds': self.category_seconds('template'),
+                'markdown_seconds': self.category_seconds('markdown'),
+                'slowest_queries': [{'seconds': seconds, 'statement': statement}
+                                    for seconds, statement in
+                                    sorted(self.queries, reverse=True)[:SLOWEST_QUERIES]],
+                'stacks': dict(self.stacks.most_common())}
+
+def profiles_path(instance_path: str) -> str:
+    "The directory that the profiles are saved in."
+    return os.path.join(instance_path, PROFILES_DIR_NAME)
+
+def save_profile(instance_path: str, profile: dict) -> None:
+    "Saves a profile and removes the oldest ones beyond MAX_PROFILES."
+    directory = profiles_path(instance_path)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, profile['name'] + '.json')
+    with open(path + '.tmp', mode='w', encoding='utf8') as file:
+        json.dump(profile, file)
+    os.replace(path + '.tmp', path)
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:-MAX_PROFILES]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+def load_profile(instance_path: str, name: str) -> Optional[dict]:
+    "Loads a saved profile by its name, if there is one."
+    if not _PROFILE_NAME.match(name):
+        return None
+    try:
+        with open(os.path.join(profiles_path(instance_path), name + '.json'),
+                  encoding='utf8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def slowest_profiles(instance_path: str, limit: int = 50) -> list[dict]:
+    "The saved profiles of the slowest requests, slowest first, without their stacks."
+    try:
+        names = [name[:-len('.json')] for name in os.listdir(profiles_path(instance_path))
+                 if name.endswith('.json')]
+    except OSError:
+        return []
+    profiles = [profile for profile in (load_profile(instance_path, name) for name in names)
+                if profile is not None]
+    profiles.sort(key=lambda profile: -profile['seconds'])
+    return [{key: value for key, value in profile.items() if key != 'stacks'}
+            for profile in profiles[:limit]]
+
+def folded_stacks(profile: dict) -> str:
+    "The stacks of a profile in folded format, one stack and its sample count per line."
+    return ''.join(f"{stack} {count}\n" for stack, count in profile['stacks'].items())
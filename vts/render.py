@@ -0,0 +1,72 @@
+"""
+Renders Markdown for the website and the chatbot.
+
+Building a MarkdownIt parser compiles all of its rules, which costs
+more than rendering a typical FAQ entry, so the parsers are built once
+here and shared. Rendering keeps all of its state in a new object per
+call and never changes the parser, so the shared parsers are safe to
+use from multiple threads as long as nothing reconfigures them.
+"""
+
+from markdown_it import MarkdownIt
+
+from vts.database import AppDatabase
+from vts.metrics import timed
+
+# Note: Increase this whenever a change to create_parser() or to the
+# Markdown text itself would change the HTML. Stored HTML from an
+# older version is then rendered again.
+RENDER_VERSION = 1
+
+# How many stale entries are rendered and stored per transaction
+RENDER_BATCH_SIZE = 200
+
+def create_parser(breaks: bool) -> MarkdownIt:
+    "Creates a table-friendly CommonMark parser that allows inline HTML."
+    return MarkdownIt('commonmark', {'breaks': breaks, 'html': True}).enable('table')
+
+# Note: Do not call enable(), disable(), or use() on these after
+# import because they are shared between threads.
+PARSERS = {True: create_parser(True),
+           False: create_parser(False)}
+
+@timed('markdown')
+def render_markdown(text: str, breaks: bool = True) -> str:
+    """
+    Renders Markdown text as HTML. The FAQ treats single newlines as
+    line breaks, while the chatbot replies use standard CommonMark.
+    """
+    return PARSERS[breaks].render(text)
+
+def render_faq_html(question_text: str, answer_text: str) -> dict:
+    "Renders an FAQ entry for storing with it in the database."
+    return {'question_html': render_markdown(question_text),
+            'answer_html': render_markdown(answer_text),
+            'render_version': RENDER_VERSION}
+
+def stored_html(entry: dict, field: str) -> str:
+    """
+    Gets the stored HTML of an entry's question or answer, rendering
+    it from the Markdown if it is missing or from an older renderer.
+    """
+    html = entry.get(field + '_html')
+    if html is None or entry.get('render_version') != RENDER_VERSION:
+        return render_markdown(entry[field + '_text'])
+    return html
+
+def rerender_stale_entries(db: AppDatabase, batch_size: int = RENDER_BATCH_SIZE) -> int:
+    """
+    Renders and stores the HTML of every entry that was not rendered
+    by the current renderer, such as after the renderer changed or for
+    entries that were added without going through the website. Returns
+    how many entries were rendered.
+    """
+    count = 0
+    while True:
+        entries = db.stale_rendered_entries(RENDER_VERSION, batch_size)
+        if not entries:
+            return count
+        db.update_rendered_html([{**entry, **render_faq_html(entry['question_text'],
+                                                             entry['answer_text'])}
+                                 for entry in entries])
+        count += len(entries)
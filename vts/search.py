@@ -7,12 +7,16 @@ from __future__ import annotations
 
 import os
 import importlib
+import json
+import shutil
+import threading
 
-from typing import Iterable, List
+from typing import Iterable, List, Optional
 
 from whoosh.fields import Schema
 from whoosh.fields import TEXT
 from whoosh.fields import ID
+from whoosh.fields import STORED
 
 from whoosh.analysis import StemmingAnalyzer
 
@@ -22,7 +26,18 @@ from whoosh.index import exists_in
 
 from whoosh.qparser import MultifieldParser
 
+from whoosh.query import Or
+from whoosh.query import Query
+from whoosh.query import Term
+
+from whoosh.sorting import FieldFacet
+from whoosh.sorting import OrderedList
+
 from vts.database import AppDatabase
+from vts.locks import LOCK_TIMEOUT
+from vts.locks import file_lock
+from vts.metrics import increment
+from vts.metrics import timed
 
 # Provide a fallback QuerySyntaxError class and override it
 # if Whoosh exposes a more specific exception
@@ -40,6 +55,32 @@ except (ImportError, ModuleNotFoundError):
 # Index directory name under Flask instance path
 INDEX_DIR_NAME = "whoosh_index"
 
+# Staging index directory name for full rebuilds
+STAGING_DIR_NAME = INDEX_DIR_NAME + ".staging"
+
+# Precomputed related questions, stored in the index directory
+RELATED_FILE_NAME = "related.json"
+
+# How many related questions each entry gets and how many of its key
+# terms are used to find them
+RELATED_LIMIT = 5
+RELATED_KEY_TERMS = 10
+
+# The lock that keeps the workers of a pre-fork server from changing the
+# search indexes (including the related questions and the similarity
+# index) at the same time
+LOCK_FILE_NAME = "search_index.lock"
+
+# How long, in seconds, a writer waits for the writer of another thread
+# or worker process to finish before giving up with a LockError, and
+# how often it checks in the meantime
+WRITER_TIMEOUT = 30.0
+WRITER_DELAY = 0.05
+
+# Loaded related question lists, keyed by path and invalidated by mtime
+_RELATED_CACHE: dict[str, tuple[int, dict]] = {}
+_RELATED_LOCK = threading.Lock()
+
 # Return Whoosh schema for FAQ entries
 def _schema() -> Schema:
     "Return Whoosh schema for FAQ entries."
@@ -51,6 +92,13 @@ def _schema() -> Schema:
         question=TEXT(stored=False, analyzer=StemmingAnalyzer()),
         answer=TEXT(stored=False, analyzer=StemmingAnalyzer()),
         category=TEXT(stored=False, analyzer=StemmingAnalyzer()),
+        # Sortable so that results can be filtered and grouped by
+        # category inside the index.
+        category_id=ID(stored=True, sortable=True),
+        # The entry's timestamp and category name when it was indexed,
+        # which are compared to the database to find entries that have
+        # drifted.
+        version=STORED(),
     )
 
 # Get index directory path from Flask instance path
@@ -58,6 +106,44 @@ def _index_path(instance_path: str) -> str:
     "Get index directory path from Flask instance path."
     return os.path.join(instance_path, INDEX_DIR_NAME)
 
+# Hold the lock on the search indexes across processes
+def index_lock(instance_path: str, timeout: float = LOCK_TIMEOUT):
+    """
+    Holds the lock on the search indexes for a change that reads and
+    writes them, e.g. one that refreshes the related questions.
+    """
+    return file_lock(os.path.join(instance_path, LOCK_FILE_NAME), timeout)
+
+# Open a writer that waits for the index's own lock
+def _writer(ix, **kwargs):
+    "Opens a writer on the index, waiting for any other writer to finish first."
+    return ix.writer(timeout=WRITER_TIMEOUT, delay=WRITER_DELAY, **kwargs)
+
+# The version stamp that is stored for an entry
+def _version(entry: dict, category_name: str) -> str:
+    """
+    The version stamp that is stored for an entry. Renaming a category
+    doesn't touch its entries' timestamps, so the stamp has the
+    category name too.
+    """
+    timestamp = entry.get('timestamp')
+    return f"{timestamp.isoformat() if timestamp is not None else ''}\n{category_name}"
+
+# Turn an FAQ entry into the fields of a Whoosh document
+def _document(entry: dict, category_name: str) -> dict:
+    "Turn an FAQ entry into the fields of a Whoosh document."
+    return {'faq_id': str(entry['id']),
+            'question': entry['question_text'],
+            'answer': entry['answer_text'],
+            'category': category_name,
+            'category_id': str(entry['category_id']),
+            'version': _version(entry, category_name)}
+
+# Map category id to name
+def _category_names(db: AppDatabase) -> dict:
+    "Map category id to name."
+    return {c['id']: c['category_name'] for c in db.faq_categories()}
+
 # Rebuild Whoosh index from FAQ entries
 def build_index(db: AppDatabase, instance_path: str) -> None:
     "Rebuild Whoosh index from FAQ entries."
@@ -80,117 +166,380 @@ def build_index(db: AppDatabase, instance_path: str) -> None:
                 pass
 
     ix = create_in(index_path, _schema())
-    writer = ix.writer()
-
-    # Map category id to name
-    name_to_id = db.faq_categories_by_name()
-    id_to_name = {cid: name for name, cid in name_to_id.items()}
-
-    for entry in db.faq_entries():
-        category_name = id_to_name.get(entry['category_id'], '')
-        writer.add_document(
-            faq_id=str(entry['id']),
-            question=entry['question_text'],
-            answer=entry['answer_text'],
-            category=category_name,
-        )
+    writer = _writer(ix)
+
+    id_to_name = _category_names(db)
+    entries = db.faq_entries()
+    for entry in entries:
+        writer.add_document(**_document(entry, id_to_name.get(entry['category_id'], '')))
+    writer.commit()
+    build_related(entries, instance_path)
+
+# Full rebuilds of a large index are written to a staging index next
+# to the live one, which keeps serving searches until it is replaced.
+
+# Get staging index directory path from Flask instance path
+def _staging_path(instance_path: str) -> str:
+    "Get staging index directory path from Flask instance path."
+    return os.path.join(instance_path, STAGING_DIR_NAME)
+
+# Create an empty staging index
+def create_staging_index(instance_path: str) -> None:
+    "Create an empty staging index, replacing any unfinished one."
+    staging_path = _staging_path(instance_path)
+    shutil.rmtree(staging_path, ignore_errors=True)
+    os.makedirs(staging_path)
+    create_in(staging_path, _schema())
+
+# Check for a staging index
+def has_staging_index(instance_path: str) -> bool:
+    "Check for a staging index, such as one left by an interrupted rebuild."
+    return exists_in(_staging_path(instance_path))
+
+# Add FAQ entries to the staging index in one commit
+def add_to_staging_index(db: AppDatabase,
+                         entries: list[dict],
+                         instance_path: str,
+                         procs: int = 1) -> None:
+    """
+    Add FAQ entries to the staging index in one commit. With more than
+    one proc, Whoosh analyzes the documents in that many processes.
+    Entries that are already in it are replaced, so a batch that was
+    committed before the job was interrupted can be added again.
+    """
+    ix = open_dir(_staging_path(instance_path))
+    writer = _writer(ix, procs=procs, multisegment=True) if procs > 1 else _writer(ix)
+    id_to_name = _category_names(db)
+    for entry in entries:
+        writer.update_document(**_document(entry, id_to_name.get(entry['category_id'], '')))
     writer.commit()
 
-# Create index if missing
-def ensure_index(db: AppDatabase, instance_path: str) -> None:
-    "Create index if missing."
+# Replace the live index with the staging index
+def replace_index_with_staging(instance_path: str) -> None:
+    """
+    Replace the live index with the finished staging index. Searches
+    that start during the swap might briefly find no index. The
+    related questions must be computed again afterwards.
+    """
+    index_path = _index_path(instance_path)
+    old_path = index_path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(index_path):
+        os.rename(index_path, old_path)
+    os.rename(_staging_path(instance_path), index_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+# Create index if missing, otherwise reconcile it with the database
+def ensure_index(db: AppDatabase, instance_path: str) -> dict:
+    "Create index if missing, otherwise reconcile it with the database."
     index_path = _index_path(instance_path)
     if not os.path.exists(index_path):
         os.makedirs(index_path, exist_ok=True)
-    if not exists_in(index_path):
-        build_index(db, instance_path)
+    return reconcile_index(db, instance_path)
 
-# Add a single FAQ entry to the index if it exists
-def add_faq_to_index(db: AppDatabase, faq_id: int, instance_path: str) -> None:
-    "Add a single FAQ entry to the index if it exists already."
+# Reindex only the entries that differ between the database and index
+def reconcile_index(db: AppDatabase, instance_path: str) -> dict:
+    """
+    Compare the FAQ entry IDs, timestamps, and category names in the
+    database with the IDs and versions stored in the index and reindex only the
+    difference. This fixes an index that has drifted, such as after a
+    crash between a database commit and the index commit, or when
+    another server writes to a shared database.
+
+    Returns the drift that was found as lists of IDs that were added,
+    updated, and removed. A missing or outdated index is rebuilt.
+    """
     index_path = _index_path(instance_path)
-    if not exists_in(index_path):
-        return
-    entries = db.faq_entry(faq_id)
-    if not entries:
-        return
-    entry = entries[0]
-    # Category name lookup
-    categories = {c['id']: c['category_name'] for c in db.faq_categories()}
-    category_name = categories.get(entry['category_id'], '')
+    if not exists_in(index_path) or \
+       not set(_schema().names()) <= set(open_dir(index_path).schema.names()):
+        build_index(db, instance_path)
+        return {'added': [], 'updated': [], 'removed': [], 'rebuilt': True}
+
+    id_to_name = _category_names(db)
+    versions = {faq_id: _version(entry, id_to_name.get(entry['category_id'], ''))
+                for faq_id, entry in db.faq_entry_versions().items()}
     ix = open_dir(index_path)
-    writer = ix.writer()
-    writer.add_document(
-        faq_id=str(entry['id']),
-        question=entry['question_text'],
-        answer=entry['answer_text'],
-        category=category_name,
-    )
+    indexed: dict[int, str] = {}
+    with ix.searcher() as searcher:
+        for fields in searcher.reader().all_stored_fields():
+            try:
+                indexed[int(fields['faq_id'])] = fields.get('version', '')
+            except (ValueError, KeyError):
+                continue
+
+    report: dict = {'added': sorted(set(versions) - set(indexed)),
+                    'updated': sorted(faq_id for faq_id, version in versions.items()
+                                      if faq_id in indexed and indexed[faq_id] != version),
+                    'removed': sorted(set(indexed) - set(versions)),
+                    'rebuilt': False}
+    changed = report['added'] + report['updated']
+    if not changed and not report['removed']:
+        return report
+
+    writer = _writer(ix)
+    for entry in db.faq_entries_by_ids(changed):
+        writer.update_document(**_document(entry, id_to_name.get(entry['category_id'], '')))
+    for faq_id in report['removed']:
+        writer.delete_by_term('faq_id', str(faq_id))
     writer.commit()
+    refresh_related(db, changed + report['removed'], instance_path)
+    return report
 
-# Update a single FAQ entry in the index
-def update_faq_in_index(db: AppDatabase, faq_id: int, instance_path: str) -> None:
-    "Update a single FAQ entry in the index."
+# Bring several FAQ entries up to date in the index with one commit
+def update_index_entries(db: AppDatabase, faq_ids: Iterable[int], instance_path: str) -> None:
+    """
+    Write the current state of several FAQ entries to the index in one
+    commit. Entries that exist are indexed again and the rest removed.
+    """
     index_path = _index_path(instance_path)
-    if not exists_in(index_path):
-        return
-    entries = db.faq_entry(faq_id)
-    if not entries:
+    faq_ids = set(faq_ids)
+    if not faq_ids or not exists_in(index_path):
         return
-    entry = entries[0]
-    categories = {c['id']: c['category_name'] for c in db.faq_categories()}
-    category_name = categories.get(entry['category_id'], '')
+    entries = db.faq_entries_by_ids(faq_ids)
+    id_to_name = _category_names(db)
     ix = open_dir(index_path)
-    writer = ix.writer()
-    writer.update_document(
-        faq_id=str(entry['id']),
-        question=entry['question_text'],
-        answer=entry['answer_text'],
-        category=category_name,
-    )
+    writer = _writer(ix)
+    for entry in entries:
+        writer.update_document(**_document(entry, id_to_name.get(entry['category_id'], '')))
+    for faq_id in faq_ids - {entry['id'] for entry in entries}:
+        writer.delete_by_term('faq_id', str(faq_id))
     writer.commit()
 
-# Remove a single FAQ entry from the index
-def remove_faq_from_index(faq_id: int, instance_path: str) -> None:
-    "Remove a single FAQ entry from the index."
+# Parse a user query, returning None if it is malformed
+def _parse(ix, query: str) -> Optional[Query]:
+    "Parse a user query, returning None if it is malformed."
+    parser = MultifieldParser(["question", "answer", "category"], schema=ix.schema)
+    try:
+        return parser.parse(query)
+    except (QuerySyntaxError, SyntaxError, ValueError):
+        # Ignore malformed user queries
+        return None
+
+# Count the segments and the documents of the index
+def index_stats(instance_path: str) -> dict:
+    "Counts the segments and the FAQ entries in the index, if there is one."
     index_path = _index_path(instance_path)
     if not exists_in(index_path):
-        return
+        return {}
     ix = open_dir(index_path)
-    writer = ix.writer()
-    writer.delete_by_term('faq_id', str(faq_id))
-    writer.commit()
+    with ix.reader() as reader:
+        return {'segments': len(list(reader.leaf_readers())),
+                'documents': reader.doc_count()}
 
 # Get FAQ entry IDs matching query
-def search_faq_ids(query: str, instance_path: str, limit: int = 50) -> List[int]:
-    "Get FAQ entry IDs matching query."
+@timed('search')
+def search_faq_ids(query: str,
+                   instance_path: str,
+                   limit: int = 50,
+                   category_id: Optional[int] = None) -> List[int]:
+    "Get FAQ entry IDs matching query, optionally only in the given category."
     if not query:
         return []
     index_path = _index_path(instance_path)
     if not exists_in(index_path):
         return []
     ix = open_dir(index_path)
-    parser = MultifieldParser(["question", "answer", "category"], schema=ix.schema)
-    try:
-        q = parser.parse(query)
-    except (QuerySyntaxError, SyntaxError, ValueError):
-        # Ignore malformed user queries
+    q = _parse(ix, query)
+    if q is None:
         return []
+    category_filter = Term('category_id', str(category_id)) if category_id is not None else None
     results: List[int] = []
     with ix.searcher() as searcher:
-        for hit in searcher.search(q, limit=limit):
+        for hit in searcher.search(q, limit=limit, filter=category_filter):
             try:
                 results.append(int(hit["faq_id"]))
             except (ValueError, KeyError):
                 continue
     return results
 
+# Get FAQ entry IDs matching query along with per-category counts
+@timed('search')
+def search_faq(query: str,
+               instance_path: str,
+               category_id: Optional[int] = None,
+               limit: int = 50,
+               extra_ids: Iterable[int] = ()) -> dict:
+    """
+    Get FAQ entry IDs matching query, optionally only in the given
+    category, along with the number of matches in every category.
+
+    This is one pass over the index. The matches are grouped by the
+    sortable category_id column, which gives both the facet counts and
+    the matches in the chosen category (in score order) without any
+    more searches or database filtering.
+
+    The extra_ids (e.g. from the similarity search) go after the
+    keyword matches that they aren't already among, as long as they
+    are in the category, and are counted in the facets like them.
+
+    Returns a dict with the 'ids' and the 'facets', which maps category
+    IDs to counts.
+    """
+    output: dict = {'ids': [], 'facets': {}}
+    if not query:
+        return output
+    index_path = _index_path(instance_path)
+    if not exists_in(index_path):
+        return output
+    ix = open_dir(index_path)
+    q = _parse(ix, query)
+    if q is None:
+        return output
+    with ix.searcher() as searcher:
+        results = searcher.search(q,
+                                  limit=None,
+                                  groupedby=FieldFacet('category_id', maptype=OrderedList))
+        groups = results.groups()
+        output['facets'] = {int(key): len(docnums) for key, docnums in groups.items() if key}
+        if category_id is not None:
+            docnums = groups.get(str(category_id), [])[:limit]
+        else:
+            docnums = [hit.docnum for hit in results[:limit]]
+        reader = searcher.reader()
+        for docnum in docnums:
+            try:
+                output['ids'].append(int(reader.stored_fields(docnum)["faq_id"]))
+            except (ValueError, KeyError):
+                continue
+        _add_extra_ids(output, searcher, set(results.docs()), extra_ids, category_id)
+    return output
+
+# Add matches that the keyword search didn't find
+def _add_extra_ids(output: dict,
+                   searcher,
+                   matched: set,
+                   extra_ids: Iterable[int],
+                   category_id: Optional[int]) -> None:
+    "Add the extra_ids that aren't among the matched docnums to the search output."
+    reader = searcher.reader()
+    for faq_id in extra_ids:
+        docnum = searcher.document_number(faq_id=str(faq_id))
+        if docnum is None or docnum in matched:
+            continue
+        matched.add(docnum)
+        key = reader.stored_fields(docnum).get('category_id')
+        if not key:
+            continue
+        output['facets'][int(key)] = output['facets'].get(int(key), 0) + 1
+        if category_id is None or int(key) == category_id:
+            output['ids'].append(faq_id)
+
+# Related questions
+
+# Get related path from Flask instance path
+def _related_path(instance_path: str) -> str:
+    "Get related questions file path from Flask instance path."
+    return os.path.join(_index_path(instance_path), RELATED_FILE_NAME)
+
+# Load the stored related question lists
+def _load_related(instance_path: str) -> dict:
+    "Load the stored related question lists, reusing them if the file is unchanged."
+    path = _related_path(instance_path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    with _RELATED_LOCK:
+        cached = _RELATED_CACHE.get(path)
+        if cached and cached[0] == mtime:
+            increment('vts_cache_requests_total', ('related', 'hit'))
+            return cached[1]
+        increment('vts_cache_requests_total', ('related', 'miss'))
+        try:
+            with open(path, encoding='utf8') as file:
+                related = {int(faq_id): ids for faq_id, ids in json.load(file).items()}
+        except (OSError, ValueError):
+            return {}
+        _RELATED_CACHE[path] = (mtime, related)
+        return related
+
+# Save the related question lists
+def save_related(instance_path: str, related: dict) -> None:
+    "Save the related question lists, replacing the file atomically."
+    path = _related_path(instance_path)
+    with open(path + '.tmp', mode='w', encoding='utf8') as file:
+        json.dump({str(faq_id): ids for faq_id, ids in related.items()}, file)
+    os.replace(path + '.tmp', path)
+
+# Find the entries most like an entry with a more-like-this query
+def _more_like(searcher, entry: dict) -> list[int]:
+    """
+    Find the entries most like an entry. This is a more-like-this
+    query: the entry's key terms are picked out of its question and
+    answer and then searched for in the other entries.
+    """
+    text = entry['question_text'] + '\n' + entry['answer_text']
+    key_terms = searcher.key_terms_from_text('answer', text, numterms=RELATED_KEY_TERMS)
+    if not key_terms:
+        return []
+    q = Or([Term(field, term, boost=weight)
+            for term, weight in key_terms
+            for field in ('question', 'answer')])
+    faq_id = str(entry['id'])
+    return [int(hit['faq_id'])
+            for hit in searcher.search(q, limit=RELATED_LIMIT, mask=Term('faq_id', faq_id))]
+
+# Compute the related questions of every entry
+def related_for_entries(entries: Iterable[dict], instance_path: str) -> dict:
+    "Compute the related questions of the given entries without storing them."
+    index_path = _index_path(instance_path)
+    if not exists_in(index_path):
+        return {}
+    with open_dir(index_path).searcher() as searcher:
+        return {entry['id']: _more_like(searcher, entry) for entry in entries}
+
+# Compute the related questions of every entry
+def build_related(entries: list[dict], instance_path: str) -> None:
+    "Compute and store the related questions of every entry."
+    if exists_in(_index_path(instance_path)):
+        save_related(instance_path, related_for_entries(entries, instance_path))
+
+# Recompute the related questions affected by changed entries
+def refresh_related(db: AppDatabase, faq_ids: Iterable[int], instance_path: str) -> list[int]:
+    """
+    Recompute the related questions affected by the given added,
+    edited, or removed entries: the entries themselves, the entries
+    that list them as related, and their new neighbors, which might
+    now list them. Everything else keeps its stored list.
+
+    Returns the IDs of the entries whose related questions changed.
+    """
+    index_path = _index_path(instance_path)
+    changed_ids = set(faq_ids)
+    if not changed_ids or not exists_in(index_path):
+        return []
+    related = dict(_load_related(instance_path))
+    entries = {entry['id']: entry for entry in db.faq_entries_by_ids(changed_ids)}
+    refreshed: set[int] = set()
+    with open_dir(index_path).searcher() as searcher:
+        # The changed entries themselves
+        for faq_id in changed_ids:
+            if faq_id in entries:
+                related[faq_id] = _more_like(searcher, entries[faq_id])
+            else:
+                related.pop(faq_id, None)
+            refreshed.add(faq_id)
+        # Their neighbors, old and new
+        neighbor_ids = {faq_id for faq_id, ids in related.items() if changed_ids & set(ids)}
+        for faq_id in changed_ids:
+            neighbor_ids.update(related.get(faq_id, []))
+        neighbor_ids -= changed_ids
+        for entry in db.faq_entries_by_ids(neighbor_ids):
+            new_ids = _more_like(searcher, entry)
+            if related.get(entry['id']) != new_ids:
+                related[entry['id']] = new_ids
+                refreshed.add(entry['id'])
+    save_related(instance_path, related)
+    return sorted(refreshed)
+
+# Get the precomputed related questions for an entry
+def related_faq_ids(faq_id: int, instance_path: str) -> list[int]:
+    "Get the precomputed related questions for an entry. This does not search."
+    return list(_load_related(instance_path).get(faq_id, []))
+
 # Fetch FAQ entries by ID
 def fetch_entries_by_ids(db: AppDatabase, ids: Iterable[int]) -> list[dict]:
-    "Fetch FAQ entries by ID."
-    output: list[dict] = []
-    for faq_id in ids:
-        entries = db.faq_entry(faq_id)
-        if entries:
-            output.extend(entries)
-    return output
+    "Fetch FAQ entries by ID, in the order of the IDs."
+    ids = list(ids)
+    by_id = {entry['id']: entry for entry in db.faq_entries_by_ids(ids)}
+    return [by_id[faq_id] for faq_id in ids if faq_id in by_id]
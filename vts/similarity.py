@@ -0,0 +1,453 @@
+"""
+Local vector-similarity retrieval for FAQ entries and knowledge files.
+
+Keyword search misses paraphrases, so this builds a latent semantic
+index: a TF-IDF matrix over the FAQ questions/answers and the chunked
+knowledge Markdown files, reduced with a truncated SVD. Everything is
+NumPy and runs locally; no network models are used.
+
+The document vectors are saved as an .npy file so that they can be
+memory-mapped instead of read into memory, and changed documents are
+folded into the existing SVD basis instead of refitting everything.
+Their vectors are appended to a small file of changes, so an edit
+doesn't rewrite the memory-mapped file. Vectors files are never
+replaced (Windows can't replace a file that is mapped): each one that
+is written gets a new name, which the metadata points to.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import secrets
+import threading
+
+from collections import Counter
+from typing import Iterable, Optional
+
+import numpy as np
+
+from whoosh.analysis import StemmingAnalyzer
+
+from vts.database import AppDatabase
+
+# Index directory name under Flask instance path
+SIMILARITY_DIR_NAME = "similarity_index"
+
+# The knowledge files that were given to the agent. The instructions
+# files in the same directory are prompts, not knowledge, so they are
+# not indexed.
+KNOWLEDGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "knowledge_files_markdown")
+KNOWLEDGE_FILES = ["knowledge.md", "contacts.md"]
+
+# Size limits. The vocabulary is capped so that the term covariance
+# matrix used for the SVD stays small no matter how many documents
+# there are.
+MAX_TERMS = 4096
+DIMENSIONS = 128
+CHUNK_CHARS = 1500
+BATCH_SIZE = 1024
+
+# Refit from scratch when more than this fraction of the documents has
+# changed since the basis was computed.
+REFIT_RATIO = 0.25
+
+# Rewrite the document vectors into one file when the appended and the
+# removed rows reach this fraction of the rows in the main file.
+COMPACT_RATIO = 0.25
+
+# Bump this if the on-disk format changes.
+FORMAT_VERSION = 2
+
+_ANALYZER = StemmingAnalyzer()
+
+# Loaded indexes, keyed by directory and invalidated by the mtime of
+# the metadata file.
+_LOADED: dict[str, tuple[int, "SimilarityIndex"]] = {}
+_LOADED_LOCK = threading.Lock()
+
+# Note: The index keeps both its parts and the lookups made from them.
+#
+# pylint:disable-next=too-many-instance-attributes
+class SimilarityIndex():
+    """
+    A loaded similarity index.
+
+    The vocabulary, IDF weights, and SVD basis are small and kept in
+    memory. The document vectors are memory-mapped, and the vectors
+    that were appended since (the changes) are kept in memory. Each
+    document has the row of its vector in the two put together.
+    """
+    # Note: These are the parts of the index.
+    #
+    # pylint:disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(self, terms: list[str], idf, basis, vectors, docs: list[dict], changes=None):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.idf = idf
+        self.basis = basis
+        self.vectors = vectors
+        self.changes = changes if changes is not None else \
+            np.zeros((0, basis.shape[1]), dtype=np.float32)
+        self.docs = docs
+        self.rows = np.array([doc['row'] for doc in docs], dtype=np.int64)
+        self.fitted_docs = len(docs)
+        # The files that the vectors and the changes are stored in
+        self.files = {'vectors': '', 'changes': ''}
+
+    def __repr__(self) -> str:
+        return f"SimilarityIndex(terms={len(self.terms)!r}, " \
+            f"dimensions={self.basis.shape[1]!r}, " \
+            f"docs={len(self.docs)!r})"
+
+    def project(self, texts: list[str]):
+        "Project texts into the reduced space as unit-length row vectors."
+        counts = [Counter(tokenize(text)) for text in texts]
+        rows = _tfidf_rows(counts, self.term_ids, self.idf)
+        return _normalize_rows(rows @ self.basis).astype(np.float32)
+
+    def query(self, text: str, k: int = 10, prefix: str = '') -> list[tuple[str, float]]:
+        "Return the top k (key, cosine score) pairs for text, optionally by key prefix."
+        if not self.docs or not text:
+            return []
+        projected = self.project([text])[0]
+        scores = np.concatenate([self.vectors @ projected, self.changes @ projected])[self.rows]
+        if prefix:
+            mask = np.array([doc['key'].startswith(prefix) for doc in self.docs])
+            scores = np.where(mask, scores, -1.0)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.docs[i]['key'], float(scores[i])) for i in top if scores[i] > 0.0]
+
+def tokenize(text: str) -> list[str]:
+    "Stem and tokenize text the same way that the Whoosh index does."
+    return [token.text for token in _ANALYZER(text)]
+
+def _normalize_rows(matrix):
+    "Scale every row to unit length, leaving zero rows alone."
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return matrix / norms
+
+def _hash(text: str) -> str:
+    "Content hash used to detect changed documents."
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+def _index_path(instance_path: str) -> str:
+    "Get index directory path from Flask instance path."
+    return os.path.join(instance_path, SIMILARITY_DIR_NAME)
+
+# Documents
+
+def faq_document(entry: dict) -> dict:
+    "Turn an FAQ entry dict into a similarity document."
+    text = entry['question_text'] + '\n\n' + entry['answer_text']
+    return {'key': f"faq:{entry['id']}",
+            'title': entry['question_text'],
+            'text': text,
+            'hash': _hash(text)}
+
+def chunk_markdown(text: str, limit: int = CHUNK_CHARS) -> list[tuple[str, str]]:
+    """
+    Split Markdown into (heading, text) chunks at the headings. Long
+    sections are split again at blank lines so that no chunk grows far
+    past the limit.
+    """
+    sections: list[tuple[str, list[str]]] = [('', [])]
+    for line in text.splitlines():
+        if re.match(r'#{1,6}\s', line):
+            sections.append((line.lstrip('#').strip(), []))
+        sections[-1][1].append(line)
+    chunks = []
+    for heading, lines in sections:
+        current = ''
+        for paragraph in '\n'.join(lines).split('\n\n'):
+            if current and len(current) + len(paragraph) > limit:
+                chunks.append((heading, current))
+                current = ''
+            current = current + '\n\n' + paragraph if current else paragraph
+        if current.strip():
+            chunks.append((heading, current))
+    return chunks
+
+def knowledge_documents(knowledge_dir: Optional[str] = KNOWLEDGE_DIR) -> list[dict]:
+    "Chunk the knowledge files into similarity documents."
+    docs: list[dict] = []
+    if not knowledge_dir:
+        return docs
+    for filename in KNOWLEDGE_FILES:
+        try:
+            with open(os.path.join(knowledge_dir, filename), encoding='utf8') as file:
+                text = file.read()
+        except OSError:
+            continue
+        for i, (heading, chunk) in enumerate(chunk_markdown(text)):
+            docs.append({'key': f"knowledge:{filename}#{i}",
+                         'title': heading,
+                         'text': chunk,
+                         'hash': _hash(chunk)})
+    return docs
+
+def all_documents(db: AppDatabase, knowledge_dir: Optional[str] = KNOWLEDGE_DIR) -> list[dict]:
+    "Every document that belongs in the index."
+    return [faq_document(entry) for entry in db.faq_entries()] + knowledge_documents(knowledge_dir)
+
+# Fitting
+
+def _tfidf_rows(counts: list[Counter], term_ids: dict[str, int], idf):
+    "Turn term counts into unit-length TF-IDF rows over the vocabulary."
+    rows = np.zeros((len(counts), len(term_ids)), dtype=np.float64)
+    for i, count in enumerate(counts):
+        for term, n in count.items():
+            term_id = term_ids.get(term)
+            if term_id is not None:
+                rows[i, term_id] = (1.0 + math.log(n)) * idf[term_id]
+    return _normalize_rows(rows)
+
+def _vocabulary(counts: list[Counter]) -> tuple[list[str], np.ndarray]:
+    "Choose the vocabulary for the term counts and compute its IDF weights."
+    document_frequency: Counter = Counter()
+    for count in counts:
+        document_frequency.update(count.keys())
+    # Keep the most common terms, breaking ties alphabetically so that
+    # the vocabulary is deterministic.
+    terms = sorted(document_frequency, key=lambda term: (-document_frequency[term], term))
+    terms = sorted(terms[:MAX_TERMS])
+    idf = np.array([math.log((1 + len(counts)) / (1 + document_frequency[term])) + 1.0
+                    for term in terms])
+    return terms, idf
+
+def fit(docs: list[dict], dimensions: int = DIMENSIONS) -> SimilarityIndex:
+    """
+    Fit the vocabulary, IDF weights, and SVD basis to docs.
+
+    The basis comes from the eigenvectors of the term covariance
+    matrix, which is accumulated in batches, so that the full TF-IDF
+    matrix never has to exist at once.
+    """
+    counts = [Counter(tokenize(doc['text'])) for doc in docs]
+    terms, idf = _vocabulary(counts)
+    term_ids = {term: i for i, term in enumerate(terms)}
+    total = len(docs)
+
+    def batches():
+        for start in range(0, total, BATCH_SIZE):
+            yield _tfidf_rows(counts[start:start + BATCH_SIZE], term_ids, idf)
+
+    covariance = np.zeros((len(terms), len(terms)), dtype=np.float64)
+    for rows in batches():
+        covariance += rows.T @ rows
+    dimensions = max(1, min(dimensions, total, len(terms)))
+    if terms:
+        _, eigenvectors = np.linalg.eigh(covariance)
+        # eigh() sorts in ascending order so the largest are last.
+        basis = eigenvectors[:, ::-1][:, :dimensions]
+    else:
+        basis = np.zeros((0, dimensions))
+    vectors = np.zeros((total, dimensions), dtype=np.float32)
+    start = 0
+    for rows in batches():
+        vectors[start:start + len(rows)] = _normalize_rows(rows @ basis)
+        start += len(rows)
+    return SimilarityIndex(terms, idf, basis, vectors,
+                           [{'key': doc['key'], 'title': doc['title'], 'hash': doc['hash'],
+                             'row': row}
+                            for row, doc in enumerate(docs)])
+
+# Storage
+
+def _save_array(path: str, array) -> None:
+    "Save an array, replacing the file atomically."
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        np.save(file, np.ascontiguousarray(array))
+    os.replace(temp_path, path)
+
+def _write_index(instance_path: str, index: SimilarityIndex, rewrite: bool = True) -> None:
+    """
+    Save the index. With rewrite, everything is written, including all
+    of the vectors, and otherwise only the changes and the metadata are.
+    Files that are no longer used are removed if they can be.
+    """
+    index_path = _index_path(instance_path)
+    os.makedirs(index_path, exist_ok=True)
+    if rewrite or not index.files['vectors']:
+        _save_array(os.path.join(index_path, 'idf.npy'), index.idf)
+        _save_array(os.path.join(index_path, 'basis.npy'), index.basis)
+        index.files['vectors'] = f"vectors-{secrets.token_hex(8)}.npy"
+        _save_array(os.path.join(index_path, index.files['vectors']), index.vectors)
+    index.files['changes'] = f"changes-{secrets.token_hex(8)}.npy" if len(index.changes) else ''
+    if index.files['changes']:
+        _save_array(os.path.join(index_path, index.files['changes']), index.changes)
+    meta = {'format': FORMAT_VERSION,
+            'terms': index.terms,
+            'fitted_docs': index.fitted_docs,
+            'files': index.files,
+            'docs': index.docs}
+    # The metadata goes last because its mtime marks the new version.
+    temp_path = os.path.join(index_path, 'meta.json.tmp')
+    with open(temp_path, 'w', encoding='utf8') as file:
+        json.dump(meta, file)
+    os.replace(temp_path, os.path.join(index_path, 'meta.json'))
+    for filename in os.listdir(index_path):
+        if filename.startswith(('vectors', 'changes')) and \
+           filename not in index.files.values():
+            try:
+                os.remove(os.path.join(index_path, filename))
+            except OSError:
+                # Still mapped on Windows, so it goes after the next write.
+                continue
+
+def load_similarity_index(instance_path: str) -> Optional[SimilarityIndex]:
+    "Load the index with memory-mapped vectors, reusing it if unchanged."
+    index_path = _index_path(instance_path)
+    meta_path = os.path.join(index_path, 'meta.json')
+    try:
+        mtime = os.stat(meta_path).st_mtime_ns
+    except OSError:
+        return None
+    with _LOADED_LOCK:
+        cached = _LOADED.get(index_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(meta_path, encoding='utf8') as file:
+                meta = json.load(file)
+            if meta.get('format') != FORMAT_VERSION:
+                return None
+            files = meta['files']
+            index = SimilarityIndex(meta['terms'],
+                                    np.load(os.path.join(index_path, 'idf.npy')),
+                                    np.load(os.path.join(index_path, 'basis.npy')),
+                                    np.load(os.path.join(index_path, files['vectors']),
+                                            mmap_mode='r'),
+                                    meta['docs'],
+                                    np.load(os.path.join(index_path, files['changes']))
+                                    if files['changes'] else None)
+        except (OSError, ValueError, KeyError):
+            return None
+        index.fitted_docs = meta.get('fitted_docs', len(index.docs))
+        index.files = files
+        _LOADED[index_path] = (mtime, index)
+        return index
+
+# Building and updating
+
+def build_similarity_index(db: AppDatabase,
+                           instance_path: str,
+                           knowledge_dir: Optional[str] = KNOWLEDGE_DIR) -> SimilarityIndex:
+    "Rebuild the similarity index from scratch."
+    index = fit(all_documents(db, knowledge_dir))
+    _write_index(instance_path, index)
+    return index
+
+def save_similarity_index(instance_path: str, index: SimilarityIndex) -> None:
+    "Save a fitted index in place of the stored one."
+    _write_index(instance_path, index)
+
+def _apply_changes(instance_path: str,
+                   index: SimilarityIndex,
+                   upserts: list[dict],
+                   removed: Iterable[str]) -> SimilarityIndex:
+    """
+    Fold changed documents into an existing index. New and edited
+    documents are projected onto the current basis and appended to the
+    changes, and removed ones are dropped, so nothing is refit and the
+    memory-mapped vectors stay as they are. They are only rewritten,
+    without the rows that are no longer used, once there are enough
+    of those.
+    """
+    replaced = {doc['key'] for doc in upserts} | set(removed)
+    docs = [doc for doc in index.docs if doc['key'] not in replaced]
+    changes = index.changes
+    if upserts:
+        start = len(index.vectors) + len(changes)
+        changes = np.vstack([changes, index.project([doc['text'] for doc in upserts])])
+        docs += [{'key': doc['key'], 'title': doc['title'], 'hash': doc['hash'],
+                  'row': start + i}
+                 for i, doc in enumerate(upserts)]
+    updated = SimilarityIndex(index.terms, index.idf, index.basis, index.vectors, docs, changes)
+    updated.fitted_docs = index.fitted_docs
+    updated.files = dict(index.files)
+    unused = len(index.vectors) + len(changes) - len(docs)
+    rewrite = unused > COMPACT_RATIO * max(len(index.vectors), 1)
+    if rewrite:
+        updated = _compacted(updated)
+    _write_index(instance_path, updated, rewrite)
+    return updated
+
+def _compacted(index: SimilarityIndex) -> SimilarityIndex:
+    "The index with only the vectors that are used, in one array."
+    vectors = np.concatenate([np.asarray(index.vectors), index.changes])[index.rows]
+    compacted = SimilarityIndex(index.terms, index.idf, index.basis, vectors,
+                                [{**doc, 'row': row} for row, doc in enumerate(index.docs)])
+    compacted.fitted_docs = index.fitted_docs
+    return compacted
+
+def refresh_similarity_index(db: AppDatabase,
+                             instance_path: str,
+                             knowledge_dir: Optional[str] = KNOWLEDGE_DIR) -> dict:
+    """
+    Bring the index up to date with the database and knowledge files,
+    comparing content hashes and only reprocessing the difference. The
+    basis is refit if the index is missing or too much has changed.
+
+    Returns the number of documents that were added, changed, and
+    removed, plus whether a full rebuild happened.
+    """
+    docs = all_documents(db, knowledge_dir)
+    index = load_similarity_index(instance_path)
+    if index is None:
+        _write_index(instance_path, fit(docs))
+        return {'added': len(docs), 'changed': 0, 'removed': 0, 'rebuilt': True}
+    stored = {doc['key']: doc['hash'] for doc in index.docs}
+    current = {doc['key'] for doc in docs}
+    upserts = [doc for doc in docs if stored.get(doc['key']) != doc['hash']]
+    removed = [key for key in stored if key not in current]
+    report = {'added': len([doc for doc in upserts if doc['key'] not in stored]),
+              'changed': len([doc for doc in upserts if doc['key'] in stored]),
+              'removed': len(removed),
+              'rebuilt': False}
+    if len(upserts) + len(removed) > REFIT_RATIO * max(index.fitted_docs, 1):
+        _write_index(instance_path, fit(docs))
+        report['rebuilt'] = True
+    elif upserts or removed:
+        _apply_changes(instance_path, index, upserts, removed)
+    return report
+
+def update_faq_similarity(db: AppDatabase, faq_ids: Iterable[int], instance_path: str) -> None:
+    "Fold the current state of the given FAQ entries into the index, if it exists."
+    index = load_similarity_index(instance_path)
+    if index is None:
+        return
+    faq_ids = list(faq_ids)
+    entries = {entry['id']: entry for entry in db.faq_entries_by_ids(faq_ids)}
+    upserts = [faq_document(entries[faq_id]) for faq_id in faq_ids if faq_id in entries]
+    removed = [f"faq:{faq_id}" for faq_id in faq_ids if faq_id not in entries]
+    _apply_changes(instance_path, index, upserts, removed)
+
+# Queries
+
+def similar_documents(query: str, instance_path: str, k: int = 10) -> list[tuple[str, float]]:
+    "Top k (key, cosine score) pairs over FAQ entries and knowledge chunks."
+    index = load_similarity_index(instance_path)
+    if index is None:
+        return []
+    return index.query(query, k)
+
+def similar_faq_ids(query: str,
+                    instance_path: str,
+                    k: int = 10,
+                    min_score: float = 0.0) -> list[int]:
+    "Top k FAQ entry IDs for query, most similar first."
+    index = load_similarity_index(instance_path)
+    if index is None:
+        return []
+    return [int(key.split(':', 1)[1])
+            for key, score in index.query(query, k, prefix='faq:')
+            if score >= min_score]
@@ -2,32 +2,85 @@
 Web server layer that serves HTML, CSS, JSON, etc.
 """
 
+# Note: Every route lives in this one module, which makes it long.
+#
+# pylint:disable=too-many-lines
+
+# Note: The chatbot (openai and irc), the search indexes (whoosh and
+# numpy), the bulk job, and the sample data are imported by the
+# functions that use them. Every worker, test run, and CLI command
+# imports this module, and most of them never need all of those.
+#
+# pylint:disable=import-outside-toplevel
+
+import hashlib
+import inspect
+import json
+import mimetypes
 import os
 
 import secrets
+import threading
+import time
 
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Optional
 
 from datetime import datetime
+from datetime import timezone
 
-from markdown_it import MarkdownIt
+import click
 
 from flask import Flask
 from flask import Response
 from flask import abort
 from flask import flash
+from flask import g
+from flask import get_flashed_messages
 from flask import redirect
 from flask import render_template
 from flask import request
+from flask import send_from_directory
 from flask import session
+from flask import stream_with_context
 from flask import url_for
 
 from flask_bcrypt import Bcrypt
 
-from vts.chat import reply_to_message
+from werkzeug.http import is_resource_modified
 
+from vts.assets import ASSET_MAX_AGE
+from vts.assets import MANIFEST_FILE_NAME
+from vts.assets import assets_are_stale
+from vts.assets import assets_path
+from vts.assets import build_assets
+from vts.assets import encoded_variant
+from vts.assets import load_manifest
+from vts.assets import templates_modified
+from vts.assets import templates_version
+
+from vts.config import load_config_section
 from vts.config import load_postgres_config
 
+from vts.auth import LoginBusy
+from vts.auth import LoginThrottled
+from vts.auth import auth_settings
+from vts.auth import check_login
+
+from vts.batch import BatchError
+from vts.batch import parse_batch
+
+from vts.cache import ALL_FAQ_TAG
+from vts.cache import CATEGORIES_TAG
+from vts.cache import PageCache
+from vts.cache import category_tag
+from vts.cache import faq_tag
+
+from vts.compression import COMPRESSED_MIMETYPES
+from vts.compression import MIN_COMPRESSED_SIZE
+from vts.compression import choose_encoding
+from vts.compression import compress
+from vts.compression import compress_stream
+
 from vts.database import AppDatabase
 from vts.database import Engine
 from vts.database import FAQEntry
@@ -36,16 +89,30 @@ from vts.database import FAQCategory
 from vts.frontend import MENU_ITEMS
 from vts.frontend import TITLES
 
-from vts.sample_faq import add_sample_questions
-from vts.test_data import fill_debug_database
-
-from vts.search import ensure_index
-from vts.search import build_index
-from vts.search import search_faq_ids
-from vts.search import fetch_entries_by_ids
-from vts.search import add_faq_to_index
-from vts.search import update_faq_in_index
-from vts.search import remove_faq_from_index
+from vts.locks import LOCK_TIMEOUT
+from vts.locks import LockTimeout
+from vts.locks import file_lock
+
+from vts.metrics import add_collector
+from vts.metrics import collect
+from vts.metrics import increment
+from vts.metrics import observe
+from vts.metrics import render as render_metrics
+from vts.metrics import save_snapshot
+from vts.metrics import set_value
+from vts.metrics import track_sql
+
+from vts.profiling import RequestProfiler
+from vts.profiling import folded_stacks
+from vts.profiling import load_profile
+from vts.profiling import save_profile
+from vts.profiling import slowest_profiles
+
+from vts.render import RENDER_VERSION
+from vts.render import render_faq_html
+from vts.render import render_markdown
+from vts.render import rerender_stale_entries
+from vts.render import stored_html
 
 app = Flask(__name__)
 flask_bcrypt = Bcrypt(app)
@@ -57,6 +124,63 @@ TEST_DATA: bool = False
 
 TEST_ENGINE: Engine = Engine.SQLITE_FILE
 
+# How often, in seconds, the search indexes are reconciled with the
+# database. This can be overridden by `reconcile_interval` in the
+# [search] section of the config, where 0 turns it off.
+RECONCILE_INTERVAL: float = 300
+
+# Set once the reconcile schedule is running so that warm_up() can
+# run again (e.g. when resetting the test DB) without starting another.
+RECONCILE_STARTED = threading.Event()
+
+# Set once warm_up() has finished. Until then, pages wait for it and
+# /ready reports that the app isn't ready.
+READY = threading.Event()
+WARM_UP_LOCK = threading.Lock()
+
+# Set while warm_up() runs in the background for /ready.
+WARM_UP_STARTED = threading.Event()
+
+# The lock that lets only one worker of a pre-fork server warm up at a
+# time, so the database, the assets, and the search indexes are only
+# created once
+WARM_UP_LOCK_FILE_NAME = "warm_up.lock"
+
+# The endpoints that don't wait for warm_up()
+WARM_UP_EXEMPT = frozenset(['ready', 'metrics', 'built_asset', 'static'])
+
+# Rendered pages for anonymous visitors. The size can be overridden by
+# `max_pages` in the [cache] section of the config, and how long, in
+# seconds, the content version is reused by `version_ttl`.
+PAGE_CACHE = PageCache()
+
+# How many template statements are rendered before a chunk is sent
+# when streaming a page.
+STREAM_BUFFER_SIZE = 32
+
+# How long, in seconds, browsers can reuse an FAQ answer fetched by a
+# page before revalidating it with its ETag.
+FRAGMENT_MAX_AGE = 60
+
+# Maps the URLs of the stylesheets and static files to the URLs of
+# their built, content-hashed copies. URLs that are missing from it
+# (e.g. before the first build) are served as they are.
+ASSET_MANIFEST: dict[str, str] = {}
+
+# How many FAQ entries are sent per chunk by the streamed FAQ dumps
+API_CHUNK_SIZE = 100
+
+# The separators of compact JSON, as Flask sends it
+JSON_SEPARATORS = (',', ':')
+
+# How many changes /api/changes returns by default and at most
+CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+
+# Streamed pages bigger than this many characters are not cached so
+# that streaming them keeps memory use flat.
+MAX_CACHED_STREAM_SIZE = 4 * 2**20
+
 def get_db () -> AppDatabase:
     "Retrieves the appropriate database."
     postgres = load_postgres_config()
@@ -74,13 +198,20 @@ def init_db (engine: Engine, bcrypt, test_data: bool) -> AppDatabase:
     db.initialize_metadata()
     print("Populating the database.")
     if test_data:
+        from vts.test_data import fill_debug_database
         fill_debug_database(db, bcrypt)
     else:
+        from vts.sample_faq import add_sample_questions
         add_sample_questions(db, bcrypt)
     return db
 
-def setup_app():
-    "Makes sure that the app has everything that it needs on startup."
+def create_app() -> Flask:
+    """
+    Configures the app from its instance directory. This only does
+    what every request needs and is cheap, so it runs on import. The
+    database, the search indexes, and the assets are set up later by
+    warm_up().
+    """
     # If the instance path that Flask uses for data doesn't exist,
     # create it now.
     try:
@@ -95,23 +226,309 @@ def setup_app():
             secret_file.write(secrets.token_hex())
     with open(secret_path, mode='r', encoding='utf8') as secret_file:
         app.secret_key = secret_file.read()
-    # The database must be in the instance directory.
-    db_path = os.path.join(app.instance_path, 'test.db')
-    # The path must be cached for future AppDatabase instances.
-    AppDatabase.path = db_path
-    # If the database is not there, then create it and populate it.
-    fresh_db = False
-    if not os.path.exists(db_path):
+    # The database must be in the instance directory. The path must be
+    # cached for future AppDatabase instances.
+    AppDatabase.path = os.path.join(app.instance_path, 'test.db')
+    cache_config = load_config_section('cache')
+    PAGE_CACHE.max_pages = cache_config.get('max_pages', PAGE_CACHE.max_pages)
+    PAGE_CACHE.version_ttl = cache_config.get('version_ttl', PAGE_CACHE.version_ttl)
+    # New password hashes use the work factor from the config.
+    app.config['BCRYPT_LOG_ROUNDS'] = auth_settings()['bcrypt_rounds']
+    flask_bcrypt.init_app(app)
+    track_sql()
+    return app
+
+def ensure_database() -> Optional[AppDatabase]:
+    """
+    Creates and populates the database if it isn't there yet, or adds
+    what newer code expects to an existing one. Returns the database
+    if it was just created.
+    """
+    if not os.path.exists(AppDatabase.path):
         init_db(TEST_ENGINE, flask_bcrypt, TEST_DATA)
-        fresh_db = True
-    # Builds search index.
-    db = get_db()
-    if fresh_db:
-        build_index(db, app.instance_path)
-    else:
-        ensure_index(db, app.instance_path)
+        return get_db()
+    added = get_db().upgrade_schema()
+    if added:
+        print(f"Added database columns: {added}")
+    return None
 
-setup_app()
+def warm_up(background: bool = True) -> None:
+    """
+    Makes sure that the app has everything that it needs before it
+    serves pages: the built assets, the database, and the search
+    indexes. Unless background is false, stale HTML is rendered in the
+    background and the search indexes are reconciled every so often.
+    """
+    READY.clear()
+    # Note: Under a pre-fork server, every worker warms up. The first one
+    # creates whatever is missing while the others wait, and then they
+    # find everything in place.
+    with file_lock(os.path.join(app.instance_path, WARM_UP_LOCK_FILE_NAME)):
+        update_assets()
+        fresh_db = ensure_database()
+        # Nothing cached from before this point, such as from the test DB
+        # that was just reset, can be trusted.
+        PAGE_CACHE.clear()
+        if fresh_db:
+            from vts.search import build_index
+            from vts.search import index_lock
+            from vts.similarity import build_similarity_index
+            rerender_stale_entries(fresh_db)
+            with index_lock(app.instance_path):
+                build_index(fresh_db, app.instance_path)
+                build_similarity_index(fresh_db, app.instance_path)
+        else:
+            reconcile_search(get_db(), app.instance_path)
+    if fresh_db is None:
+        if background:
+            # Pages render stale entries themselves until this catches up.
+            threading.Thread(target=rerender_faq, args=(get_db(),), daemon=True).start()
+        else:
+            rerender_faq(get_db())
+    interval = load_config_section('search').get('reconcile_interval', RECONCILE_INTERVAL)
+    if background and interval > 0 and not RECONCILE_STARTED.is_set():
+        RECONCILE_STARTED.set()
+        schedule_reconcile(interval)
+    READY.set()
+
+def ensure_warm() -> None:
+    "Warms the app up unless that was already done. Other callers wait for it meanwhile."
+    if READY.is_set():
+        return
+    with WARM_UP_LOCK:
+        if not READY.is_set():
+            warm_up()
+
+def start_warm_up() -> None:
+    "Warms the app up in the background unless that was already started."
+    with WARM_UP_LOCK:
+        if WARM_UP_STARTED.is_set():
+            return
+        WARM_UP_STARTED.set()
+
+    def run():
+        try:
+            ensure_warm()
+        # Note: The next request tries again and gets the error.
+        #
+        # pylint:disable-next=broad-exception-caught
+        except Exception as error:
+            print(f"Warming up failed: {error!r}")
+        finally:
+            WARM_UP_STARTED.clear()
+
+    threading.Thread(target=run, daemon=True).start()
+
+def reconcile_search(db: AppDatabase, instance_path: str, timeout: float = LOCK_TIMEOUT) -> dict:
+    """
+    Reconciles the search indexes with the database, only reindexing
+    entries that differ, and reports any drift that was found. Raises
+    LockTimeout if another worker was changing the indexes for longer
+    than timeout seconds.
+    """
+    from vts.search import ensure_index
+    from vts.search import index_lock
+    from vts.similarity import refresh_similarity_index
+    with index_lock(instance_path, timeout):
+        report = ensure_index(db, instance_path)
+        report['similarity'] = refresh_similarity_index(db, instance_path)
+    similarity = report['similarity']
+    drift = [report['rebuilt'], report['added'], report['updated'], report['removed'],
+             similarity['added'], similarity['changed'], similarity['removed']]
+    if any(drift):
+        print(f"Search index drift found and fixed: {report}")
+        # Whatever changed behind our back might be on cached pages, in
+        # this worker and every other one.
+        db.touch_content_version()
+    return report
+
+def rerender_faq(db: AppDatabase) -> int:
+    "Stores freshly rendered HTML for the entries that need it and reports how many there were."
+    count = rerender_stale_entries(db)
+    if count:
+        print(f"Rendered the stored HTML of {count} FAQ entries.")
+        db.touch_content_version()
+    return count
+
+def update_assets(rebuild: bool = False) -> dict[str, str]:
+    """
+    Builds the stylesheets and static files if they changed since the
+    last build (or always, with rebuild) and loads their manifest.
+    """
+    if rebuild or assets_are_stale(app.instance_path):
+        with app.app_context():
+            manifest = build_assets(app.instance_path, render_template)
+        print(f"Built {len(manifest)} assets.")
+    else:
+        manifest = load_manifest(app.instance_path)
+    ASSET_MANIFEST.clear()
+    ASSET_MANIFEST.update(manifest)
+    # Pages change when the templates or the renderer change, too.
+    app.config['SITE_VERSION'] = f"{RENDER_VERSION}:{templates_version(manifest)}"
+    modified = max(templates_modified(app.instance_path),
+                   os.path.getmtime(inspect.getfile(render_faq_html)))
+    app.config['SITE_MODIFIED'] = datetime.fromtimestamp(modified, timezone.utc)
+    return manifest
+
+@app.template_global()
+def asset_url(url: str) -> str:
+    "The URL of the built copy of a stylesheet or static file, e.g. /base.css."
+    return ASSET_MANIFEST.get(url, url)
+
+def schedule_reconcile(interval: float) -> threading.Timer:
+    "Reconciles the search indexes every interval seconds in the background."
+    def run():
+        try:
+            reconcile_search(get_db(), app.instance_path, timeout=0)
+        except LockTimeout:
+            # Another worker is already on it.
+            pass
+        finally:
+            schedule_reconcile(interval)
+    timer = threading.Timer(interval, run)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+def collect_page_cache_metrics() -> None:
+    "Copies the statistics of the page cache into the metrics."
+    stats = PAGE_CACHE.stats()
+    set_value('vts_cache_requests_total', stats['hits'], ('page', 'hit'))
+    set_value('vts_cache_requests_total', stats['misses'], ('page', 'miss'))
+    set_value('vts_page_cache_pages', stats['pages'])
+
+add_collector(collect_page_cache_metrics)
+
+create_app()
+
+@app.before_request
+def start_request_metrics():
+    "Starts timing the request and counts it as in flight."
+    g.metrics_start = time.perf_counter()
+    increment('vts_http_requests_in_flight')
+
+@app.after_request
+def note_response_status(response: Response) -> Response:
+    "Keeps the status of the response for the request metrics."
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error: Optional[BaseException]):
+    """
+    Records the time that the request took under its route, once its
+    response has been sent when it is streamed with the request context.
+    """
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    # Note: The endpoint, unlike the path, can't be made up by clients,
+    # so the number of series stays small. Unknown pages have none.
+    route = request.endpoint or 'none'
+    status = 500 if error is not None else g.get('metrics_status', 500)
+    observe('vts_http_request_duration_seconds',
+            time.perf_counter() - start,
+            (route, request.method))
+    increment('vts_http_requests_total', (route, request.method, str(status)))
+    increment('vts_http_requests_in_flight', amount=-1)
+    save_snapshot(app.instance_path)
+
+@app.before_request
+def wait_until_warm():
+    "Holds requests for pages until the app has warmed up."
+    if request.endpoint not in WARM_UP_EXEMPT:
+        ensure_warm()
+
+@app.before_request
+def start_profiling():
+    "Profiles the request if an admin asked for it with ?profile=1 or an X-Profile header."
+    if (request.args.get('profile') or request.headers.get('X-Profile')) and get_admin_status():
+        g.profiler = RequestProfiler(threading.get_ident())
+        g.profiler.start()
+
+@app.after_request
+def finish_profiling(response: Response) -> Response:
+    "Saves the profile of a profiled request once its response has been sent."
+    profiler = g.get('profiler')
+    if profiler is None:
+        return response
+    method, path, status = request.method, request.full_path, response.status_code
+
+    def save():
+        profiler.stop()
+        save_profile(app.instance_path, profiler.profile(method, path, status))
+
+    response.call_on_close(save)
+    response.headers['X-Profile'] = profiler.name
+    return response
+
+@app.route("/ready")
+def ready():
+    """
+    Whether the app has warmed up and can serve pages, for load
+    balancers and deploy scripts. Asking starts the warm-up.
+    """
+    if READY.is_set():
+        return {'ready': True}
+    start_warm_up()
+    response = app.json.response({'ready': False})
+    response.status_code = 503
+    response.retry_after = 1
+    return response
+
+@app.route("/metrics")
+def metrics():
+    """
+    The metrics of every worker process in the Prometheus text format.
+    If the [metrics] section of the config has a token, scrapers must
+    send it as a bearer token.
+    """
+    token = load_config_section('metrics').get('token')
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''),
+                                            f"Bearer {token}"):
+        abort(401)
+    from vts.search import index_stats
+    stats = index_stats(app.instance_path)
+    gauges = {f'vts_search_index_{key}': value for key, value in stats.items()}
+    return Response(render_metrics(collect(app.instance_path), gauges),
+                    mimetype='text/plain',
+                    headers={'Cache-Control': 'no-store'})
+
+@app.cli.command("warm-up")
+def warm_up_command():
+    "Builds the assets, the database, and the search indexes that the first request needs."
+    start = time.perf_counter()
+    warm_up(background=False)
+    print(f"Warmed up in {time.perf_counter() - start:.2f}s.")
+
+@app.cli.command("reconcile-index")
+def reconcile_index_command():
+    "Reconciles the search indexes with the database and prints the drift."
+    ensure_database()
+    print(reconcile_search(get_db(), app.instance_path))
+
+@app.cli.command("rerender-faq")
+def rerender_faq_command():
+    "Renders the stored HTML of FAQ entries that were rendered by an older renderer."
+    ensure_database()
+    print(f"{rerender_faq(get_db())} entries rendered.")
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    "Builds the content-hashed and precompressed stylesheets and static files."
+    update_assets(rebuild=True)
+
+@app.cli.command("reprocess-faq")
+@click.option('--workers', default=0, help='Worker processes (default: the CPU count).')
+@click.option('--render/--no-render', default=True, help='Render the stored HTML again.')
+@click.option('--reindex/--no-reindex', default=True, help='Rebuild the search index.')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming.')
+def reprocess_faq_command(workers: int, render: bool, reindex: bool, restart: bool):
+    "Renders and reindexes every FAQ entry in parallel, resuming an interrupted run."
+    from vts.bulk import reprocess_faq
+    ensure_database()
+    print(reprocess_faq(get_db(), app.instance_path,
+                        workers=workers, render=render, reindex=reindex, restart=restart))
 
 def delete_test_db() -> bool:
     "Delete the test DB so the DB can be recreated."
@@ -131,46 +548,55 @@ def delete_test_db() -> bool:
 
 def markdown(text: str):
     "Gives a modern table-friendly markdown renderer an API similar to the legacy one."
-    md = MarkdownIt('commonmark', {'breaks':True, 'html':True}).enable('table')
-    return md.render(text)
+    return render_markdown(text)
 
 # This provides a section separator (which should be HTML <hr />) to
 # the end of certain markdown items.
 MARKDOWN_SEPARATOR = markdown('---')
 
-def faq_entries_to_markdown(faq_entries: list[dict]) -> list[dict]:
-    "Turn FAQ questions and answers into markdown."
-    result = []
+def iter_faq_entries_as_markdown(faq_entries: Iterable[dict]) -> Iterator[dict]:
+    "Turn FAQ questions and answers into markdown one entry at a time."
     for item in faq_entries:
         entry = item.copy()
-        question = markdown(item['question_text'])
-        answer = markdown(item['answer_text'])
+        question = stored_html(item, 'question')
+        answer = stored_html(item, 'answer')
         markdown_text = question + MARKDOWN_SEPARATOR + answer
         entry['text'] = markdown_text
-        result.append(entry)
-    return result
+        yield entry
+
+def iter_faq_titles_as_markdown(faq_entries: Iterable[dict]) -> Iterator[dict]:
+    "Turn FAQ questions into markdown one entry at a time."
+    for item in faq_entries:
+        yield {'text': stored_html(item, 'question'),
+               'url': f'/faq/{item["id"]}'}
 
-def faq_titles_to_markdown(faq_entries: list[dict]) -> list[dict]:
-    "Turn FAQ questions into markdown."
-    return [{'text': markdown(item['question_text']),
-             'url': f'/faq/{item["id"]}'}
-            for item in faq_entries]
+def faq_entries_to_markdown(faq_entries: Iterable[dict]) -> list[dict]:
+    "Turn FAQ questions and answers into markdown, using the stored HTML when it is current."
+    return list(iter_faq_entries_as_markdown(faq_entries))
 
-def get_faq_entries_as_markdown(db: AppDatabase):
+def faq_titles_to_markdown(faq_entries: Iterable[dict]) -> list[dict]:
+    "Turn FAQ questions into markdown, using the stored HTML when it is current."
+    return list(iter_faq_titles_as_markdown(faq_entries))
+
+# Note: The listings of all entries or of a category can be as long as
+# the FAQ, so they are generators that read, render, and pass entries
+# to a streamed template a batch at a time.
+
+def get_faq_entries_as_markdown(db: AppDatabase) -> Iterator[dict]:
     "Retrieve all FAQ entries as markdown."
-    return faq_entries_to_markdown(db.faq_entries())
+    return iter_faq_entries_as_markdown(db.iter_faq_entries())
 
-def get_faq_categorized_entries_as_markdown(db: AppDatabase, category_id: int):
+def get_faq_categorized_entries_as_markdown(db: AppDatabase, category_id: int) -> Iterator[dict]:
     "Retrieve FAQ entries as markdown in a category."
-    return faq_entries_to_markdown(db.faq_entries_by_category(category_id))
+    return iter_faq_entries_as_markdown(db.iter_faq_entries(category_id))
 
 def get_faq_entry_as_markdown(faq_id: int):
     "Retrieve all FAQ entries as markdown."
     return lambda db : faq_entries_to_markdown(db.faq_entry(faq_id))
 
-def get_faq_titles_as_markdown(db: AppDatabase):
+def get_faq_titles_as_markdown(db: AppDatabase) -> Iterator[dict]:
     "Retrieve all FAQ titles (questions) as markdown."
-    return faq_titles_to_markdown(db.faq_entries())
+    return iter_faq_titles_as_markdown(db.iter_faq_entries())
 
 # This is based on the assumption that there aren't many categories
 # and that it's cheaper to iterate over the category dict than to talk
@@ -189,24 +615,226 @@ def get_admin_status() -> Optional[dict]:
                 'user_id': session['user_id']}
     return None
 
+def page_cache_key() -> tuple:
+    "Identifies the current page by its route and parameters."
+    return (request.endpoint,
+            tuple(sorted((request.view_args or {}).items())),
+            tuple(sorted(request.args.items(multi=True))))
+
+def can_cache_page() -> bool:
+    "Pages for admins or with flashed messages are not the same for every visitor."
+    return not get_admin_status() and not session.get('_flashes')
+
+def content_validators() -> tuple[str, datetime]:
+    """
+    The ETag and the Last-Modified time of everything that is rendered
+    from the FAQ. Both come from the content version in the database
+    and the site version, so they are the same on every server and
+    change after a deploy, too. The page cache keeps the content
+    version for a moment, so most requests don't query it.
+    """
+    version, modified = PAGE_CACHE.content_version(lambda: get_db().content_version())
+    site_version = app.config.get('SITE_VERSION', '')
+    etag = hashlib.sha256(f"{site_version}:{version}".encode('utf8')).hexdigest()[:32]
+    # Note: The timestamps are stored in local time.
+    modified = modified.astimezone(timezone.utc)
+    return etag, max(modified, app.config.get('SITE_MODIFIED', modified))
+
+def not_modified(etag: str, modified: datetime) -> Optional[Response]:
+    "Returns a 304 response if the client already has this version of the page."
+    if is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        return None
+    return with_validators(Response(status=304), etag, modified)
+
+def with_validators(response: Response, etag: str, modified: datetime) -> Response:
+    "Adds the validators and makes browsers revalidate before they reuse the response."
+    # Note: The ETag is weak because it identifies the content, not the
+    # bytes, which differ between the compressed and uncompressed page.
+    response.set_etag(etag, weak=True)
+    response.last_modified = modified
+    response.cache_control.no_cache = True
+    return response
+
+def conditional(render: Callable[[], Response]) -> Response:
+    "Only renders the response if the client doesn't already have the current version."
+    etag, modified = content_validators()
+    return not_modified(etag, modified) or with_validators(render(), etag, modified)
+
+def cached_page(render: Callable[[], tuple[str, Iterable[str]]]) -> Response | str:
+    """
+    Returns the current page from the page cache. On a miss, render
+    returns the page and the tags of what it was rendered from. Pages
+    that can't be shared between visitors bypass the cache. A cached
+    page is only used if the content version hasn't changed since, and
+    clients that already have the current version get a 304.
+    """
+    if not can_cache_page():
+        return render()[0]
+    etag, modified = content_validators()
+    unchanged = not_modified(etag, modified)
+    if unchanged:
+        return unchanged
+    key = page_cache_key()
+    html = PAGE_CACHE.get(key, etag)
+    if html is None:
+        html, tags = render()
+        PAGE_CACHE.put(key, html, tags, etag)
+    return with_validators(send_cached_page(key, html, etag), etag, modified)
+
+def send_cached_page(key: tuple, html: str, version: str) -> Response:
+    """
+    Sends a cached page, compressed if the client accepts it. The
+    compressed body is cached next to the page, so a popular page is
+    compressed once per content version instead of once per request.
+    """
+    encoding = choose_encoding(request.accept_encodings.quality)
+    if encoding is None or len(html) < MIN_COMPRESSED_SIZE:
+        return Response(html)
+    body = PAGE_CACHE.get_compressed(key, encoding, version)
+    if body is None:
+        body = compress(html.encode('utf8'), encoding)
+        PAGE_CACHE.put_compressed(key, encoding, body, version)
+    response = Response(body, mimetype='text/html')
+    response.content_encoding = encoding
+    return response
+
+def stream_page(template_name: str, **context) -> Iterator[str]:
+    """
+    Renders a template as it is sent, a few statements at a time, so
+    that the page never has to be in memory as a whole.
+    """
+    # The session cookie is saved before the page is rendered, so the
+    # flashed messages are taken from it now. The template gets them
+    # from the request context, where Flask keeps them.
+    get_flashed_messages()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return stream_with_context(stream)
+
+def cached_stream(render: Callable[[], tuple[Iterator[str], list[str]]]) -> Response:
+    """
+    Like cached_page(), but for pages that are streamed. On a miss,
+    the page is streamed and cached once it has been sent completely,
+    so the tags, which render can fill in while streaming, are
+    complete by then. Pages bigger than MAX_CACHED_STREAM_SIZE are
+    streamed without being cached.
+    """
+    if not can_cache_page():
+        return Response(render()[0])
+    etag, modified = content_validators()
+    unchanged = not_modified(etag, modified)
+    if unchanged:
+        return unchanged
+    key = page_cache_key()
+    html = PAGE_CACHE.get(key, etag)
+    if html is not None:
+        return with_validators(send_cached_page(key, html, etag), etag, modified)
+    chunks, tags = render()
+
+    def send_and_cache() -> Iterator[str]:
+        parts: Optional[list[str]] = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size <= MAX_CACHED_STREAM_SIZE:
+                    parts.append(chunk)
+                else:
+                    parts = None
+            yield chunk
+        if parts is not None:
+            PAGE_CACHE.put(key, ''.join(parts), tags, etag)
+
+    return with_validators(Response(send_and_cache()), etag, modified)
+
+def invalidate_faq_pages(faq_id: int,
+                         related_ids: Iterable[int] = (),
+                         category_id=None) -> None:
+    """
+    Removes the cached pages that an added, edited, or removed FAQ
+    entry is on, including the pages of the entries whose related
+    questions changed because of it. The category is the one the entry
+    is now in, if any.
+    """
+    tags = [ALL_FAQ_TAG, faq_tag(faq_id), *[faq_tag(related_id) for related_id in related_ids]]
+    if category_id is not None:
+        tags.append(category_tag(int(category_id)))
+    PAGE_CACHE.invalidate(*tags)
+
+def update_search_indexes(db: AppDatabase,
+                          faq_ids: Iterable[int],
+                          reindex_ids: Iterable[int] = (),
+                          instance_path: Optional[str] = None) -> list[int]:
+    """
+    Updates the search indexes, with one commit each, for FAQ entries
+    that were added, edited, or removed and returns the entries whose
+    related questions changed. The reindexed entries are only written
+    to the search index again, e.g. because their category was renamed.
+    The indexes are in the app's instance path unless another is given.
+    """
+    from vts import search
+    from vts.similarity import update_faq_similarity
+    instance_path = instance_path or app.instance_path
+    faq_ids = list(faq_ids)
+    with search.index_lock(instance_path):
+        search.update_index_entries(db, [*faq_ids, *reindex_ids], instance_path)
+        update_faq_similarity(db, faq_ids, instance_path)
+        return search.refresh_related(db, faq_ids, instance_path)
+
+@app.after_request
+def compress_response(response: Response) -> Response:
+    """
+    Compresses text responses that are big enough to be worth it with
+    the encoding that the client prefers. Streamed responses are
+    compressed as they are sent. Responses that are already
+    compressed, such as cached pages and built assets, are left alone.
+    """
+    if response.mimetype not in COMPRESSED_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or response.content_encoding or response.direct_passthrough:
+        return response
+    encoding = choose_encoding(request.accept_encodings.quality)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESSED_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+    response.content_encoding = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
 # Note: This is a separate function from home() to make things
 # independently testable in the unit tests. Other functions behave
 # similarly.
 def create_home(db: AppDatabase, admin_status: Optional[dict]) -> dict:
-    "Generates arguments to create the homepage template."
+    """
+    Generates arguments to create the homepage template. The titles
+    are a generator, so they are read as the template is streamed. The
+    answers are fetched from faq_item_json() when a title is clicked.
+    """
     items = get_faq_titles_as_markdown(db)
-    full_items = get_faq_entries_as_markdown(db)
     return {'title': TITLES['main-page'],
             'menu_items': MENU_ITEMS,
             'faq_items': items,
-            'faq_full_items': full_items,
             'admin': admin_status}
 
 @app.route("/")
 def home():
     "The main entry point to the app."
-    args = create_home(get_db(), get_admin_status())
-    return render_template('main-page.html', **args)
+    def render():
+        args = create_home(get_db(), get_admin_status())
+        return stream_page('main-page.html', **args), [ALL_FAQ_TAG]
+
+    return cached_stream(render)
 
 def create_how_to_page(admin_status: Optional[dict]) -> dict:
     "Generates arguments to create the how-to page template."
@@ -220,64 +848,94 @@ def how_to_page():
     args = create_how_to_page(get_admin_status())
     return render_template('how-to.html', **args)
 
-def faq_search(db: AppDatabase, query, instance_path) -> list[dict]:
-    "Runs a search on query using the instance path, returning results from db as markdown."
-    matched_ids = search_faq_ids(query, instance_path)
-    faq_entries = fetch_entries_by_ids(db, matched_ids) if matched_ids else []
-    return faq_entries_to_markdown(faq_entries)
+# Similarity matches below this cosine score are too weak to show.
+MIN_SIMILARITY = 0.2
 
-def faq_admin(db: AppDatabase,
-              admin_status: Optional[dict],
-              query,
-              category,
-              instance_path) -> dict:
-    "The admin FAQ with search page."
-    if category:
-        try:
-            category_id = int(category)
-        except ValueError:
-            category_id = None
-        if category_id is not None:
-            items = get_faq_categorized_entries_as_markdown(db, category_id)
-        else:
-            items = get_faq_entries_as_markdown(db)
-    elif query:
-        items = faq_search(db, query, instance_path)
+def parse_category_id(category) -> Optional[int]:
+    "Turns the category URL parameter into a category ID, or None if it isn't one."
+    try:
+        return int(category)
+    except (TypeError, ValueError):
+        return None
+
+def faq_search(db: AppDatabase,
+               query,
+               instance_path,
+               category_id: Optional[int] = None) -> tuple[list[dict], dict]:
+    """
+    Runs a search on query using the instance path, optionally within a
+    category, returning results from db as markdown along with the
+    number of matches in each category.
+    """
+    from vts.search import fetch_entries_by_ids
+    from vts.search import search_faq
+    from vts.similarity import similar_faq_ids
+    # Keyword search misses paraphrases so similar entries that it
+    # didn't find go after the keyword matches, and are counted too.
+    results = search_faq(query, instance_path, category_id,
+                         extra_ids=similar_faq_ids(query, instance_path,
+                                                   min_score=MIN_SIMILARITY))
+    matched_ids = results['ids']
+    faq_entries = fetch_entries_by_ids(db, matched_ids) if matched_ids else []
+    return faq_entries_to_markdown(faq_entries), results['facets']
+
+def faq_listing(db: AppDatabase,
+                query,
+                category,
+                instance_path,
+                lazy_answers: bool = False) -> dict:
+    """
+    The FAQ entries for the FAQ with search pages, which can be a
+    search, a category, or a search within a category. With
+    lazy_answers, browsing without a search only lists the questions
+    and the page fetches an answer when its question is opened.
+    """
+    category_id = parse_category_id(category)
+    category_counts: dict = {}
+    items: Iterable[dict]
+    lazy_answers = lazy_answers and not query
+    if query:
+        items, category_counts = faq_search(db, query, instance_path, category_id)
+    elif lazy_answers:
+        items = iter_faq_titles_as_markdown(db.iter_faq_entries(category_id))
+    elif category_id is not None:
+        items = get_faq_categorized_entries_as_markdown(db, category_id)
     else:
         items = get_faq_entries_as_markdown(db)
     categories = db.faq_categories()
     selected_category = 'All Categories'
-    if category and category_id is not None:
+    if category_id is not None:
         name = find_category_name(categories, category_id)
         if name:
             selected_category = name
+    return {'category_items': categories,
+            'category_counts': category_counts,
+            'category_id': category_id,
+            'faq_items': items,
+            'lazy_answers': lazy_answers,
+            'query': query,
+            'selected_category': selected_category}
 
+def faq_admin(db: AppDatabase,
+              admin_status: Optional[dict],
+              query,
+              category,
+              instance_path) -> dict:
+    "The admin FAQ with search page."
     return {'title': TITLES['admin-faq-search'],
             'menu_items': MENU_ITEMS,
-            'category_items': categories,
-            'faq_items': items,
-            'query': query,
-            'selected_category': selected_category,
+            **faq_listing(db, query, category, instance_path),
             'test_db': db.engine_type == TEST_ENGINE,
             'admin': admin_status}
 
 def faq_nonadmin(db: AppDatabase,
                  query,
-                 instance_path) -> dict:
+                 instance_path,
+                 category = '') -> dict:
     "The non-admin FAQ with search page."
-    if query:
-        items = faq_search(db, query, instance_path)
-    else:
-        items = get_faq_entries_as_markdown(db)
-    categories = db.faq_categories()
-    # Default selected category for the public FAQ page is 'All Categories'
-    selected_category = 'All Categories'
     return {'title': TITLES['faq-search'],
             'menu_items': MENU_ITEMS,
-            'category_items': categories,
-            'faq_items': items,
-            'query': query,
-            'selected_category': selected_category,
+            **faq_listing(db, query, category, instance_path, lazy_answers=True),
             'admin': None}
 
 @app.route("/faq-search.html")
@@ -286,17 +944,24 @@ def faq_page():
     db = get_db()
     admin_status = get_admin_status()
     query = request.args.get('query', '').strip()
+    category = request.args.get('category', '').strip()
     if admin_status:
-        category = request.args.get('category', '').strip()
         args = faq_admin(db, admin_status, query, category, app.instance_path)
-        return render_template('admin-faq-search.html', **args)
-    args = faq_nonadmin(db, query, app.instance_path)
-    return render_template('faq-search.html', **args)
+        return Response(stream_page('admin-faq-search.html', **args))
+
+    def render():
+        args = faq_nonadmin(db, query, app.instance_path, category)
+        return stream_page('faq-search.html', **args), [ALL_FAQ_TAG, CATEGORIES_TAG]
+
+    return cached_stream(render)
 
 @app.route("/faq/<int:faq_id>")
 def faq_item_page(faq_id: int):
     "The page for a specific FAQ item."
-    db = get_db()
+    return cached_page(lambda: render_faq_item_page(get_db(), faq_id))
+
+def render_faq_item_page(db: AppDatabase, faq_id: int) -> tuple[str, list[str]]:
+    "Renders the page for a specific FAQ item and lists what it was rendered from."
     items = get_faq_entry_as_markdown(faq_id)(db)
     categories = db.faq_categories()
     admin_status = get_admin_status()
@@ -308,30 +973,94 @@ def faq_item_page(faq_id: int):
             name = find_category_name(categories, category_id)
             if name:
                 selected_category = name
-    return render_template(template_page,
+    # Note: The related questions are precomputed, so this is one
+    # primary key lookup and no search.
+    from vts.search import fetch_entries_by_ids
+    from vts.search import related_faq_ids
+    related_ids = related_faq_ids(faq_id, app.instance_path) if items else []
+    related_items = faq_titles_to_markdown(fetch_entries_by_ids(db, related_ids)) \
+        if related_ids else []
+    html = render_template(template_page,
                            title=TITLES['faq-item'](faq_id), # type: ignore
                            menu_items=MENU_ITEMS,
                            category_items=categories,
                            faq_items=items,
+                           related_items=related_items,
                            selected_category=selected_category,
                            admin=admin_status)
+    return html, [faq_tag(faq_id), CATEGORIES_TAG, *[faq_tag(i) for i in related_ids]]
+
+@app.route("/faq/<int:faq_id>.json")
+def faq_item_json(faq_id: int):
+    """
+    The rendered question and answer of a specific FAQ item, which
+    pages fetch when a question is opened instead of sending every
+    answer up front. It is the same for every visitor, so it can be
+    cached by browsers and revalidated with its ETag. Like the pages,
+    it is cached for the content version, so edits made by other
+    processes are seen too.
+    """
+    etag, modified = content_validators()
+    if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        return fragment_response(Response(status=304), etag, modified)
+    key = ('faq_item_json', faq_id)
+    body = PAGE_CACHE.get(key, etag)
+    if body is None:
+        entries = get_db().faq_entry(faq_id)
+        if not entries:
+            abort(404)
+        body = json.dumps({'id': faq_id,
+                           'question_html': stored_html(entries[0], 'question'),
+                           'answer_html': stored_html(entries[0], 'answer'),
+                           'url': url_for('faq_item_page', faq_id=faq_id)})
+        PAGE_CACHE.put(key, body, [faq_tag(faq_id)], etag)
+    return fragment_response(Response(response=body, mimetype='application/json'),
+                             etag, modified)
+
+def fragment_response(response: Response, etag: str, modified: datetime) -> Response:
+    "Adds the validators and lets browsers reuse a page fragment for a while."
+    response = with_validators(response, etag, modified)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = FRAGMENT_MAX_AGE
+    return response
 
 @app.route("/faq/category/<int:category_id>")
 def faq_category_page(category_id: int):
     "The page for all entries of a given category."
-    db = get_db()
-    items = get_faq_categorized_entries_as_markdown(db, category_id)
+    return cached_stream(lambda: stream_faq_category_page(get_db(), category_id))
+
+def stream_faq_category_page(db: AppDatabase, category_id: int) -> tuple[Iterator[str], list[str]]:
+    """
+    Streams the page for all entries of a given category. The tags of
+    what it was rendered from are complete once it has been streamed.
+    """
     categories = db.faq_categories()
     name = find_category_name(categories, category_id)
-    template_page = 'admin-faq-search.html' if get_admin_status() else 'faq-search.html'
+    admin_status = get_admin_status()
+    template_page = 'admin-faq-search.html' if admin_status else 'faq-search.html'
+    # Note: An entry that moves out of this category invalidates its
+    # own tag, and an entry that moves in invalidates the category tag.
+    tags = [category_tag(category_id), CATEGORIES_TAG]
+
+    def entries():
+        for entry in db.iter_faq_entries(category_id):
+            tags.append(faq_tag(entry['id']))
+            yield entry
+
+    # Admins see every answer, but visitors only open one or two.
+    items = iter_faq_entries_as_markdown(entries()) if admin_status \
+        else iter_faq_titles_as_markdown(entries())
     # When viewing a specific category, set the selected category name
-    return render_template(template_page,
-                           title=TITLES['category-page'](category_id, name), # type: ignore
-                           menu_items=MENU_ITEMS,
-                           category_items=categories,
-                           faq_items=items,
-                           selected_category=name,
-                           admin=get_admin_status())
+    chunks = stream_page(template_page,
+                         title=TITLES['category-page'](category_id, name), # type: ignore
+                         menu_items=MENU_ITEMS,
+                         category_items=categories,
+                         faq_items=items,
+                         lazy_answers=not admin_status,
+                         selected_category=name,
+                         admin=admin_status)
+    return chunks, tags
 
 @app.route("/admin-login.html")
 def admin_login():
@@ -361,6 +1090,40 @@ def category_admin():
                            category_items=categories,
                            admin=get_admin_status())
 
+@app.route("/admin-profiles.html")
+def profile_admin():
+    "The admin page that lists the slowest of the recently profiled requests."
+    if not get_admin_status():
+        abort(403)
+
+    return render_template('admin-profiles.html',
+                           title=TITLES['admin-profiles'],
+                           menu_items=MENU_ITEMS,
+                           profiles=slowest_profiles(app.instance_path),
+                           admin=get_admin_status())
+
+@app.route("/admin-profiles/<name>.json")
+def profile_json(name: str):
+    "A saved request profile."
+    if not get_admin_status():
+        abort(403)
+
+    profile = load_profile(app.instance_path, name)
+    if profile is None:
+        abort(404)
+    return profile
+
+@app.route("/admin-profiles/<name>.folded")
+def profile_folded(name: str):
+    "The stacks of a saved request profile, for flame graph tools."
+    if not get_admin_status():
+        abort(403)
+
+    profile = load_profile(app.instance_path, name)
+    if profile is None:
+        abort(404)
+    return Response(folded_stacks(profile), mimetype='text/plain')
+
 @app.route("/admin-categories/add")
 def category_add():
     "Render the add-category form."
@@ -384,7 +1147,7 @@ def admin_reset_test_db():
         flash('Error: Cannot remove the database because it is not a test database!')
     else:
         delete_test_db()
-        setup_app()
+        warm_up()
         flash('Successfully reset the test database!')
     return redirect(url_for('faq_page'))
 
@@ -424,6 +1187,7 @@ def category_add_post():
     new_cat = FAQCategory(category_name=category_name,
                           priority=priority)
     db.add_item(new_cat)
+    PAGE_CACHE.invalidate(CATEGORIES_TAG)
     flash(f'Category "{category_name}" added successfully!')
     return redirect(url_for('category_admin'))
 
@@ -487,6 +1251,11 @@ def category_edit_post(category_id: int):
                                admin=get_admin_status())
 
     db.update_category(category_id, new_name, priority)
+    # The category's name is in its entries' search documents.
+    if current_category['category_name'] != new_name:
+        update_search_indexes(db, [], [entry['id']
+                                       for entry in db.iter_faq_entries(category_id)])
+    PAGE_CACHE.invalidate(CATEGORIES_TAG)
     flash(f'Category updated to "{new_name}" successfully!')
     return redirect(url_for('category_admin'))
 
@@ -520,6 +1289,7 @@ def category_remove_post(category_id: int):
 
     success = db.remove_category(category_id)
     if success:
+        PAGE_CACHE.invalidate(CATEGORIES_TAG)
         flash(f'Category "{category_name}" removed successfully!')
         return redirect(url_for('category_admin'))
     # Category in use - cannot remove
@@ -593,9 +1363,18 @@ def remove_root():
 def admin_login_post():
     "Handles admin login form submission."
     db = get_db()
-    user_id = db.check_user_login(request.form['username'],
-                                  request.form['password'],
-                                  flask_bcrypt)
+    try:
+        user_id = check_login(db,
+                              request.form['username'],
+                              request.form['password'],
+                              flask_bcrypt,
+                              request.remote_addr or '')
+    except LoginThrottled:
+        flash('Login Error: Too many failed logins. Please try again later.')
+        return redirect(url_for('admin_login_post'))
+    except LoginBusy:
+        flash('Login Error: The server is busy. Please try again in a moment.')
+        return redirect(url_for('admin_login_post'))
 
     if not user_id:
         flash('Login Error: Invalid Username and/or Password')
@@ -661,12 +1440,14 @@ def faq_admin_add_post():
                          category_id = category_id,
                          author_id = session['user_id'],
                          priority = priority,
-                         timestamp = datetime.now())
+                         timestamp = datetime.now(),
+                         **render_faq_html(question_text, answer_text))
 
     faq_id = db.add_item(new_entry)
 
     # Incremental index update
-    add_faq_to_index(db, faq_id, app.instance_path)
+    related_ids = update_search_indexes(db, [faq_id])
+    invalidate_faq_pages(faq_id, related_ids, category_id)
     flash(f'FAQ entry #{faq_id} added successfully!')
 
     return redirect(url_for('faq_item_page', faq_id = faq_id))
@@ -715,16 +1496,22 @@ def faq_admin_edit_post(faq_id: int):
     def query(statement):
         return statement.where(FAQEntry.id == faq_id)
 
+    rendered = render_faq_html(question_text, answer_text)
+
     def update(item):
         item.question_text = question_text
         item.answer_text = answer_text
+        item.question_html = rendered['question_html']
+        item.answer_html = rendered['answer_html']
+        item.render_version = rendered['render_version']
         item.category_id = category_id
         item.priority = priority
         item.author_id = session['user_id']
         item.timestamp = datetime.now()
 
     db.update_item(query, update)
-    update_faq_in_index(db, faq_id, app.instance_path)
+    related_ids = update_search_indexes(db, [faq_id])
+    invalidate_faq_pages(faq_id, related_ids, category_id)
     flash(f'FAQ entry #{faq_id} updated successfully!')
 
     return redirect(url_for('faq_item_page', faq_id = faq_id))
@@ -739,13 +1526,45 @@ def faq_admin_remove_post(faq_id: int):
 
     if request.form['confirm'] and request.form['confirm'] == 'yes':
         db.remove_faq_entry(faq_id)
-        remove_faq_from_index(faq_id, app.instance_path)
+        related_ids = update_search_indexes(db, [faq_id])
+        invalidate_faq_pages(faq_id, related_ids)
         flash(f'FAQ entry #{faq_id} removed successfully!')
     else:
         flash(f'FAQ entry #{faq_id} removal canceled.')
 
     return redirect(url_for('faq_page'))
 
+@app.route("/api/admin/batch", methods=["POST"])
+def admin_batch_api():
+    """
+    Applies a batch of changes to the FAQ entries and categories, sent
+    as JSON (see vts/batch.py), in one database transaction and one
+    commit of each search index, and reports the result of each one.
+    """
+    if not get_admin_status():
+        abort(403)
+    # Note: Requiring JSON also keeps other sites from posting batches
+    # with a plain form, since a JSON post from them needs CORS.
+    if not request.is_json:
+        return {'error': 'The batch must be sent as application/json.'}, 415
+    try:
+        operations, atomic = parse_batch(request.get_json(silent=True))
+    except BatchError as error:
+        return {'error': str(error)}, 400
+
+    db = get_db()
+    batch = db.apply_batch(operations, session['user_id'], render_faq_html, atomic)
+    if batch['applied']:
+        changed_ids = [faq_id for faq_id, change in batch['faq'].items() if change != 'reordered']
+        related_ids = update_search_indexes(db, changed_ids, batch['reindex_ids'])
+        tags = [ALL_FAQ_TAG,
+                *[faq_tag(faq_id) for faq_id in [*batch['faq'], *related_ids]],
+                *[category_tag(category_id) for category_id in batch['category_ids']]]
+        if batch['categories']:
+            tags.append(CATEGORIES_TAG)
+        PAGE_CACHE.invalidate(*tags)
+    return {'applied': batch['applied'], 'results': batch['results']}
+
 # HTML and Application Errors
 
 @app.errorhandler(403)
@@ -768,6 +1587,26 @@ def page_not_found(error):
 
 # Style pages
 
+@app.route("/assets/<path:filename>")
+def built_asset(filename: str):
+    """
+    A built stylesheet or static file. Its name has the hash of its
+    content, so browsers can keep it forever. The precompressed
+    variant that the browser accepts is sent when there is one.
+    """
+    if filename == MANIFEST_FILE_NAME:
+        abort(404)
+    name, encoding = encoded_variant(app.instance_path, filename,
+                                     lambda encoding: request.accept_encodings[encoding] > 0)
+    response = send_from_directory(assets_path(app.instance_path), name,
+                                   mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=ASSET_MAX_AGE)
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.content_encoding = encoding
+    return response
+
 @app.route("/base.css")
 def base_css():
     "The base CSS file with variables and global styles."
@@ -844,22 +1683,116 @@ def chat():
 @app.route("/message", methods=["POST"])
 def message():
     "Calls the chatbot reply function, which returns a JSON result."
-    return reply_to_message()
+    # Note: The first message pays for importing openai, once per worker.
+    from vts.chat import reply_to_message
+    return reply_to_message(suggest_faq_entries)
+
+def suggest_faq_entries(text: str, limit: int) -> list[dict]:
+    "The FAQ entries that best match a chat message, for when the chatbot is too busy."
+    from vts.search import fetch_entries_by_ids
+    from vts.search import search_faq_ids
+    ids = search_faq_ids(text, app.instance_path, limit=limit)
+    return [{'question': entry['question_text'],
+             'url': url_for('faq_item_page', faq_id=entry['id'])}
+            for entry in fetch_entries_by_ids(get_db(), ids)]
+
+def chunked(parts: Iterable[str], size: int = API_CHUNK_SIZE) -> Iterator[str]:
+    "Joins every size parts into one chunk so that a stream isn't sent one line at a time."
+    chunk = []
+    for part in parts:
+        chunk.append(part)
+        if len(chunk) >= size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+def iter_faq_api_items(db: AppDatabase) -> Iterator[dict]:
+    "The FAQ entries as they appear in the JSON API, read as they are sent."
+    for entry in db.iter_faq_texts():
+        yield {'question' : entry['question_text'],
+               'answer'   : entry['answer_text']}
+
+def stream_json_list(items: Iterable) -> Iterator[str]:
+    "Streams a JSON list, sending its opening bracket before the first item is read."
+    yield '['
+    yield from chunked((',' if i else '') + app.json.dumps(item, separators=JSON_SEPARATORS)
+                       for i, item in enumerate(items))
+    yield ']\n'
 
 @app.route("/api.json")
 def json_faq_api():
-    "A JSON file that returns the FAQs as structured data for AI."
-    db = get_db()
-    return [{'question' : entry['question_text'],
-             'answer'   : entry['answer_text']}
-            for entry in db.faq_entries()]
+    """
+    A JSON file that returns the FAQs as structured data for AI. With
+    ?format=ndjson, it is one JSON object per line instead. Either way
+    it is streamed from the database, so the FAQ is never in memory as
+    a whole.
+    """
+    ndjson = request.args.get('format') == 'ndjson'
+
+    def render():
+        items = iter_faq_api_items(get_db())
+        if ndjson:
+            return Response(chunked(app.json.dumps(item, separators=JSON_SEPARATORS) + '\n'
+                                    for item in items),
+                            mimetype='application/x-ndjson')
+        return Response(stream_json_list(items), mimetype='application/json')
+
+    return conditional(render)
+
+def parse_changes_cursor(cursor: str) -> tuple[int, int]:
+    "Turns a change feed cursor into the content version and the FAQ ID that it is after."
+    if not cursor:
+        return 0, 0
+    try:
+        version, faq_id = cursor.split('-')
+        return int(version), int(faq_id)
+    except ValueError:
+        return abort(400)
+
+def faq_changes(db: AppDatabase, since: str, limit: int) -> dict:
+    """
+    The changes to the FAQ after the cursor since, the cursor to ask
+    for the next ones with, and whether there are more of them.
+    """
+    version, faq_id = parse_changes_cursor(since)
+    rows = db.faq_changes(version, faq_id, limit + 1)
+    changes = []
+    for row in rows[:limit]:
+        change = {'id': row['id'],
+                  'removed': row['is_removed'],
+                  'timestamp': row['timestamp'].isoformat() if row['timestamp'] else None}
+        if not row['is_removed']:
+            change.update({'question': row['question_text'],
+                           'answer': row['answer_text'],
+                           'category_id': row['category_id']})
+        changes.append(change)
+        since = f"{row['change_version']}-{row['id']}"
+    return {'changes': changes,
+            'cursor': since or '0-0',
+            'more': len(rows) > limit}
+
+@app.route("/api/changes")
+def faq_changes_api():
+    """
+    The FAQ entries that were added, edited, or removed after the
+    cursor in ?since=, oldest change first, so that consumers of the
+    FAQ dumps can stay in sync without downloading all of it again.
+    Without a cursor, every entry is a change. The returned cursor is
+    the ?since= of the next request, which can be made right away
+    while more is true.
+    """
+    since = request.args.get('since', '')
+    limit = min(max(request.args.get('limit', CHANGES_LIMIT, type=int), 1), MAX_CHANGES_LIMIT)
+    return conditional(lambda: app.json.response(faq_changes(get_db(), since, limit)))
 
 @app.route("/api.txt")
 def text_faq_api():
-    "A TXT file that returns the FAQs all in one file for AI."
-    db = get_db()
-    faq_text = ''.join(['Question:\n' + entry['question_text'] + '\n\n'
-                        + 'Answer:\n' + entry['answer_text'] + '\n---\n\n'
-                        for entry in db.faq_entries()])
-    return Response(response='---\n\n' + faq_text,
-                    mimetype='text/plain')
+    "A TXT file that returns the FAQs all in one file for AI, streamed from the database."
+    def stream_text():
+        yield '---\n\n'
+        yield from chunked('Question:\n' + entry['question_text'] + '\n\n'
+                           + 'Answer:\n' + entry['answer_text'] + '\n---\n\n'
+                           for entry in get_db().iter_faq_texts())
+
+    return conditional(lambda: Response(stream_text(), mimetype='text/plain'))